@@ -378,6 +378,12 @@ async function initializeAvatarSession() {
         } else if (message.type === "warning") {
           
           console.warn("Warning from backend:", message.message);
+        } else if (message.type === "busy") {
+          // Backend is shedding load: this turn (or the whole session) was not admitted
+          console.warn("Backend busy:", message.message);
+          if (recordingStatus) {
+            recordingStatus.textContent = message.message;
+          }
         } else if (message.type === "transcript") {
          
           if (recordingStatus) {
@@ -397,7 +403,8 @@ async function initializeAvatarSession() {
                
                 console.log("HeyGen avatar interrupted by backend HALT command.");
             }
-            // Add the halted response IDs to the local set to prevent playing their audio later
+            // Add the halted response IDs to the local set to prevent playing their audio later.
+            // The backend only sends ids halted since its previous halt message, so accumulate them here.
             if (message.halted_response_ids && Array.isArray(message.halted_response_ids)) {
             
               message.halted_response_ids.forEach((id: string) => haltedResponseIds.add(id));
@@ -1,60 +1,44 @@
 import asyncio
 import aiohttp
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect,Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse, Response
 import os
 from dotenv import load_dotenv
-from .state_machine import VoiceBotState
-from .services.deepgram_service import DeepgramService
-from .services.llm_service import LLMService
+from .state_machine import VoiceBotState, StateMachineActor
+from .services.deepgram_service import DeepgramService, deepgram_pool, stt_reconnect_stats
+from .services.deepgram_pool import DEEPGRAM_POOL_ENABLED
+from .services.audio_queue import AudioSendQueue, get_audio_queue_stats, get_audio_queue_session_stats
+from .services.outbound import OutboundWriter
+from .services.llm_service import get_llm_service, get_llm_deployment_stats, UnavailableLLMService
+from .services.http_client import http_clients
+from .services.nifi_service import NiFiService, get_nifi_stats
+from .services.nifi_batcher import batch_stats as nifi_batch_stats
+from .services.circuit_breaker import CircuitOpenError
+from .services.segmenter import create_segmenter
+from .services.response_cache import response_cache, RESPONSE_CACHE_ENABLED
+from .services.conversation import ConversationMemory, CONVERSATION_MEMORY_ENABLED
+from .services.tracing import TurnTrace, stage_latency
+from .services.turn_tasks import TurnTaskGroup, HaltedIds, record_cancelled_turn, record_completed_turn
+from .services.metrics import registry
+from .services.admission import session_limiter, OverloadedError, get_admission_stats
+from .services.logging_pipeline import configure_logging
+from .services.warmup import warmup
+from .services.static_assets import StaticBundle
+from .services.recording import SessionRecorder, RecordingNiFi, RecordingLLM, open_recorder, AUDIO, CONTROL
+from .services.speculation import Speculation, SPECULATION_PREFETCH_LLM, get_speculation_stats
 from datetime import datetime
 import json
 import time  # Import time for precise timing
 import logging  # Import the logging module
-from logging.handlers import RotatingFileHandler # Import RotatingFileHandler
 load_dotenv()
 
 #################################################################################################################################
 # --- Configure Logging ---
 LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
-os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, "backend.log")
 
-# Define log file size and number of backups (example for RotatingFileHandler)
-MAX_LOG_BYTES = 5 * 1024 * 1024 # 5 MB
-BACKUP_COUNT = 5                # Keep 5 backup log files
-
-# Create a formatter
-log_formatter = logging.Formatter(
-    '%(asctime)s.%(msecs)03d - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-# Create file handler
-file_handler = RotatingFileHandler(
-    LOG_FILE,
-    maxBytes=MAX_LOG_BYTES,
-    backupCount=BACKUP_COUNT
-)
-file_handler.setFormatter(log_formatter)
-file_handler.setLevel(logging.INFO) # Set level for file handler
-
-# Create console handler
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-console_handler.setLevel(logging.INFO) # Set level for console handler
-
-# Get the root logger
-root_logger = logging.getLogger()
-root_logger.setLevel(logging.INFO) # Set the overall minimum level for the root logger
-
-# Add handlers to the root logger
-# Clear existing handlers if any from previous basicConfig calls (e.g., in testing)
-if root_logger.hasHandlers():
-    root_logger.handlers.clear()
-root_logger.addHandler(file_handler)
-root_logger.addHandler(console_handler)
+# Handlers (rotating file + console) run on a background listener thread; see services/logging_pipeline.py
+log_listener = configure_logging(LOG_FILE)
 
 # Get a specific logger for this module (main.py)
 logger = logging.getLogger(__name__)
@@ -71,97 +55,205 @@ app = FastAPI()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # This is /project_root/backend/app
 # Go up two levels to /project_root, then into 'Heygen-Video-Generator', then into 'dist'
 FRONTEND_DIR = os.path.join(BASE_DIR, "..", "..", "Heygen-Video-Generator", "dist")
-app.mount("/static", StaticFiles(directory=FRONTEND_DIR), name="static")
+# Loaded into memory (with gzip/brotli variants) on startup; served by get_static / get_root below
+static_bundle = StaticBundle(FRONTEND_DIR)
 
 #########################################################################################################################################
 from .types import Event, EventType
 import uuid
-NIFI_URL = os.getenv("NIFI_URL") # Default to localhost if not set
+_STREAM_END = object() # Sentinel queued after the last LLM token
+
+def _session_llm_service():
+    # The shared client is built on startup; with a missing or invalid Azure config each turn reports the error instead
+    try:
+        return get_llm_service()
+    except ValueError as e:
+        return UnavailableLLMService(e)
+
 # --- In-memory session management (for simplicity) ---
 class SessionManager:
-    def __init__(self, client_websocket: WebSocket):
+    def __init__(self, client_websocket: WebSocket, recorder: SessionRecorder | None = None):
         self.current_state: VoiceBotState = VoiceBotState.IDLE
         self.deepgram_service: DeepgramService | None = None
         self.client_websocket = client_websocket
-        self.to_halt_ids = set()
+        # Every frame to the browser goes through this queue and its single writer task
+        self.outbound = OutboundWriter(client_websocket)
+        self.halted_ids = HaltedIds()
         self.curr_response_id = None
-        # Add a dictionary to store timestamps for latency calculations
-        self.latency_timestamps = {} # Key: response_id or a custom event ID, Value: time.perf_counter() timestamp
+        # Latency marks for the current turn; replaced on every new response_id
+        self.trace: TurnTrace | None = None
+        self.nifi_service = NiFiService(session=http_clients.nifi.session)
+        self.llm_service = _session_llm_service()
+        self.audio_queue: AudioSendQueue | None = None
+        # Tasks doing upstream work for the current turn; cancelled together on barge-in
+        self.turn_tasks = TurnTaskGroup()
+        # Upstream work started early from a stable interim transcript (see services/speculation.py)
+        self.speculation: Speculation | None = None
+        # Every state transition runs on this session's single event consumer (see state_machine.py)
+        self.events = StateMachineActor(self)
+        # Earlier exchanges of this call, fitted into the LLM prompt under a token budget
+        self.memory: ConversationMemory | None = ConversationMemory() if CONVERSATION_MEMORY_ENABLED else None
+        # Opt-in capture for loadtest/replay.py; upstream calls are recorded by wrapping the services
+        self.recorder = recorder
+        if recorder is not None:
+            self.nifi_service = RecordingNiFi(self.nifi_service, recorder)
+            self.llm_service = RecordingLLM(self.llm_service, recorder)
+
+    def start_speculation(self, transcript: str):
+        """Called by DeepgramService once an interim transcript has been stable for the configured window."""
+        if self.current_state != VoiceBotState.LISTENING or not transcript:
+            return
+        if self.speculation is not None:
+            if self.speculation.matches(transcript):
+                return
+            self.speculation.cancel()
+        llm = self.llm_service if SPECULATION_PREFETCH_LLM else None
+        self.speculation = Speculation(transcript, self.nifi_service, llm, self._prompt_messages)
+        logger.info("Speculative prefetch started for response_id: %s", self.curr_response_id, extra={"category": "turn"})
+
+    def _take_speculation(self, transcript: str) -> Speculation | None:
+        """Commit the pending speculation if it matches the final transcript, otherwise cancel it."""
+        speculation, self.speculation = self.speculation, None
+        if speculation is None:
+            return None
+        if speculation.matches(transcript):
+            speculation.commit()
+            logger.info("Speculative prefetch hit for response_id: %s", self.curr_response_id, extra={"category": "turn"})
+            return speculation
+        speculation.cancel()
+        return None
+
+    def cancel_speculation(self):
+        if self.speculation is not None:
+            self.speculation.cancel(miss=False)
+            self.speculation = None
+
     async def respond(self, data: dict):
-        # Retrieve timestamp for NIFI request start
-        timestamp_start_nifi_call = time.perf_counter() # This marks the start of the NIFI call
-        self.latency_timestamps[f"nifi_call_start_{self.curr_response_id}"] = timestamp_start_nifi_call
+        # Hold on to this turn's trace; a barge-in replaces self.trace while we are still running
+        trace = self.trace or TurnTrace(self.curr_response_id)
+        sent_chunks = [] # What the avatar was given to speak, for the conversation history
+        try:
+            await self._respond_turn(data, trace, sent_chunks)
+        except asyncio.CancelledError:
+            # Barge-in: on_turn_started cancelled this turn and already moved on, so don't complete it
+            logger.info("Turn cancelled for response_id: %s", trace.response_id, extra={"category": "turn"})
+            self._remember(data["transcript"], sent_chunks, interrupted=True)
+            raise
+        self._remember(data["transcript"], sent_chunks, interrupted=not self._is_current_turn(trace))
+        self.handle_event(Event(type=EventType.RESPONSE_COMPLETED, data={"response_id": trace.response_id}))
+
+    def _remember(self, transcript: str, sent_chunks: list[str], interrupted: bool):
+        if self.memory is not None and sent_chunks:
+            self.memory.add_exchange(transcript, " ".join(sent_chunks), interrupted)
+
+    def _prompt_messages(self, nifi_messages: list[dict]) -> list[dict]:
+        return self.memory.build_messages(nifi_messages) if self.memory is not None else nifi_messages
+
+    def _is_current_turn(self, trace: TurnTrace) -> bool:
+        """False once the user barged in; frames for halted response ids must not be sent."""
+        return self.current_state == VoiceBotState.RESPONDING and trace.response_id == self.curr_response_id
+
+    async def _respond_turn(self, data: dict, trace: TurnTrace, sent_chunks: list[str]):
+        trace.mark("nifi_start")
       #  logger.info(f"SessionManager.respond called with data: {data}. NIFI call initiated for response_id: {self.curr_response_id}")
 
-        body = json.dumps({"chatInput": data["transcript"]})
-       # logger.info(f"Sending request to NIFI_URL: {NIFI_URL} with body: {body}")
+        transcript = data["transcript"]
+        cached = response_cache.get(transcript) if RESPONSE_CACHE_ENABLED else None
+        cache_generation = response_cache.generation
+        # Finished answers are shared by every session, so only those written without any conversation history
+        share_answer = self.memory is None or len(self.memory) == 0
+        if cached is not None:
+            self.cancel_speculation() # The cache already has what the speculation would fetch
+            speculation = None
+        else:
+            speculation = self._take_speculation(transcript)
         
-        if self.client_websocket:
-            # Make the HTTP POST request to your image-query endpoint
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(NIFI_URL,
-                        headers={"Content-Type": "application/json"},
-                        data=body
-                    ) as response:
-                        response.raise_for_status()  # Raise an exception for bad status codes
-                        #query_result_dict = await response.json()
-                         # --- FIX START: Indentation corrected for the following block ---
-                        raw_response_text = await response.text() # Read as plain text
-                    
-                        # Optional: Log the received content type and raw text for debugging
-                        logger.info(f"NIFI Raw Response (Content-Type: {response.headers.get('Content-Type', 'N/A')}): {raw_response_text[:500]}...") # Log first 500 chars
-
-                        try:
-                        # Attempt to parse the raw text as JSON
-                           query_result_dict = json.loads(raw_response_text)
-                        #   logger.info(f"nifi_response_dict: {query_result_dict}") # Log the parsed JSON
-                        except json.JSONDecodeError as json_e:
-                           logger.error(f"Failed to parse NIFI response as JSON: {json_e}. Raw text: {raw_response_text}", exc_info=True)
-                           await self.client_websocket.send_json({
+        try:
+            if self.client_websocket:
+                # Make the HTTP POST request to your image-query endpoint
+                try:
+                    if cached is not None and cached.chunks is not None and share_answer:
+                        # Repeated question: replay the finished answer without touching NiFi or the LLM
+                        trace.mark("nifi_end")
+                        logger.info("Response cache hit; replaying %d chunks for response_id: %s", len(cached.chunks), trace.response_id, extra={"category": "turn"})
+                        for llm_response_chunk in cached.chunks:
+                            if not self._is_current_turn(trace):
+                                break
+                            self.outbound.send({
+                                "type": "llm_response",
+                                "text": llm_response_chunk,
+                                "response_id": trace.response_id
+                            })
+                            trace.mark("first_chunk_sent")
+                            sent_chunks.append(llm_response_chunk)
+                        return
+                    try:
+                        if cached is not None:
+                            query_result_dict = cached.messages
+                        elif speculation is not None:
+                            query_result_dict = await speculation.nifi_result()
+                        else:
+                            query_result_dict = await self.nifi_service.fetch_messages(transcript)
+                    except json.JSONDecodeError as json_e:
+                        self.outbound.send({
                             "type": "error",
                             "message": f"Backend Error: NIFI response was not valid JSON. Details: {json_e}"
                         })
-                           return # Stop processing if JSON parsing fails
-                    # --- FIX END ---
-                    timestamp_end_nifi_call = time.perf_counter() # Record end time for NIFI latency
-                    nifi_latency = (timestamp_end_nifi_call - timestamp_start_nifi_call) * 1000 # Latency in milliseconds
-                    logger.info(f"NIFI service response received. Latency: {nifi_latency:.2f}ms for response_id: {self.curr_response_id}") #2
-                    self.latency_timestamps[f"nifi_call_end_{self.curr_response_id}"] = timestamp_end_nifi_call
-                        
-                        # Calculate total backend processing latency if response_id start is available
-                    full_backend_start_time = self.latency_timestamps.get(f"overall_backend_start_{self.curr_response_id}")
-                    if full_backend_start_time:
-                            overall_backend_latency = (timestamp_end_nifi_call - full_backend_start_time) * 1000
-                            logger.info(f"Overall backend processing latency (initial audio to LLM response sent): {overall_backend_latency:.2f}ms for response_id: {self.curr_response_id}") #3
-                            self.latency_timestamps.pop(f"overall_backend_start_{self.curr_response_id}", None) # Clean up
-                 # --- This part is exactly right for the NIFI output structure ---
-                llm_message = query_result_dict # query_result_dict IS the {"messages": [...]} structure
+                        return # Stop processing if JSON parsing fails
+                    trace.mark("nifi_end")
+                    logger.info("NIFI service response received. Latency: %.2fms for response_id: %s", trace.elapsed_ms('nifi_start', 'nifi_end'), trace.response_id, extra={"category": "turn"}) #2
+                    if RESPONSE_CACHE_ENABLED and cached is None and not query_result_dict.get("fallback"):
+                        response_cache.put_messages(transcript, query_result_dict, cache_generation)
+                     # --- This part is exactly right for the NIFI output structure ---
+                    llm_message = query_result_dict # query_result_dict IS the {"messages": [...]} structure
             
                 
-                async for llm_response_chunk in self._call_llm(llm_message):
-                   await self.client_websocket.send_json({
-                   "type": "llm_response",
-                   "text": llm_response_chunk,
-                   "response_id": self.curr_response_id
-            })
-                       # logger.info(f"Sent llm_response to frontend for response_id: {self.curr_response_id}")
-            except aiohttp.ClientError as e:
-                error_msg = f"Error calling query service: {e}"
-                logger.error(error_msg, exc_info=True) # Log exception info
-                await self.client_websocket.send_json({
-                    "type": "error",
-                    "message": f"Error processing  query: {e}"
-                })
-            except Exception as e:
-                error_msg = f"An unexpected error occurred in respond: {e}"
-                logger.error(error_msg, exc_info=True) # Log exception info
-                await self.client_websocket.send_json({
-                    "type": "error",
-                    "message": f"An unexpected error occurred: {e}"
+                    token_stream = speculation.token_stream() if speculation is not None and speculation.has_llm_stream else None
+                    async for llm_response_chunk in self._call_llm(llm_message, token_stream, trace):
+                       if not self._is_current_turn(trace):
+                           break
+                       self.outbound.send({
+                       "type": "llm_response",
+                       "text": llm_response_chunk,
+                       "response_id": trace.response_id
                 })
-        await self.handle_event(event=Event(type=EventType.RESPONSE_COMPLETED, data={}))
-       # logger.info("Handle_event called for RESPONSE_COMPLETED.")
+                       trace.mark("first_chunk_sent")
+                       sent_chunks.append(llm_response_chunk)
+                           # logger.info(f"Sent llm_response to frontend for response_id: {self.curr_response_id}")
+                    # Only answers that streamed to the end without a barge-in are worth replaying
+                    if RESPONSE_CACHE_ENABLED and share_answer and sent_chunks and self._is_current_turn(trace) and not query_result_dict.get("fallback"):
+                        response_cache.put_chunks(transcript, sent_chunks, cache_generation)
+                except OverloadedError as e:
+                    # Shed this turn rather than queue it behind everyone else; the session stays open
+                    self.outbound.send({
+                        "type": "busy",
+                        "message": "The assistant is busy right now. Please try again in a moment.",
+                        "response_id": trace.response_id
+                    })
+                except CircuitOpenError as e:
+                    # NiFi has been failing; don't make the user wait for another timeout
+                    logger.warning("Skipping turn: %s", e)
+                    self.outbound.send({
+                        "type": "error",
+                        "message": "The knowledge service is temporarily unavailable. Please try again shortly.",
+                        "response_id": trace.response_id
+                    })
+                except aiohttp.ClientError as e:
+                    logger.error("Error calling query service: %s", e, exc_info=True) # Log exception info
+                    self.outbound.send({
+                        "type": "error",
+                        "message": f"Error processing  query: {e}"
+                    })
+                except Exception as e:
+                    logger.error("An unexpected error occurred in respond: %s", e, exc_info=True) # Log exception info
+                    self.outbound.send({
+                        "type": "error",
+                        "message": f"An unexpected error occurred: {e}"
+                    })
+        finally:
+            if speculation is not None:
+                # Cancelled or failed before its token stream was drained: stop the prefetch nobody will read
+                speculation.close()
 
 
     
@@ -176,60 +268,57 @@ class SessionManager:
                 "timestamp": datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
                 "response_id": self.curr_response_id
             }
-            await self.client_websocket.send_json(json)
+            self.outbound.send(json)
          #   logger.info(f"Sent final transcript to frontend: '{data['transcript']}' for response_id: {self.curr_response_id}")
             
-            # Measure latency from final transcript to NIFI request (this will happen immediately after)
-            if self.latency_timestamps.get(f"deepgram_final_transcript_time_{self.curr_response_id}"):
-                final_transcript_time = self.latency_timestamps.pop(f"deepgram_final_transcript_time_{self.curr_response_id}")
-                time_to_nifi_request = (time.perf_counter() - final_transcript_time) * 1000
-                logger.info(f"Latency (Deepgram final transcript to NIFI request initiation): {time_to_nifi_request:.2f}ms for response_id: {self.curr_response_id}") #4
-                
-            
-    async def handle_event(self, event: Event):        
-        #logger.info(f"SessionManager.handle_event received event type: {event.type.name}, current state: {self.current_state.name}")
-
-        if event.type == EventType.INTERRUPTION_STARTED and self.current_state != VoiceBotState.LISTENING:
-            self.current_state = VoiceBotState.LISTENING
-          
-            if self.curr_response_id:
-                await self.client_websocket.send_json(data={
-                    'type': "halt",
-                    'text': None,
-                    'response_id': self.curr_response_id,
-                    "halted_response_ids": list(self.to_halt_ids)
-                })
-            _uuid = str(uuid.uuid4())
-            self.curr_response_id = _uuid
-            self.to_halt_ids.add(_uuid)
-            logger.info(f"New curr_response_id generated: {_uuid}. Added to halted_ids.")
-
-            self.latency_timestamps[f"overall_backend_start_{self.curr_response_id}"] = time.perf_counter()
-           # logger.info(f"Marked overall_backend_start for response_id: {self.curr_response_id}")
-            logger.info(f"[handle_event] Marked overall_backend_start for response_id: {self.curr_response_id}")
-
-            # --- Important: This is where Deepgram audio send start should be marked! ---
-            # It's crucial this happens *after* curr_response_id is set
-            self.latency_timestamps[f"deepgram_audio_send_start_{self.curr_response_id}"] = time.perf_counter()
-            logger.info(f"[handle_event] Marked deepgram_audio_send_start for response_id: {self.curr_response_id}")
-            
-        elif self.current_state == VoiceBotState.LISTENING and event.type == EventType.INTERRUPTION_ENDED:
-            self.current_state = VoiceBotState.RESPONDING
-           
-            asyncio.create_task(self.respond_user_message_interpretation(event.data))
-            asyncio.create_task(self.respond(event.data))
-            # await self.respond_user_message_interpretation(event.data)
-            # await self.respond(event.data)
-        elif self.current_state == VoiceBotState.RESPONDING and event.type == EventType.RESPONSE_COMPLETED:
-            self.current_state = VoiceBotState.IDLE
-          
-            if self.curr_response_id:
-                self.to_halt_ids.discard(self.curr_response_id)
-                logger.info(f"Discarded {self.curr_response_id} from halted_ids. Remaining: {self.to_halt_ids}")
-            self.curr_response_id = None
-            keys_to_remove = [k for k in self.latency_timestamps if k.endswith(self.curr_response_id)]
-            for k in keys_to_remove:
-                self.latency_timestamps.pop(k, None)
+    def handle_event(self, event: Event):
+        """Queue an event for this session's state machine; transitions run in order on self.events."""
+        self.events.post(event)
+
+    async def on_turn_started(self, event: Event):
+        # IDLE/RESPONDING -> LISTENING: the user started talking, possibly over the bot
+        self.cancel_speculation() # Anything left over belongs to the previous utterance
+        if self.turn_tasks.active:
+            # Barge-in: abort the in-flight NiFi request / LLM stream instead of letting them finish
+            interrupted_trace = self.trace
+            await self.turn_tasks.cancel()
+            record_cancelled_turn(interrupted_trace)
+
+        if self.curr_response_id:
+            self.halted_ids.add(self.curr_response_id)
+            self.outbound.send({
+                'type': "halt",
+                'text': None,
+                'response_id': self.curr_response_id,
+                "halted_response_ids": self.halted_ids.take_unsent() # Only ids the client has not seen yet
+            })
+        if self.trace is not None:
+            self.trace.finish("interrupted") # Barge-in before the previous turn completed
+        _uuid = str(uuid.uuid4())
+        self.curr_response_id = _uuid
+        self.trace = TurnTrace(_uuid)
+        if event.data.get("first_transcript_at") is not None:
+            self.trace.mark("stt_first_interim", at=event.data["first_transcript_at"])
+        logger.info("New curr_response_id generated: %s", _uuid, extra={"category": "turn"})
+
+    async def on_turn_ended(self, event: Event):
+        # LISTENING -> RESPONDING: the user's turn is complete
+        if self.trace is not None and event.data.get("stt_final_at") is not None:
+            self.trace.mark("stt_final", at=event.data["stt_final_at"])
+        self.turn_tasks.spawn(self.respond_user_message_interpretation(event.data))
+        self.turn_tasks.spawn(self.respond(event.data))
+
+    def is_current_response(self, event: Event) -> bool:
+        # Completion of a turn that was already halted must not end the new one
+        return event.data.get("response_id", self.curr_response_id) == self.curr_response_id
+
+    async def on_response_completed(self, event: Event):
+        # RESPONDING -> IDLE
+        if self.trace is not None:
+            record_completed_turn(self.trace)
+            self.trace.finish("completed")
+            self.trace = None
+        self.curr_response_id = None
 
     async def set_state(self, new_state: VoiceBotState, data: str | None = None):
         self.current_state = new_state
@@ -237,79 +326,168 @@ class SessionManager:
     def get_current_bot_state(self): # Add this method
         return self.current_state
 
-    async def _call_llm(self, message):
-        from .services.llm_service import LLMService
-        llm = LLMService()
-        messages = message["messages"]
-        curr_str = str()
-        generator = llm.get_response_stream(messages)
-        async for item in generator:
-            if self.current_state != VoiceBotState.RESPONDING:
-                await generator.aclose()
-                return
-            else:
-                curr_str += item
-                if any(char in curr_str for char in [".", "!", "?"]):
-                    resp = curr_str
-                    curr_str = str()
-                    yield resp
+    async def _call_llm(self, message, token_stream=None, trace: TurnTrace | None = None):
+        stream_info = {} # finish_reason / usage reported by the LLM stream
+        if token_stream is not None:
+            # Committed speculation: replay the buffered tokens, then follow the live stream
+            generator = token_stream
+        else:
+            messages = self._prompt_messages(message["messages"])
+            generator = self.llm_service.get_response_stream(messages, metadata=stream_info)
+        # Tokens are pumped into a queue so the segmenter can flush on a timeout between tokens
+        segmenter = create_segmenter()
+        tokens: asyncio.Queue = asyncio.Queue()
+        pump = asyncio.create_task(self._pump_tokens(generator, tokens))
+        try:
+            while True:
+                if tokens.empty() and segmenter.time_until_flush() is not None:
+                    try:
+                        item = await asyncio.wait_for(tokens.get(), segmenter.time_until_flush())
+                    except asyncio.TimeoutError:
+                        chunk = segmenter.poll()
+                        if chunk:
+                            yield chunk
+                        continue
+                else:
+                    item = await tokens.get()
+                if item is _STREAM_END:
+                    break
+                if self.current_state != VoiceBotState.RESPONDING:
+                    return
+                if trace is not None:
+                    trace.mark("llm_first_token")
+                    trace.llm_tokens += 1
+                for chunk in segmenter.feed(item):
+                    yield chunk
+            await pump # Re-raise upstream errors from the LLM stream
+            if stream_info.get("finish_reason") not in (None, "stop"):
+                # Truncated (length) or filtered (content_filter) answers are still spoken, but worth knowing about
+                logger.warning("LLM stream ended with finish_reason=%s", stream_info["finish_reason"])
+            chunk = segmenter.flush()
+            if chunk:
+                yield chunk
+        finally:
+            if not pump.done():
+                pump.cancel() # Closes the LLM stream and its HTTP response
+
+    @staticmethod
+    async def _pump_tokens(generator, tokens: asyncio.Queue):
+        try:
+            async for item in generator:
+                tokens.put_nowait(item)
+        finally:
+            tokens.put_nowait(_STREAM_END)
 
 
 @app.on_event("startup")
 async def startup_event():
- 
-    # Check Azure OpenAI connection
+    # Open the shared, keep-alive connection pools before any session needs them
+    await http_clients.start()
     try:
-        from .services.llm_service import LLMService
-        llm = LLMService()
- 
-        headers = {
-            "api-key": llm.api_key,
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "messages": [{"role": "user", "content": "ping"}],
-            "temperature": 0,
-            "stream": False
-        }
- 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(llm.api_url, headers=headers, json=payload) as resp:
-                if resp.status != 200:
-                    raise Exception(f"Azure OpenAI API call failed: {resp.status}, {await resp.text()}")
-                data = await resp.json()
-                if "choices" not in data or len(data["choices"]) == 0:
-                    raise Exception("Azure OpenAI response did not contain choices.")
-                print("Azure OpenAI connection successful.")
-    except Exception as e:
-        print(f"Could not connect to Azure OpenAI on startup: {e}. Please check your credentials and endpoint.")
+        get_llm_service() # Built once here, bound to the pooled LLM session
+    except ValueError as e:
+        logger.error("LLM service unavailable: %s; turns will fail until it is configured", e) # /readyz reports it too
+    await asyncio.to_thread(static_bundle.load) # Compression is CPU work; keep it off the loop
+    if DEEPGRAM_POOL_ENABLED:
+        deepgram_pool.start() # Pre-opens Deepgram live connections in the background
+    # Upstream TLS warm-up runs in the background and is reported by /readyz; no completion is spent on boot
+    if DEEPGRAM_POOL_ENABLED:
+        warmup.add("deepgram", deepgram_pool.wait_until_warm)
+    warmup.add("llm", _warm_up_llm)
+    warmup.add("nifi", NiFiService(session=http_clients.nifi.session).warm_up)
+    warmup.start()
+
+async def _warm_up_llm() -> str:
+    return await get_llm_service().warm_up() # Raises if the Azure config is missing
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await warmup.close()
+    await deepgram_pool.close()
+    await http_clients.close()
+    log_listener.stop() # Flushes whatever is still queued
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the event loop is serving requests
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: every upstream answered its warm-up probe; 503 until then so the LB holds traffic back
+    status = warmup.get_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition of per-stage latency histograms and process counters
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def get_stats():
+    # Process-local counters for capacity planning (connection reuse vs. new connections, etc.)
+    return {
+        "http_pool": http_clients.get_stats(),
+        "speculation": get_speculation_stats(),
+        "response_cache": response_cache.get_stats(),
+        "deepgram_pool": deepgram_pool.get_stats(),
+        "admission": get_admission_stats(),
+        "llm_deployments": get_llm_deployment_stats(),
+        "nifi": get_nifi_stats(),
+        "nifi_batch": nifi_batch_stats,
+        "stt_reconnect": stt_reconnect_stats,
+        "audio_queue": {**get_audio_queue_stats(), "per_session": get_audio_queue_session_stats()},
+    }
+
+@app.post("/cache/invalidate")
+async def invalidate_response_cache():
+    # Call after the NiFi knowledge base changes so stale answers are not replayed
+    removed = response_cache.invalidate()
+    return {"invalidated": removed, "generation": response_cache.generation}
     
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def get_static(path: str, request: Request):
+    response = static_bundle.response(path, request.headers, head=request.method == "HEAD")
+    return response if response is not None else Response(status_code=404)
+
 @app.get("/", response_class=HTMLResponse)
-async def get_root():
+async def get_root(request: Request):
     # Serve the frontend HTML
    # logger.info("Root endpoint '/' accessed.")
-    html_file_path = os.path.join(FRONTEND_DIR, "index.html")
-    if os.path.exists(html_file_path):
-        with open(html_file_path, "r") as f:
-            return HTMLResponse(content=f.read())
-    logger.error(f"Frontend index.html not found at: {html_file_path}") # This is an error if it's supposed to be there
+    response = static_bundle.response("index.html", request.headers)
+    if response is not None:
+        return response
+    logger.error(f"Frontend index.html not found in: {FRONTEND_DIR}") # This is an error if it's supposed to be there
    
     return HTMLResponse("<h1>Frontend not found</h1>")
 
-async def websocket_message_sender(websocket: WebSocket, message: dict):
-    """Helper to send messages to client websocket."""
-    await websocket.send_json(message)
-
 @app.websocket("/ws/voice")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    session = SessionManager(client_websocket=websocket)
+    try:
+        await session_limiter.acquire()
+    except OverloadedError:
+        await websocket.send_json({"type": "busy", "message": "Too many active sessions. Please try again shortly."})
+        await websocket.close(code=1013) # Try Again Later
+        return
+    try:
+        await _run_session(websocket)
+    finally:
+        session_limiter.release()
+
+async def _run_session(websocket: WebSocket):
+    session = SessionManager(client_websocket=websocket, recorder=open_recorder())
    # logger.info("WebSocket accepted.")
     # Initialize Deepgram service for this connection
     session.deepgram_service = DeepgramService(
         session_manager=session
     )
     session.deepgram_service.set_state_setter(session.set_state)
+    # Audio is queued and written to Deepgram by a sender task so a slow upstream never stalls this loop
+    session.audio_queue = AudioSendQueue(session.deepgram_service.send_audio)
+    session.audio_queue.start()
+    session.outbound.start()
+    session.events.start()
 
     try:
         # Initial state update to client
@@ -318,71 +496,82 @@ async def websocket_endpoint(websocket: WebSocket):
         
         # Attempt to connect to Deepgram
         if not await session.deepgram_service.connect():
-            await websocket.send_json({"type": "error", "message": "Could not connect to STT service."})
+            session.outbound.send({"type": "error", "message": "Could not connect to STT service."})
             # Keep WebSocket open but STT won't work
         else:
             deepgram_connect_end = time.perf_counter()
             deepgram_connect_latency = (deepgram_connect_end - deepgram_connect_start) * 1000
-            logger.info(f"Deepgram connection successful. Latency: {deepgram_connect_latency:.2f}ms. Ready to listen.") #5
-            await websocket.send_json({"type": "info", "message": "Connected to STT. Ready to listen."})
-
+            stage_latency.observe(deepgram_connect_latency, "stt_connect")
+            logger.info("Deepgram connection successful. Latency: %.2fms. Ready to listen.", deepgram_connect_latency) #5
+            session.outbound.send({"type": "info", "message": "Connected to STT. Ready to listen."})
 
+        stt_warning_sent = False
         while True:
             data = await websocket.receive()
+            if data["type"] == "websocket.disconnect":
+                # Client left, or the outbound writer closed a slow consumer; a second receive() would raise
+                raise WebSocketDisconnect(data.get("code", 1000))
             
             if "bytes" in data:
                 audio_chunk = data["bytes"]
+                if session.recorder is not None:
+                    session.recorder.record(AUDIO, audio_chunk)
                 # print(f"Received audio chunk of size: {len(audio_chunk)}")
-                if session.deepgram_service and session.deepgram_service.dg_connection:
+                if session.deepgram_service:
                     # Event: Deepgram powered -> transcript not null + is_final = False (interruption_started)
                     # This is implicitly handled by Deepgram SDK callbacks now which will set state
                     if session.current_state == VoiceBotState.IDLE:
                         pass
                         # asyncio.create_task(session.handle_event())
                         # await session.set_state(VoiceBotState.LISTENING) # Explicitly move to listening on first audio
-                    if session.curr_response_id and f"deepgram_audio_send_start_{session.curr_response_id}" not in session.latency_timestamps:
-                        session.latency_timestamps[f"deepgram_audio_send_start_{session.curr_response_id}"] = time.perf_counter()
-                        logger.info(f"Marked deepgram_audio_send_start for response_id: {session.curr_response_id}")
-                   
-                    await session.deepgram_service.send_audio(audio_chunk)
-                else:
+
+                    # Queued even while Deepgram is reconnecting: send_audio buffers it for the replay and restarts a reconnect that gave up
+                    await session.audio_queue.put(audio_chunk)
+                elif not stt_warning_sent:
+                    stt_warning_sent = True
                     logger.warning("STT service not connected. Audio not processed.")
-                    await websocket.send_json({"type": "warning", "message": "STT service not connected. Audio not processed."})
+                    session.outbound.send({"type": "warning", "message": "STT service not connected. Audio not processed."})
 
             elif "text" in data: # For control messages if any, or if client sends text
                 message = data["text"]
-                print(f"Received text message: {message}")
+                if session.recorder is not None:
+                    session.recorder.record(CONTROL, message.encode())
+                logger.info("Received text message: %s", message)
                 # Potentially handle text commands from client, e.g., "stop", "reset"
                 if message == "REQUEST_IDLE_STATE": # Example control message
                     await session.set_state(VoiceBotState.IDLE)
-                    await websocket.send_json({"type": "info", "message": "Bot set to IDLE by request."})
+                    session.outbound.send({"type": "info", "message": "Bot set to IDLE by request."})
 
 
     except WebSocketDisconnect:
-        print("Client disconnected")
+        logger.info("Client disconnected")
         if session.deepgram_service:
             await session.deepgram_service.close_connection()
         session.client_websocket = None
         # Reset state or session if needed
         session.current_state = VoiceBotState.IDLE 
-        session.latency_timestamps.clear() # Clear all latency timestamps on disconnect
-       # logger.info("Session manager and latency timestamps reset on disconnect.")
+       # logger.info("Session manager reset on disconnect.")
     except Exception as e:
-        print(f"WebSocket Error: {e}")
-        logger.exception(f"WebSocket Error: {e}")
+        logger.exception("WebSocket Error: %s", e)
         if session.client_websocket: # Check if still connected
-            try:
-                await session.client_websocket.send_json({
-                    "type": "error",
-                    "message": f"An internal server error occurred: {str(e)}"
-                })
-            except Exception as send_e:
-                logger.error(f"Error sending error to client: {send_e}")
+            session.outbound.send({
+                "type": "error",
+                "message": f"An internal server error occurred: {str(e)}"
+            })
     finally:
+        await session.audio_queue.close()
+        await session.events.close() # No new turn may start once the turn tasks are cancelled
+        session.cancel_speculation()
+        await session.turn_tasks.cancel()
         if session.deepgram_service:
             await session.deepgram_service.close_connection()
+        await session.outbound.close() # Flushes the error frame above, if any
         session.client_websocket = None # Clear websocket on disconnect/error
-        session.latency_timestamps.clear() # Ensure clear on any exit
+        if session.trace is not None:
+            session.trace.finish("aborted") # Ensure the open turn is recorded on any exit
+            session.trace = None
+        if session.recorder is not None:
+            await session.recorder.close()
         #logger.info("WebSocket connection closed for session.")
 
 # To run: uvicorn backend.app.main:app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# Per-worker caps. A limit of 0 disables that limiter; *_QUEUE_TIMEOUT is how long (seconds) a
+# request may wait for a free slot before it is turned away.
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "200"))
+SESSION_QUEUE_TIMEOUT = float(os.getenv("SESSION_QUEUE_TIMEOUT", "2"))
+NIFI_MAX_CONCURRENCY = int(os.getenv("NIFI_MAX_CONCURRENCY", "64"))
+NIFI_QUEUE_TIMEOUT = float(os.getenv("NIFI_QUEUE_TIMEOUT", "2"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """No slot became free within the limiter's queue timeout."""
+
+    def __init__(self, limiter: str):
+        super().__init__(f"{limiter} is at capacity")
+        self.limiter = limiter
+
+
+class ConcurrencyLimiter:
+    """
+    Semaphore with a bounded wait: callers queue for up to queue_timeout, then get OverloadedError.
+
+    Shedding a few requests at the door keeps latency flat for the ones already admitted,
+    instead of every session slowing down together at peak.
+    """
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+        self.active = 0
+        self.waiting = 0
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0}
+
+    async def acquire(self):
+        if self._semaphore is not None:
+            if self._semaphore.locked():
+                self.stats["queued"] += 1
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.stats["rejected"] += 1
+                    logger.warning("%s limiter rejected a request after %ss (limit %d)", self.name, self.queue_timeout, self.limit)
+                    raise OverloadedError(self.name)
+                finally:
+                    self.waiting -= 1
+            else:
+                await self._semaphore.acquire()
+        self.stats["admitted"] += 1
+        self.active += 1
+
+    async def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now; never queues and does not count as a rejection."""
+        if self._semaphore is not None:
+            if self._semaphore.locked():
+                return False
+            await self._semaphore.acquire() # Free and nobody queued: returns without suspending
+        self.stats["admitted"] += 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["active"] = self.active
+        stats["waiting"] = self.waiting
+        stats["limit"] = self.limit
+        return stats
+
+
+session_limiter = ConcurrencyLimiter("sessions", MAX_SESSIONS, SESSION_QUEUE_TIMEOUT)
+nifi_limiter = ConcurrencyLimiter("nifi", NIFI_MAX_CONCURRENCY, NIFI_QUEUE_TIMEOUT)
+llm_limiter = ConcurrencyLimiter("llm", LLM_MAX_CONCURRENCY, LLM_QUEUE_TIMEOUT)
+
+
+def get_admission_stats() -> dict:
+    return {limiter.name: limiter.get_stats() for limiter in (session_limiter, nifi_limiter, llm_limiter)}
+
+
+registry.register_collector("admission", get_admission_stats, label="limiter")
@@ -0,0 +1,182 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# Per-session buffer between the browser socket and Deepgram
+AUDIO_QUEUE_MAX_FRAMES = int(os.getenv("AUDIO_QUEUE_MAX_FRAMES", "100"))
+AUDIO_QUEUE_POLICY = os.getenv("AUDIO_QUEUE_POLICY", "block") # block | drop_oldest
+AUDIO_BATCH_MAX_BYTES = int(os.getenv("AUDIO_BATCH_MAX_BYTES", "16384"))
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+logger = logging.getLogger(__name__)
+
+frame_lag = registry.histogram(
+    "audio_frame_lag_ms",
+    "Time an audio frame waited in the session queue before it was written to Deepgram.",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+# Totals across all sessions in this worker
+audio_queue_totals = {"frames_in": 0, "frames_sent": 0, "batches_sent": 0, "bytes_sent": 0, "dropped_frames": 0, "queued_frames": 0, "send_errors": 0}
+# Queues of the sessions currently open, for per-session depth and lag
+_live_queues: set["AudioSendQueue"] = set()
+
+
+def get_audio_queue_stats() -> dict:
+    """Worker totals plus the deepest and most lagged session queue right now."""
+    stats = dict(audio_queue_totals)
+    stats["sessions"] = len(_live_queues)
+    stats["max_session_depth"] = max((q.depth for q in _live_queues), default=0)
+    stats["max_session_lag_ms"] = round(max((q.stats["last_lag_ms"] for q in _live_queues), default=0.0), 1)
+    return stats
+
+
+def get_audio_queue_session_stats() -> list[dict]:
+    return [q.get_stats() for q in _live_queues]
+
+
+registry.register_collector("audio_queue", get_audio_queue_stats)
+
+
+class AudioSendQueue:
+    """
+    Bounded per-session audio queue drained by one sender task.
+
+    The receive loop only enqueues, so a slow Deepgram write never stalls reading from the
+    browser. When full, `block` makes put() wait for space (backpressure onto the client
+    socket); `drop_oldest` discards the oldest frame to bound latency. The browser sends one
+    MediaRecorder WebM stream, so dropping is lossy: a dropped frame can cut a block in half
+    and Deepgram may skip audio around it. The stream's first frame carries the WebM header
+    and is never dropped. The sender coalesces queued frames into writes of up to
+    max_batch_bytes; concatenating consecutive frames of the byte stream is lossless.
+    """
+
+    def __init__(
+        self,
+        send,
+        max_frames: int = AUDIO_QUEUE_MAX_FRAMES,
+        policy: str = AUDIO_QUEUE_POLICY,
+        max_batch_bytes: int = AUDIO_BATCH_MAX_BYTES,
+    ):
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown audio queue policy '{policy}'. Use '{DROP_OLDEST}' or '{BLOCK}'.")
+        self._send = send # async (bytes) -> None
+        self.max_frames = max(max_frames, 2) # Room for a held header frame and one more
+        self.policy = policy
+        self.max_batch_bytes = max_batch_bytes
+        self._frames: deque[tuple[bytes, float]] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._closed = False
+        self._task: asyncio.Task | None = None
+        self._header_queued = False # The stream's first frame is still waiting in the queue
+        self.stats = {"frames_in": 0, "frames_sent": 0, "batches_sent": 0, "dropped_frames": 0, "max_depth": 0, "last_lag_ms": 0.0, "max_lag_ms": 0.0}
+
+    @property
+    def depth(self) -> int:
+        return len(self._frames)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            _live_queues.add(self)
+
+    async def put(self, frame: bytes):
+        if self._closed:
+            return
+        if len(self._frames) >= self.max_frames:
+            if self.policy == BLOCK:
+                while len(self._frames) >= self.max_frames and not self._closed:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+                if self._closed:
+                    return
+            else:
+                if self._header_queued:
+                    del self._frames[1] # Without the header the rest of the stream cannot be decoded
+                else:
+                    self._frames.popleft()
+                self.stats["dropped_frames"] += 1
+                audio_queue_totals["dropped_frames"] += 1
+                audio_queue_totals["queued_frames"] -= 1
+        if self.stats["frames_in"] == 0:
+            self._header_queued = True
+        self._frames.append((frame, time.perf_counter()))
+        self.stats["frames_in"] += 1
+        audio_queue_totals["frames_in"] += 1
+        audio_queue_totals["queued_frames"] += 1
+        if len(self._frames) > self.stats["max_depth"]:
+            self.stats["max_depth"] = len(self._frames)
+        self._not_empty.set()
+
+    def _take_batch(self) -> tuple[bytes, float, int]:
+        parts = []
+        size = 0
+        oldest = self._frames[0][1]
+        while self._frames and (not parts or size + len(self._frames[0][0]) <= self.max_batch_bytes):
+            frame, _ = self._frames.popleft()
+            parts.append(frame)
+            size += len(frame)
+        self._header_queued = False
+        audio_queue_totals["queued_frames"] -= len(parts)
+        self._not_full.set()
+        return (parts[0] if len(parts) == 1 else b"".join(parts)), oldest, len(parts)
+
+    async def _run(self):
+        while True:
+            if not self._frames:
+                if self._closed:
+                    return
+                self._not_empty.clear()
+                await self._not_empty.wait()
+                continue
+            batch, oldest, count = self._take_batch()
+            lag_ms = (time.perf_counter() - oldest) * 1000
+            frame_lag.observe(lag_ms)
+            self.stats["last_lag_ms"] = lag_ms
+            self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], lag_ms)
+            try:
+                await self._send(batch)
+            except Exception as e:
+                audio_queue_totals["send_errors"] += 1
+                logger.error("Error sending queued audio to Deepgram: %s", e, exc_info=True)
+                continue
+            self.stats["frames_sent"] += count
+            self.stats["batches_sent"] += 1
+            audio_queue_totals["frames_sent"] += count
+            audio_queue_totals["batches_sent"] += 1
+            audio_queue_totals["bytes_sent"] += len(batch)
+
+    async def close(self, drain_timeout: float = 1.0):
+        """Stop accepting audio, give the sender a moment to drain, then stop it."""
+        self._closed = True
+        _live_queues.discard(self)
+        self._not_empty.set()
+        self._not_full.set()
+        try:
+            if self._task is not None:
+                await asyncio.wait_for(self._task, drain_timeout)
+        except asyncio.TimeoutError:
+            pass # wait_for cancelled the sender; what it did not send is dropped below
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise # The caller is being cancelled (e.g. shutdown), not just the sender task
+        finally:
+            self._task = None
+            audio_queue_totals["queued_frames"] -= len(self._frames)
+            self.stats["dropped_frames"] += len(self._frames)
+            audio_queue_totals["dropped_frames"] += len(self._frames)
+            self._frames.clear()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["depth"] = len(self._frames)
+        return stats
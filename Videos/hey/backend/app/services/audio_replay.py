@@ -0,0 +1,130 @@
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Audio kept per session for replay into a replacement Deepgram connection
+DEEPGRAM_REPLAY_SECONDS = float(os.getenv("DEEPGRAM_REPLAY_SECONDS", "5"))
+DEEPGRAM_REPLAY_MAX_BYTES = int(os.getenv("DEEPGRAM_REPLAY_MAX_BYTES", "262144"))
+
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+CLUSTER_ID = b"\x1f\x43\xb6\x75"
+TIMECODE_ID = 0xE7
+UNKNOWN_SIZE = b"\x01\xff\xff\xff\xff\xff\xff\xff"
+
+
+def _read_vint(data: bytes, pos: int) -> tuple[int, int] | None:
+    """EBML variable-length integer at `pos`: (value, encoded length), or None if cut off."""
+    if pos >= len(data) or data[pos] == 0:
+        return None
+    length = 9 - data[pos].bit_length()
+    if pos + length > len(data):
+        return None
+    value = data[pos] & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    return value, length
+
+
+def _cluster_timecode(data: bytes, pos: int) -> int | None:
+    """Timecode of the Cluster starting at `pos`; MediaRecorder writes it as the Cluster's first child."""
+    size = _read_vint(data, pos + len(CLUSTER_ID))
+    if size is None:
+        return None
+    pos += len(CLUSTER_ID) + size[1]
+    if pos >= len(data) or data[pos] != TIMECODE_ID:
+        return None
+    size = _read_vint(data, pos + 1)
+    if size is None or pos + 1 + size[1] + size[0] > len(data):
+        return None
+    start = pos + 1 + size[1]
+    return int.from_bytes(data[start:start + size[0]], "big")
+
+
+def cluster_header(timecode: int) -> bytes:
+    """An unknown-size Cluster opening, so SimpleBlocks cut from the middle of a cluster decode again."""
+    return CLUSTER_ID + UNKNOWN_SIZE + bytes([TIMECODE_ID, 0x88]) + timecode.to_bytes(8, "big")
+
+
+class AudioReplayBuffer:
+    """
+    The most recent audio written to Deepgram, so a replacement connection can resume mid-call.
+
+    MediaRecorder writes the WebM header (EBML, Segment, Tracks) only at the start of its first
+    chunk, so that is kept for the whole session. A new connection gets the header, an opening
+    for the Cluster the audio was cut from, then every chunk received since the end of the last
+    final transcript. Chunks are bounded by max_seconds and max_bytes, whichever is hit first.
+    Streams that are not WebM are replayed as-is.
+    """
+
+    def __init__(self, max_seconds: float = DEEPGRAM_REPLAY_SECONDS, max_bytes: int = DEEPGRAM_REPLAY_MAX_BYTES, clock=time.monotonic):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self.header: bytes | None = None # None until the first chunk, or for a stream that is not WebM
+        # (received_at, seq, chunk, timecode of the Cluster the chunk starts in)
+        self._chunks: deque[tuple[float, int, bytes, int | None]] = deque()
+        self._bytes = 0
+        self._timecode: int | None = None
+        self.appended = 0 # Sequence number of the next chunk
+        self.evicted = 0
+        self.finalized_at: float | None = None # Receive time of the end of the last final transcript
+
+    def append(self, chunk: bytes) -> float:
+        now = self._clock()
+        timecode = self._timecode
+        if self.appended == 0 and chunk.startswith(EBML_MAGIC):
+            cluster = chunk.find(CLUSTER_ID)
+            self.header = chunk[:cluster] if cluster > 0 else chunk
+        if self.header is not None:
+            cluster = chunk.rfind(CLUSTER_ID)
+            if cluster >= 0:
+                self._timecode = _cluster_timecode(chunk, cluster)
+        self._chunks.append((now, self.appended, chunk, timecode))
+        self.appended += 1
+        self._bytes += len(chunk)
+        while len(self._chunks) > 1 and (self._bytes > self.max_bytes or now - self._chunks[0][0] > self.max_seconds):
+            self._bytes -= len(self._chunks.popleft()[2])
+            self.evicted += 1
+        return now
+
+    def mark_finalized(self, at: float):
+        if self.finalized_at is None or at > self.finalized_at:
+            self.finalized_at = at
+
+    def replay(self) -> tuple[list[bytes], float | None, int]:
+        """
+        What to write to a new connection first: the byte strings, the receive time of the
+        audio they start with (the new stream's zero), and the seq to pass to since() next.
+        """
+        chunks = self._chunks
+        start = 0
+        if self.finalized_at is not None:
+            start = next((i for i, entry in enumerate(chunks) if entry[0] >= self.finalized_at), len(chunks))
+        if start >= len(chunks):
+            # Nothing unfinalized buffered: only set the new stream up for the live audio that follows
+            parts = [self.header] if self.header else []
+            if self.header and self._timecode is not None:
+                parts.append(cluster_header(self._timecode))
+            return parts, None, self.appended
+        # A chunk covers the timeslice before it arrived; the previous arrival is where its audio starts
+        origin = chunks[start - 1][0] if start > 0 else chunks[start][0]
+        _, seq, first, timecode = chunks[start]
+        parts = []
+        if seq == 0:
+            pass # The session's first chunk carries the header itself
+        elif self.header is not None:
+            parts.append(self.header)
+            if not first.startswith(CLUSTER_ID) and timecode is not None:
+                parts.append(cluster_header(timecode))
+        parts.extend(entry[2] for entry in list(chunks)[start:])
+        return parts, origin, self.appended
+
+    def since(self, seq: int) -> tuple[list[bytes], int]:
+        """Chunks appended at or after `seq` (while a replay was being written), and the next seq."""
+        return [entry[2] for entry in self._chunks if entry[1] >= seq], self.appended
+
+    def get_stats(self) -> dict:
+        return {"chunks": len(self._chunks), "bytes": self._bytes, "evicted": self.evicted}
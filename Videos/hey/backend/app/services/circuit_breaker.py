@@ -0,0 +1,82 @@
+import time
+import logging
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Exported as a gauge: closed=0, half_open=1, open=2
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit is open; retrying in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker for one upstream.
+
+    After failure_threshold failures in a row the circuit opens and calls fail fast for
+    reset_timeout seconds. Then a single probe call is let through (half-open): success closes
+    the circuit, failure opens it again. A probe that ends with neither (e.g. cancelled by a
+    barge-in) must be released with abandon() so the next call can probe.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.stats = {"opened": 0, "short_circuited": 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        self.stats["short_circuited"] += 1
+        raise CircuitOpenError(self.name, max(self.reset_timeout - (self._clock() - self._opened_at), 0.0))
+
+    def record_success(self):
+        if self._state != CLOSED:
+            logger.info("%s circuit closed", self.name)
+        self._state = CLOSED
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+            self._state = OPEN
+            self._opened_at = self._clock()
+            self.stats["opened"] += 1
+            logger.warning("%s circuit opened after %d consecutive failures; failing fast for %ss", self.name, self._failures, self.reset_timeout)
+        self._probing = False
+
+    def abandon(self):
+        self._probing = False
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["state"] = STATE_VALUES[self.state]
+        stats["consecutive_failures"] = self._failures
+        return stats
@@ -0,0 +1,98 @@
+import os
+import logging
+from collections import deque
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# Per-session conversation memory merged into the NiFi prompt before it goes to the LLM
+CONVERSATION_MEMORY_ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "true").lower() == "true"
+# Upper bound for the whole prompt (NiFi messages + history), in estimated tokens
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "3000"))
+# When the budget is exceeded, history is cut back to this fraction of what fits, not just below the line,
+# so the prompt prefix stays byte-identical for the next several turns (provider-side prompt caching)
+CONVERSATION_TRIM_TARGET = float(os.getenv("CONVERSATION_TRIM_TARGET", "0.5"))
+
+MESSAGE_OVERHEAD_TOKENS = 4 # Role and separators per chat message
+
+logger = logging.getLogger(__name__)
+
+prompt_tokens = registry.histogram(
+    "prompt_tokens_estimate",
+    "Estimated prompt size sent to the LLM (NiFi messages plus conversation history).",
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000),
+)
+conversation_stats = {"exchanges_recorded": 0, "interrupted_exchanges": 0, "trims": 0, "exchanges_trimmed": 0, "tokens_trimmed": 0}
+registry.register_collector("conversation", lambda: conversation_stats)
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token for English; close enough for budgeting and far cheaper than a tokenizer."""
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    """
+    Prior user/assistant exchanges of one session.
+
+    build_messages() lays the prompt out as NiFi's leading system messages, then the history
+    oldest first, then the rest of the NiFi messages (the current question and its retrieved
+    context). History only grows at the end between trims, so consecutive prompts share a long
+    identical prefix. Trimming drops whole exchanges from the front.
+    """
+
+    def __init__(self, token_budget: int = CONVERSATION_TOKEN_BUDGET, trim_target: float = CONVERSATION_TRIM_TARGET):
+        self.token_budget = token_budget
+        self.trim_target = trim_target
+        self._exchanges: deque[tuple[list[dict], int]] = deque() # (messages, estimated tokens)
+        self.history_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._exchanges)
+
+    def add_exchange(self, user_text: str, assistant_text: str, interrupted: bool = False):
+        if not user_text or not assistant_text:
+            return
+        if interrupted:
+            # The user cut the answer off; the model should know it was not heard in full
+            assistant_text += " ..."
+            conversation_stats["interrupted_exchanges"] += 1
+        messages = [{"role": "user", "content": user_text}, {"role": "assistant", "content": assistant_text}]
+        tokens = sum(message_tokens(m) for m in messages)
+        self._exchanges.append((messages, tokens))
+        self.history_tokens += tokens
+        conversation_stats["exchanges_recorded"] += 1
+
+    def _trim(self, allowance: int):
+        if self.history_tokens <= allowance:
+            return
+        target = int(allowance * self.trim_target)
+        dropped = dropped_tokens = 0
+        while self._exchanges and self.history_tokens > target:
+            _, tokens = self._exchanges.popleft()
+            self.history_tokens -= tokens
+            dropped += 1
+            dropped_tokens += tokens
+        conversation_stats["trims"] += 1
+        conversation_stats["exchanges_trimmed"] += dropped
+        conversation_stats["tokens_trimmed"] += dropped_tokens
+        logger.debug("Conversation history trimmed: dropped %d exchanges (%d tokens), %d left", dropped, dropped_tokens, len(self._exchanges))
+
+    def build_messages(self, nifi_messages: list[dict]) -> list[dict]:
+        """The LLM prompt for this turn: NiFi's messages with the history fitted into the token budget."""
+        split = 0
+        while split < len(nifi_messages) and nifi_messages[split].get("role") == "system":
+            split += 1
+        nifi_tokens = sum(message_tokens(m) for m in nifi_messages)
+        self._trim(max(self.token_budget - nifi_tokens, 0))
+        messages = list(nifi_messages[:split])
+        for exchange, _ in self._exchanges:
+            messages.extend(exchange)
+        messages.extend(nifi_messages[split:])
+        prompt_tokens.observe(nifi_tokens + self.history_tokens)
+        return messages
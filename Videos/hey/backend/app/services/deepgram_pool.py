@@ -0,0 +1,194 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from dotenv import load_dotenv
+from deepgram import LiveTranscriptionEvents
+
+load_dotenv()
+
+# Pre-opened Deepgram live connections handed to new sessions without a connect round trip
+DEEPGRAM_POOL_ENABLED = os.getenv("DEEPGRAM_POOL_ENABLED", "true").lower() == "true"
+DEEPGRAM_POOL_MIN_SIZE = int(os.getenv("DEEPGRAM_POOL_MIN_SIZE", "2"))
+DEEPGRAM_POOL_MAX_SIZE = int(os.getenv("DEEPGRAM_POOL_MAX_SIZE", "10"))
+DEEPGRAM_POOL_MAX_IDLE_SECONDS = float(os.getenv("DEEPGRAM_POOL_MAX_IDLE_SECONDS", "240"))
+DEEPGRAM_POOL_REFILL_INTERVAL = float(os.getenv("DEEPGRAM_POOL_REFILL_INTERVAL", "1"))
+DEEPGRAM_POOL_DEMAND_WINDOW = float(os.getenv("DEEPGRAM_POOL_DEMAND_WINDOW", "30"))
+
+logger = logging.getLogger(__name__)
+
+# Deepgram events and the DeepgramService method each one is routed to
+EVENT_HANDLERS = {
+    LiveTranscriptionEvents.Open: "_on_open",
+    LiveTranscriptionEvents.Transcript: "_on_message",
+    LiveTranscriptionEvents.Metadata: "_on_metadata",
+    LiveTranscriptionEvents.Error: "_on_error",
+    LiveTranscriptionEvents.Close: "_on_close",
+    LiveTranscriptionEvents.UtteranceEnd: "_on_utterance_end",
+    LiveTranscriptionEvents.SpeechStarted: "_on_speech_started",
+}
+
+
+class PooledConnection:
+    """
+    A started `asynclive` client whose events are routed to whichever DeepgramService owns it.
+
+    Handlers are registered once when the socket is opened, so the connection can sit in the
+    pool (kept alive by the SDK's KeepAlive task) and be bound to a session later.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.owner = None
+        self.healthy = True
+        for event, method in EVENT_HANDLERS.items():
+            connection.on(event, self._dispatcher(event, method))
+
+    def _dispatcher(self, event, method: str):
+        async def dispatch(client, *args, **kwargs):
+            if event in (LiveTranscriptionEvents.Close, LiveTranscriptionEvents.Error) and self.owner is None:
+                self.healthy = False # Closed or failed while idle in the pool
+            owner = self.owner
+            if owner is not None:
+                handler = getattr(owner, method, None)
+                if handler is not None:
+                    await handler(client, *args, **kwargs)
+        return dispatch
+
+    def bind(self, owner):
+        self.owner = owner
+
+    async def is_usable(self, max_idle_seconds: float) -> bool:
+        if not self.healthy or time.monotonic() - self.created_at > max_idle_seconds:
+            return False
+        return await self.connection.is_connected()
+
+    async def finish(self):
+        self.owner = None
+        try:
+            await self.connection.finish()
+        except Exception as e:
+            logger.warning("Error finishing pooled Deepgram connection: %s", e)
+
+
+class DeepgramConnectionPool:
+    """
+    Keeps between min_size and max_size idle Deepgram connections open.
+
+    The target grows with recent demand (acquisitions within DEEPGRAM_POOL_DEMAND_WINDOW) and is
+    refilled by a background task; idle connections that closed or exceeded the idle age are recycled.
+    """
+
+    def __init__(
+        self,
+        open_connection,
+        min_size: int = DEEPGRAM_POOL_MIN_SIZE,
+        max_size: int = DEEPGRAM_POOL_MAX_SIZE,
+        max_idle_seconds: float = DEEPGRAM_POOL_MAX_IDLE_SECONDS,
+    ):
+        self._open_connection = open_connection # async () -> PooledConnection | None
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.max_idle_seconds = max_idle_seconds
+        self._idle: deque[PooledConnection] = deque()
+        self._opening = 0
+        self._recent_acquires: deque[float] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.stats = {"opened": 0, "open_failures": 0, "hits": 0, "misses": 0, "recycled": 0}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Finish concurrently: each SDK finish() waits on the close handshake, which adds up on restarts
+        idle, self._idle = list(self._idle), deque()
+        await asyncio.gather(*(pooled.finish() for pooled in idle))
+
+    async def acquire(self) -> PooledConnection | None:
+        """Hand out a healthy idle connection, or None so the caller opens one itself."""
+        now = time.monotonic()
+        self._recent_acquires.append(now)
+        self._wakeup.set()
+        while self._idle:
+            pooled = self._idle.popleft()
+            if await pooled.is_usable(self.max_idle_seconds):
+                self.stats["hits"] += 1
+                return pooled
+            self.stats["recycled"] += 1
+            asyncio.create_task(pooled.finish())
+        self.stats["misses"] += 1
+        return None
+
+    async def wait_until_warm(self) -> str:
+        """Return once a pre-opened connection is idle, i.e. Deepgram is reachable and the handshake is done."""
+        while not self._idle:
+            await asyncio.sleep(0.1)
+        return f"{len(self._idle)} idle connection(s)"
+
+    def _target_size(self) -> int:
+        cutoff = time.monotonic() - DEEPGRAM_POOL_DEMAND_WINDOW
+        while self._recent_acquires and self._recent_acquires[0] < cutoff:
+            self._recent_acquires.popleft()
+        return min(self.max_size, max(self.min_size, len(self._recent_acquires)))
+
+    async def _recycle_stale(self):
+        for _ in range(len(self._idle)):
+            pooled = self._idle.popleft()
+            if await pooled.is_usable(self.max_idle_seconds):
+                self._idle.append(pooled)
+            else:
+                self.stats["recycled"] += 1
+                await pooled.finish()
+
+    async def _open_one(self) -> bool:
+        try:
+            pooled = await self._open_connection()
+        except Exception as e:
+            logger.error("Error pre-opening Deepgram connection: %s", e)
+            pooled = None
+        finally:
+            self._opening -= 1
+        if pooled is None:
+            self.stats["open_failures"] += 1
+            return False
+        self.stats["opened"] += 1
+        self._idle.append(pooled)
+        return True
+
+    async def _maintain(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._recycle_stale()
+                missing = self._target_size() - len(self._idle) - self._opening
+                if missing > 0:
+                    self._opening += missing
+                    opened = await asyncio.gather(*(self._open_one() for _ in range(missing)))
+                    if not any(opened):
+                        await asyncio.sleep(DEEPGRAM_POOL_REFILL_INTERVAL * 5) # Back off while Deepgram is unreachable
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Deepgram pool maintenance failed: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), DEEPGRAM_POOL_REFILL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["idle"] = len(self._idle)
+        stats["opening"] = self._opening
+        stats["target"] = self._target_size()
+        return stats
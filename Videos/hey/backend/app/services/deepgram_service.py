@@ -10,254 +10,320 @@ from deepgram import (
     # from deepgram.clients.listen.v1.async_client import AsyncLiveClient # Example
     # from deepgram.clients.listen.v1.response import OpenResponse, LiveTranscriptionResponse, MetadataResponse, ErrorResponse, CloseResponse, UtteranceEndResponse
 )
+import random
 import logging # Import logging
 import time # Import time for precise timing
 
 load_dotenv()
 
 DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
+# Override the Deepgram host, e.g. http://127.0.0.1:9100 for the local stand-in in backend/loadtest
+DEEPGRAM_URL = os.getenv("DEEPGRAM_URL", "")
+# Reopen a live connection that drops mid-call, replaying recent audio into it (see services/audio_replay.py)
+DEEPGRAM_RECONNECT_ENABLED = os.getenv("DEEPGRAM_RECONNECT_ENABLED", "true").lower() == "true"
+DEEPGRAM_RECONNECT_MAX_ATTEMPTS = int(os.getenv("DEEPGRAM_RECONNECT_MAX_ATTEMPTS", "5"))
+DEEPGRAM_RECONNECT_BACKOFF_MS = float(os.getenv("DEEPGRAM_RECONNECT_BACKOFF_MS", "100")) # Doubles per attempt, full jitter
+DEEPGRAM_RECONNECT_MAX_BACKOFF_MS = float(os.getenv("DEEPGRAM_RECONNECT_MAX_BACKOFF_MS", "2000"))
+# Results from replayed audio that end this close to the last final transcript are repeats
+DEEPGRAM_REPLAY_DEDUPE_TOLERANCE = 0.1
 
 from ..types import Event, EventType
+from ..state_machine import VoiceBotState
+from .speculation import SPECULATION_ENABLED, SPECULATION_STABLE_MS
+from .deepgram_pool import DeepgramConnectionPool, PooledConnection, DEEPGRAM_POOL_ENABLED
+from .metrics import registry
+from .recording import STT
+from .audio_replay import AudioReplayBuffer
+from .endpointing import create_endpointing_policy, DEEPGRAM_ENDPOINTING_MS, DEEPGRAM_UTTERANCE_END_MS
 
 
 # Get a logger for this module. It will inherit from the root logger configured in main.py
 logger = logging.getLogger(__name__)
 
+def build_live_options() -> LiveOptions:
+    # options = LiveOptions(
+    #     model="nova-2",
+    #     language="en-US",
+    #     encoding="linear16",
+    #     sample_rate=16000,
+    #     interim_results=True,
+    #     utterance_end_ms="1000",
+    #     vad_events=True,
+    #     smart_format=True,
+    #     punctuate=True
+    #)
+    return LiveOptions(
+        model="nova-3",
+        language="en-US",
+        encoding="opus",  # <--- CHANGE THIS TO OPUS
+        # sample_rate=16000, # For Opus, Deepgram often infers sample rate from the stream,
+                             # but specifying can sometimes help if issues arise.
+                             # The client requests 16000Hz, so Opus will likely encode at that.
+        interim_results=True,
+        utterance_end_ms=str(DEEPGRAM_UTTERANCE_END_MS),
+        endpointing=DEEPGRAM_ENDPOINTING_MS, # Silence (ms) before Deepgram sets speech_final
+        vad_events=True,
+        smart_format=True,
+        punctuate=False,
+        channels=1
+    )
+
+
+async def open_live_connection() -> PooledConnection | None:
+    """Open and start a Deepgram live connection with the current LiveOptions. Used by the pool and as fallback."""
+    config = DeepgramClientOptions(
+        url=DEEPGRAM_URL,
+        options={"keepalive": "true"} # Keepalive keeps pooled, idle connections open
+    )
+    deepgram = DeepgramClient(DEEPGRAM_API_KEY, config)
+    connection = deepgram.listen.asynclive.v("1")
+    pooled = PooledConnection(connection) # Registers the event handlers before start()
+    if await connection.start(build_live_options()) is False:
+        return None
+    return pooled
+
+
+deepgram_pool = DeepgramConnectionPool(open_live_connection)
+registry.register_collector("deepgram_pool", deepgram_pool.get_stats)
+
+# Interim transcripts only matter to the state machine when they start a new user turn, so at
+# most one INTERRUPTION_STARTED is posted per turn; the rest are counted as coalesced.
+stt_event_stats = {"transcripts": 0, "turns": 0, "events_posted": 0, "coalesced": 0}
+
+
+def get_stt_event_stats() -> dict:
+    stats = dict(stt_event_stats)
+    stats["events_per_turn"] = round(stats["events_posted"] / stats["turns"], 2) if stats["turns"] else 0.0
+    return stats
+
+
+registry.register_collector("stt_events", get_stt_event_stats)
+
+# Totals across all sessions in this worker
+stt_reconnect_stats = {"drops": 0, "reconnects": 0, "failed": 0, "attempts": 0, "replayed_bytes": 0, "duplicate_results": 0}
+registry.register_collector("stt_reconnect", lambda: stt_reconnect_stats)
+stt_gap = registry.histogram(
+    "stt_reconnect_gap_ms",
+    "Time from a dropped Deepgram connection to its replacement receiving audio again.",
+    buckets=(50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000),
+)
+
+
 class DeepgramService:
     def __init__(self, session_manager):
         self.session_manager = session_manager
         self.dg_connection = None # This will be the AsyncLiveClient instance
+        self._pooled: PooledConnection | None = None
         self.current_state_setter = None
-        self.accumulated_transcript = str()
-        self.websocket_callback = session_manager.client_websocket # ADD THIS LINE
+        self.endpointing = create_endpointing_policy()
+        self._grace_timer: asyncio.TimerHandle | None = None
+        self.websocket_callback = session_manager.outbound.send # Queues a frame for the browser
+        self.recorder = session_manager.recorder # Captures Deepgram callbacks for replay when set
+        # Interim transcript being watched for stability, and the timer that starts speculation on it
+        self._speculation_candidate = None
+        self._speculation_timer: asyncio.TimerHandle | None = None
+        # perf_counter() of the first transcript in the current utterance, for the turn trace
+        self._first_transcript_at: float | None = None
+        # Recent audio, replayed into a new connection if this one drops
+        self.audio_ring = AudioReplayBuffer()
+        self._audio_origin: float | None = None # Receive time of the first audio on the current connection
+        self._dedupe_until: float | None = None # After a replay: results ending before this were already final
+        self._reconnect_task: asyncio.Task | None = None
+        self._dropped_at: float | None = None # perf_counter() when the connection dropped; None while connected
+        self._outage_reported = False
+        self._closing = False
         
         
     async def connect(self):
       #  logger.info("Attempting to connect to Deepgram...")
         try:
-            config = DeepgramClientOptions(
-                options={"keepalive": "true"} # Keepalive can be useful
-            )
-            deepgram = DeepgramClient(DEEPGRAM_API_KEY, config)
-            self.dg_connection = deepgram.listen.asynclive.v("1")
-
-            self.dg_connection.on(LiveTranscriptionEvents.Open, self._on_open)
-            self.dg_connection.on(LiveTranscriptionEvents.Transcript, self._on_message)
-            self.dg_connection.on(LiveTranscriptionEvents.Metadata, self._on_metadata) # Signature will change
-            self.dg_connection.on(LiveTranscriptionEvents.Error, self._on_error)       # Signature will change
-            self.dg_connection.on(LiveTranscriptionEvents.Close, self._on_close)       # Signature will change
-            # self.dg_connection.on(LiveTranscriptionEvents.UtteranceEnd, self._on_utterance_end)
-
-            # options = LiveOptions(
-            #     model="nova-2",
-            #     language="en-US",
-            #     encoding="linear16",
-            #     sample_rate=16000,
-            #     interim_results=True,
-            #     utterance_end_ms="1000",
-            #     vad_events=True,
-            #     smart_format=True,
-            #     punctuate=True
-            #)
-            options = LiveOptions(
-                model="nova-3",
-                language="en-US",
-                encoding="opus",  # <--- CHANGE THIS TO OPUS
-                # sample_rate=16000, # For Opus, Deepgram often infers sample rate from the stream,
-                                     # but specifying can sometimes help if issues arise.
-                                     # The client requests 16000Hz, so Opus will likely encode at that.
-                interim_results=True,
-                utterance_end_ms="1000",
-                vad_events=True,
-                smart_format=True,
-                punctuate=False,
-                channels=1
-            )
-
-
-            # options = LiveOptions(
-            #     model="nova-3",
-            #     language="en-US",
-            #     smart_format=True,
-            #     encoding="linear16",
-            #     channels=1,
-            #     sample_rate=16000,
-            #     interim_results=True,
-            #     utterance_end_ms="1000",
-            #     vad_events=True,
-            #     punctuate=False
-            # )
-            print("Attempting to connect to Deepgram...")
-            if await self.dg_connection.start(options) is False:
-                print("Failed to connect to Deepgram")
+            pooled = await self._acquire_connection()
+            if pooled is None:
                 logger.error("Failed to connect to Deepgram.")
                 # await self.websocket_callback({"type": "error", "message": "Failed to connect to STT service."})
+                self._connect_failed()
                 return False
+            pooled.bind(self)
+            self._pooled = pooled
+            self.dg_connection = pooled.connection
           #  logger.info("Deepgram connection initiated successfully.")
             return True
         except Exception as e:
-            print(f"Error connecting to Deepgram: {e}")
             # await self.websocket_callback({"type": "error", "message": f"STT connection error: {e}"})
-            logger.exception(f"Error connecting to Deepgram: {e}")
-
+            logger.exception("Error connecting to Deepgram: %s", e)
+            self._connect_failed()
             return False
 
+    def _connect_failed(self):
+        # Treated like a drop, so the caller's audio keeps buffering and retries the connection
+        self._dropped_at = time.perf_counter()
+        self._outage_reported = True # The caller reports the failed connect itself
+        stt_reconnect_stats["drops"] += 1
+
+    @staticmethod
+    async def _acquire_connection() -> PooledConnection | None:
+        # Prefer an already-open connection from the pool; fall back to connecting now
+        pooled = await deepgram_pool.acquire() if DEEPGRAM_POOL_ENABLED else None
+        if pooled is None:
+            logger.debug("Opening a new Deepgram connection")
+            pooled = await open_live_connection()
+        return pooled
+
     def set_state_setter(self, state_setter):
         self.current_state_setter = state_setter
 
-    async def _on_open(self, dg_client_instance, open_data, **kwargs):
+    async def _on_open(self, dg_client_instance, open_data=None, **kwargs):
         # This signature assumes 'open_data' is passed as a second positional argument
-        print(f"Deepgram connection opened. Client: {dg_client_instance}, Event Data: {open_data}, Kwargs: {kwargs}")
-        await self.websocket_callback({"type": "stt_status", "status": "connected"})
+        logger.debug("Deepgram connection opened. Event data: %s", open_data)
+        self.websocket_callback({"type": "stt_status", "status": "connected"})
 
     async def _on_message(self, dg_client_instance, result, **kwargs):
         # 'result' is the LiveTranscriptionResponse
-        from ..state_machine import VoiceBotState
-
         if not (result and hasattr(result, 'channel') and
                 hasattr(result.channel, 'alternatives') and
                 result.channel.alternatives and
                 hasattr(result.channel.alternatives[0], 'transcript')):
-            print(f"Received malformed transcript data: {result}")
-            logger.warning(f"Received malformed transcript data from Deepgram: {result}")
+            logger.warning("Received malformed transcript data from Deepgram: %s", result)
             return
 
         transcript = result.channel.alternatives[0].transcript
         is_final = hasattr(result, 'is_final') and result.is_final        
-        
+        speech_final = bool(getattr(result, 'speech_final', False))
+        if self._audio_origin is not None and getattr(result, 'start', None) is not None:
+            # Receive time of the end of the audio this result covers (audio is streamed in real time)
+            audio_end = self._audio_origin + result.start + (getattr(result, 'duration', None) or 0.0)
+            if self._dedupe_until is not None:
+                if audio_end <= self._dedupe_until:
+                    stt_reconnect_stats["duplicate_results"] += 1 # Replayed audio that was already transcribed
+                    return
+                self._dedupe_until = None
+            if is_final and transcript:
+                self.audio_ring.mark_finalized(audio_end)
+        if self.recorder is not None:
+            self.recorder.record_json(STT, {"event": "transcript", "transcript": transcript, "is_final": bool(is_final), "speech_final": speech_final})
+
 
-        # --- DEBUG START ---
-        current_response_id = self.session_manager.curr_response_id
-        logger.debug(f"[_on_message] Current response_id: {current_response_id}")
-        logger.debug(f"[_on_message] Latency timestamps before processing: {self.session_manager.latency_timestamps}")
-        # --- DEBUG END ---
-        
         ################################################################
          # Capture timestamp when Deepgram sends first/interim transcript
-        
-        if transcript and current_response_id:
-            key_for_first_transcript_time = f"deepgram_first_transcript_time_{current_response_id}"
-            key_for_audio_send_start = f"deepgram_audio_send_start_{current_response_id}"
-
-            if key_for_first_transcript_time not in self.session_manager.latency_timestamps:
-                self.session_manager.latency_timestamps[key_for_first_transcript_time] = time.perf_counter()
-                logger.info(f"[_on_message] Marked first transcript time for {current_response_id}")   
-                # Calculate Deepgram STT latency (audio sent to first transcript received)
-                audio_send_start = self.session_manager.latency_timestamps.get(f"deepgram_audio_send_start_{self.session_manager.curr_response_id}")
-                logger.info("audio_send_start: %")
-                
-                 # --- DEBUG START ---
-                logger.debug(f"[_on_message] Checking audio_send_start for key '{key_for_audio_send_start}': {audio_send_start}")
-                # --- DEBUG END ---
-                if audio_send_start:
-                    stt_latency = (time.perf_counter() - audio_send_start) * 1000
-                    logger.info(f"Deepgram STT latency (audio sent to first transcript): {stt_latency:.2f}ms for response_id: {current_response_id}") #1
-                    self.session_manager.latency_timestamps.pop(key_for_audio_send_start, None) # Clean up
-                    logger.debug(f"[_on_message] Cleaned up '{key_for_audio_send_start}'. Remaining: {self.session_manager.latency_timestamps}")
-                else:
-                    logger.warning(f"[_on_message] audio_send_start was None or not found for response_id: {current_response_id}. Cannot calculate STT latency.")
-            else:
-                logger.debug(f"[_on_message] First transcript time already marked for {current_response_id}. Skipping re-marking.")
+        if transcript:
+            stt_event_stats["transcripts"] += 1
+            if self._first_transcript_at is None:
+                self._first_transcript_at = time.perf_counter()
 
         ################################################################
-        if transcript:
-            current_full_transcript = self.accumulated_transcript + transcript
-            if is_final:
-                self.accumulated_transcript = current_full_transcript + " "
-                
-                if self.session_manager.curr_response_id:
-                    self.session_manager.latency_timestamps[f"deepgram_final_transcript_time_{self.session_manager.curr_response_id}"] = time.perf_counter()
-                    logger.info(f"Marked deepgram_final_transcript_time for response_id: {self.session_manager.curr_response_id}")
-                asyncio.create_task(
-                    self.session_manager.handle_event(
-                        Event(
-                            type=EventType.INTERRUPTION_ENDED,
-                            data={
-                                "transcript": self.accumulated_transcript.strip(),
-                                "is_final": True
-                            }
-                        )
-                    )
+        if transcript and not is_final:
+            if SPECULATION_ENABLED:
+                self._schedule_speculation(f"{self.endpointing.pending_text()} {transcript}".strip())
+           # logger.debug(f"Interim transcript: '{transcript}'")
+            self._signal_interruption()
+        self._cancel_grace_timer()
+        turn_transcript = self.endpointing.on_transcript(transcript, is_final, speech_final)
+        if turn_transcript:
+            self._end_turn(turn_transcript)
+        elif is_final and transcript:
+            # A finalized segment that did not end the turn yet: it is the best speculation candidate
+            if SPECULATION_ENABLED:
+                self._schedule_speculation(self.endpointing.pending_text())
+            if self.endpointing.grace_seconds:
+                self._grace_timer = asyncio.get_running_loop().call_later(
+                    self.endpointing.grace_seconds, self._on_grace_timeout
                 )
-                # await self.session_manager.handle_event(
-                #     Event(
-                #         type=EventType.INTERRUPTION_ENDED,
-                #         data={
-                #             "transcript": self.accumulated_transcript.strip(),
-                #             "is_final": True
-                #         }
-                #     )
-                # )
-                self.accumulated_transcript = str()
-            else:
-                
-               # logger.debug(f"Interim transcript: '{self.accumulated_transcript}'")
-                asyncio.create_task(
-                    self.session_manager.handle_event(
-                        Event(
-                            type=EventType.INTERRUPTION_STARTED,
-                            data={
-                                "transcript": '',
-                                "is_final": False
-                            }
-                        )
-                    )
-                )
-                
-                # await self.session_manager.handle_event(
-                #     Event(
-                #         type=EventType.INTERRUPTION_STARTED,
-                #         data={
-                #             "transcript": '',
-                #             "is_final": False
-                #         }
-                #     )
-                # )
-
-    # async def _on_utterance_end(self, dg_client_instance, utterance_end_data, **kwargs):
-    #     # 'utterance_end_data' is the UtteranceEndResponse
-    #     from app.state_machine import VoiceBotState
-    #     print(f"Deepgram UtteranceEnd. Client: {dg_client_instance}, Event Data: {utterance_end_data}, Kwargs: {kwargs}. Accumulated: '{self.accumulated_transcript.strip()}'")
-        
-    #     final_text_for_llm = self.accumulated_transcript.strip()
-    #     self.accumulated_transcript = ""
 
-    #     if final_text_for_llm:
-    #         if self.current_state_setter:
-    #             await self.current_state_setter(VoiceBotState.RESPONDING, final_text_for_llm)
-    #     elif self.current_state_setter:
-    #         current_state_value = VoiceBotState.IDLE # Default
-    #         if hasattr(self.current_state_setter, '_session_ref_for_state_getter_'): # A way to get current state if main.py exposes it
-    #             current_state_value = self.current_state_setter._session_ref_for_state_getter_().current_state
+    def _end_turn(self, turn_transcript: str):
+        """Fire INTERRUPTION_ENDED for a completed user turn (at most once per turn, see EndpointingPolicy)."""
+        self._cancel_speculation_timer()
+        self._cancel_grace_timer()
+        self._first_transcript_at = None
+        stt_event_stats["turns"] += 1
+        stt_event_stats["events_posted"] += 1
+        # Queued behind this turn's INTERRUPTION_STARTED, so it is handled after any barge-in has finished
+        self.session_manager.handle_event(
+            Event(
+                type=EventType.INTERRUPTION_ENDED,
+                data={
+                    "transcript": turn_transcript,
+                    "is_final": True,
+                    "stt_final_at": time.perf_counter()
+                }
+            )
+        )
+
+    def _signal_interruption(self):
+        """Start the user's turn. Only the first interim of an utterance posts an event."""
+        session = self.session_manager
+        if session.current_state == VoiceBotState.LISTENING or session.events.queued(EventType.INTERRUPTION_STARTED):
+            stt_event_stats["coalesced"] += 1
+            return
+        stt_event_stats["events_posted"] += 1
+        session.handle_event(Event(
+            type=EventType.INTERRUPTION_STARTED,
+            data={"transcript": '', "is_final": False, "first_transcript_at": self._first_transcript_at}
+        ))
+
+    def _on_grace_timeout(self):
+        self._grace_timer = None
+        turn_transcript = self.endpointing.on_grace_timeout()
+        if turn_transcript:
+            self._end_turn(turn_transcript)
+
+    def _cancel_grace_timer(self):
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+
+    async def _on_utterance_end(self, dg_client_instance, utterance_end=None, **kwargs):
+        # Deepgram saw no new words for utterance_end_ms; end the turn if speech_final has not already
+        if self.recorder is not None:
+            self.recorder.record_json(STT, {"event": "utterance_end"})
+        turn_transcript = self.endpointing.on_utterance_end()
+        if turn_transcript:
+            self._end_turn(turn_transcript)
 
-    #         if current_state_value == VoiceBotState.LISTENING:
-    #             print("Utterance ended with no transcribed speech, returning to IDLE.")
-    #             await self.current_state_setter(VoiceBotState.IDLE)
+    async def _on_speech_started(self, dg_client_instance, speech_started=None, **kwargs):
+        # VAD detected the user speaking again: hold off any pending grace-timeout endpoint
+        if self.recorder is not None:
+            self.recorder.record_json(STT, {"event": "speech_started"})
+        self._cancel_grace_timer()
+        self.endpointing.on_speech_started()
+
+    def _schedule_speculation(self, transcript: str):
+        # Restart the stability window whenever the interim text changes; fire once it holds steady
+        if transcript == self._speculation_candidate:
+            return
+        self._cancel_speculation_timer()
+        self._speculation_candidate = transcript
+        self._speculation_timer = asyncio.get_running_loop().call_later(
+            SPECULATION_STABLE_MS / 1000,
+            self.session_manager.start_speculation,
+            transcript
+        )
+
+    def _cancel_speculation_timer(self):
+        if self._speculation_timer is not None:
+            self._speculation_timer.cancel()
+            self._speculation_timer = None
+        self._speculation_candidate = None
 
     # Handlers where the event data might be in kwargs or not passed positionally after dg_client_instance
     async def _on_metadata(self, dg_client_instance, **kwargs):
-        print(f"Deepgram metadata event. Client: {dg_client_instance}, Kwargs: {kwargs}")
         # Deepgram's MetadataResponse object might be under a specific key in kwargs, or 'response'
         metadata_data = kwargs.get('metadata', kwargs.get('response')) # Common keys for such payloads
         if metadata_data:
-            print(f"Actual metadata payload: {metadata_data}")
+            logger.debug("Deepgram metadata: %s", metadata_data)
             # Example: request_id = metadata_data.request_id (if it's an object)
             # Or if it's a dict: request_id = metadata_data.get('request_id')
         else:
-            logger.warning("Metadata payload not found directly in kwargs for Deepgram metadata event.")
-
-            print("Metadata payload not found directly in kwargs. Content of kwargs was printed above.")
+            logger.warning("Metadata payload not found directly in kwargs for Deepgram metadata event: %s", kwargs)
 
     async def _on_error(self, dg_client_instance, **kwargs):
-        print(f"Deepgram error event. Client: {dg_client_instance}, Kwargs: {kwargs}")
         # Deepgram's ErrorResponse object might be under a specific key in kwargs
-        logger.error(f"Deepgram error event. Client: {dg_client_instance}, Kwargs: {kwargs}")
+        logger.error("Deepgram error event. Kwargs: %s", kwargs)
         
         error_data = kwargs.get('error', kwargs.get('response')) # Common keys
 
         err_msg = "Unknown STT error"
         if error_data:
-            logger.error(f"Actual error payload from kwargs: {error_data}")
+            logger.error("Actual error payload from kwargs: %s", error_data)
             if hasattr(error_data, 'err_msg') and error_data.err_msg: # If it's an ErrorResponse object
                 err_msg = error_data.err_msg
             elif isinstance(error_data, dict):
@@ -267,46 +333,119 @@ class DeepgramService:
             else:
                 err_msg = str(error_data)
         else:
-            err_msg = f"STT error occurred; no specific error data in kwargs. Kwargs printed above."
-            print(err_msg)
-        if self.session_manager.curr_response_id:
-            keys_to_remove = [k for k in self.session_manager.latency_timestamps if k.endswith(self.session_manager.curr_response_id)]
-            for k in keys_to_remove:
-                self.session_manager.latency_timestamps.pop(k, None)
-            logger.warning(f"Cleared latency timestamps for response_id {self.session_manager.curr_response_id} due to Deepgram error.") # This should log
-        await self.websocket_callback({"type": "error", "message": f"STT error: {err_msg}"})
+            err_msg = "STT error occurred; no specific error data in kwargs."
+        self.websocket_callback({"type": "error", "message": f"STT error: {err_msg}"})
 
     async def _on_close(self, dg_client_instance, **kwargs):
-        print(f"Deepgram connection closed event. Client: {dg_client_instance}, Kwargs: {kwargs}")
+        logger.info("Deepgram connection closed. Kwargs: %s", kwargs)
         # Deepgram's CloseResponse object might be under 'close' or 'response' in kwargs
         # close_data = kwargs.get('close', kwargs.get('response'))
         # if close_data:
         # print(f"Actual close event data from kwargs: {close_data}")
-        await self.websocket_callback({"type": "stt_status", "status": "disconnected"})
+        self.websocket_callback({"type": "stt_status", "status": "disconnected"})
+        if dg_client_instance is self.dg_connection:
+            self._start_reconnect("connection closed")
 
     async def send_audio(self, audio_chunk):
-        if self.dg_connection: # Simplified check
-            try:
-               # logger.debug(f"Sending audio chunk of size {len(audio_chunk)} to Deepgram.") # Uncomment for high volume debug
-                await self.dg_connection.send(audio_chunk)
-            except Exception as e:
-                logger.error(f"Error sending audio to Deepgram: {e}", exc_info=True)
-                # Consider how to handle this: maybe close connection, notify client, etc.
-                # await self.websocket_callback({"type": "error", "message": f"STT send audio error: {e}"})
-        # else:
-            # print("Deepgram connection not available or already closed, cannot send audio.")
+        received_at = self.audio_ring.append(audio_chunk) # Buffered even while reconnecting
+        connection = self.dg_connection
+        if connection is None:
+            if self._dropped_at is not None:
+                self._start_reconnect("still disconnected") # Last round gave up; try again while the user talks
+            return # Otherwise not connected yet, or a reconnect is under way and will replay this chunk
+        if self._audio_origin is None:
+            self._audio_origin = received_at
+        try:
+           # logger.debug(f"Sending audio chunk of size {len(audio_chunk)} to Deepgram.") # Uncomment for high volume debug
+            sent = await connection.send(audio_chunk)
+        except Exception as e:
+            logger.error("Error sending audio to Deepgram: %s", e, exc_info=True)
+            sent = False
+        if sent is False and connection is self.dg_connection:
+            self._start_reconnect("send failed") # The SDK returns False once its socket has closed
+
+    def _start_reconnect(self, reason: str):
+        """Drop the current connection and reopen one in the background; audio keeps buffering meanwhile."""
+        if self._closing or self._reconnect_task is not None or not DEEPGRAM_RECONNECT_ENABLED:
+            return
+        if self._dropped_at is None:
+            self._dropped_at = time.perf_counter()
+            stt_reconnect_stats["drops"] += 1
+            logger.warning("Deepgram connection lost (%s); reconnecting", reason)
+        old, self._pooled, self.dg_connection = self._pooled, None, None
+        self._audio_origin = None
+        if old is not None:
+            old.bind(None) # Its late events must not reach this session
+            asyncio.create_task(old.finish())
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        pooled = None
+        try:
+            for attempt in range(DEEPGRAM_RECONNECT_MAX_ATTEMPTS):
+                if attempt:
+                    await asyncio.sleep(random.uniform(0, min(DEEPGRAM_RECONNECT_BACKOFF_MS * 2 ** (attempt - 1), DEEPGRAM_RECONNECT_MAX_BACKOFF_MS)) / 1000)
+                stt_reconnect_stats["attempts"] += 1
+                try:
+                    pooled = await self._acquire_connection()
+                    if pooled is not None and await self._resume(pooled):
+                        pooled = None # Adopted by this service
+                        gap_ms = (time.perf_counter() - self._dropped_at) * 1000
+                        self._dropped_at = None
+                        self._outage_reported = False
+                        stt_gap.observe(gap_ms)
+                        stt_reconnect_stats["reconnects"] += 1
+                        logger.info("Deepgram reconnected after %.0fms (%d attempt(s))", gap_ms, attempt + 1)
+                        self.websocket_callback({"type": "stt_status", "status": "connected"})
+                        return
+                except Exception as e:
+                    logger.warning("Deepgram reconnect attempt %d failed: %s", attempt + 1, e)
+                if pooled is not None:
+                    await pooled.finish()
+                    pooled = None
+            stt_reconnect_stats["failed"] += 1
+            logger.error("Could not reconnect to Deepgram after %d attempts; retrying on the next audio frame", DEEPGRAM_RECONNECT_MAX_ATTEMPTS)
+            if not self._outage_reported:
+                self._outage_reported = True # Once per outage, not once per round
+                self.websocket_callback({"type": "error", "message": "Lost connection to the speech recognition service."})
+        finally:
+            self._reconnect_task = None
+            if pooled is not None: # Cancelled by close_connection() part way through
+                await pooled.finish()
 
+    async def _resume(self, pooled: PooledConnection) -> bool:
+        """Write the header and the unfinalized audio to a new connection, then make it the live one."""
+        pooled.bind(self)
+        parts, origin, seq = self.audio_ring.replay()
+        while parts:
+            for part in parts:
+                if await pooled.connection.send(part) is False:
+                    pooled.bind(None)
+                    return False
+                stt_reconnect_stats["replayed_bytes"] += len(part)
+            # Chunks that arrived while the replay was being written go out before live audio does
+            parts, seq = self.audio_ring.since(seq)
+        self._audio_origin = origin
+        self._dedupe_until = self.audio_ring.finalized_at
+        self._pooled = pooled
+        self.dg_connection = pooled.connection
+        return True
 
     async def close_connection(self):
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self._cancel_speculation_timer()
+        self._cancel_grace_timer()
         if self.dg_connection:
-            print("Attempting to finish Deepgram connection...")
             try:
                 await self.dg_connection.finish()
                 #logger.info("Deepgram connection finished successfully.")
             except Exception as e:
-                print(f"Exception during Deepgram finish: {e}")
-                logger.exception(f"Exception during Deepgram finish: {e}")
+                logger.exception("Exception during Deepgram finish: %s", e)
             finally:
                 self.dg_connection = None
-                #logger.info("Deepgram connection set to None.")
-                print("Deepgram connection set to None.")
\ No newline at end of file
+                if self._pooled is not None:
+                    self._pooled.bind(None) # Stop routing late events to this session
+                    self._pooled = None
+                #logger.info("Deepgram connection set to None.")
\ No newline at end of file
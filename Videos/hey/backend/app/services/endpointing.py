@@ -0,0 +1,113 @@
+import os
+import logging
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# How the end of a user turn is decided, and the silence thresholds Deepgram uses
+ENDPOINTING_POLICY = os.getenv("ENDPOINTING_POLICY", "speech_final") # speech_final | is_final
+DEEPGRAM_ENDPOINTING_MS = int(os.getenv("DEEPGRAM_ENDPOINTING_MS", "300"))
+DEEPGRAM_UTTERANCE_END_MS = int(os.getenv("DEEPGRAM_UTTERANCE_END_MS", "1000"))
+# Fire this long after an is_final segment even if neither speech_final nor UtteranceEnd arrived (0 = off)
+ENDPOINTING_FINAL_GRACE_MS = float(os.getenv("ENDPOINTING_FINAL_GRACE_MS", "0"))
+
+logger = logging.getLogger(__name__)
+
+# Turns ended, by the signal that ended them, plus end signals ignored because the turn already fired
+endpointing_stats = {"speech_final": 0, "utterance_end": 0, "is_final": 0, "grace_timeout": 0, "suppressed": 0}
+registry.register_collector("endpointing_turns", lambda: endpointing_stats)
+
+
+class EndpointingPolicy(ABC):
+    """
+    Decides when the user's turn is over from Deepgram's transcript and VAD events.
+
+    Each on_* method returns the full turn transcript when the turn should end now, else None.
+    A policy returns a transcript at most once per turn; the turn re-opens on new speech.
+    """
+
+    grace_seconds = ENDPOINTING_FINAL_GRACE_MS / 1000 if ENDPOINTING_FINAL_GRACE_MS else None
+
+    def __init__(self):
+        self._segments: list[str] = []
+        self._fired = False
+
+    def pending_text(self) -> str:
+        """Finalized segments of the turn that has not ended yet."""
+        return " ".join(self._segments)
+
+    def _fire(self, trigger: str) -> str | None:
+        if self._fired or not self._segments:
+            endpointing_stats["suppressed"] += 1
+            return None
+        text = " ".join(self._segments)
+        self._segments = []
+        self._fired = True
+        endpointing_stats[trigger] += 1
+        return text
+
+    @abstractmethod
+    def on_transcript(self, transcript: str, is_final: bool, speech_final: bool) -> str | None:
+        ...
+
+    def on_utterance_end(self) -> str | None:
+        return None
+
+    def on_speech_started(self):
+        pass
+
+    def on_grace_timeout(self) -> str | None:
+        return self._fire("grace_timeout")
+
+
+class IsFinalPolicy(EndpointingPolicy):
+    """Original behaviour: every is_final segment ends the turn."""
+
+    grace_seconds = None
+
+    def on_transcript(self, transcript: str, is_final: bool, speech_final: bool) -> str | None:
+        if not transcript:
+            return None
+        self._fired = False
+        if not is_final:
+            return None
+        self._segments.append(transcript)
+        return self._fire("is_final")
+
+
+class SpeechFinalPolicy(EndpointingPolicy):
+    """
+    Collects is_final segments and ends the turn on the first of: speech_final (Deepgram saw
+    DEEPGRAM_ENDPOINTING_MS of silence), UtteranceEnd (word-timing gap of DEEPGRAM_UTTERANCE_END_MS,
+    robust to background noise), or the optional local grace timeout after an is_final.
+    """
+
+    def on_transcript(self, transcript: str, is_final: bool, speech_final: bool) -> str | None:
+        if transcript:
+            self._fired = False # New speech re-opens the turn
+            if is_final:
+                self._segments.append(transcript)
+        if is_final and speech_final:
+            return self._fire("speech_final")
+        return None
+
+    def on_utterance_end(self) -> str | None:
+        return self._fire("utterance_end")
+
+    def on_speech_started(self):
+        self._fired = False
+
+
+ENDPOINTING_POLICIES = {
+    "speech_final": SpeechFinalPolicy,
+    "is_final": IsFinalPolicy,
+}
+
+
+def create_endpointing_policy(name: str = ENDPOINTING_POLICY) -> EndpointingPolicy:
+    try:
+        return ENDPOINTING_POLICIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown endpointing policy '{name}'. Available: {', '.join(ENDPOINTING_POLICIES)}")
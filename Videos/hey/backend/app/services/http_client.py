@@ -0,0 +1,124 @@
+import os
+import logging
+import aiohttp
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pool tuning shared by every upstream. Per-upstream timeouts are read as
+# <PREFIX>_CONNECT_TIMEOUT / <PREFIX>_READ_TIMEOUT / <PREFIX>_TOTAL_TIMEOUT (seconds).
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "200"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "100"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+
+def _env_timeout(prefix: str, connect: float, read: float, total: float | None) -> aiohttp.ClientTimeout:
+    total_raw = os.getenv(f"{prefix}_TOTAL_TIMEOUT")
+    return aiohttp.ClientTimeout(
+        total=float(total_raw) if total_raw else total,
+        sock_connect=float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", connect)),
+        sock_read=float(os.getenv(f"{prefix}_READ_TIMEOUT", read)),
+    )
+
+
+class UpstreamClient:
+    """One long-lived aiohttp session + connector for a single upstream, with pool counters."""
+
+    def __init__(self, name: str, timeout: aiohttp.ClientTimeout):
+        self.name = name
+        self.timeout = timeout
+        self.session: aiohttp.ClientSession | None = None
+        self.stats = {
+            "requests": 0,
+            "in_flight": 0,
+            "errors": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+        }
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.stats["requests"] += 1
+            self.stats["in_flight"] += 1
+
+        async def on_request_end(session, ctx, params):
+            self.stats["in_flight"] -= 1
+
+        async def on_request_exception(session, ctx, params):
+            self.stats["in_flight"] -= 1
+            self.stats["errors"] += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats["connections_reused"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def open(self):
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            use_dns_cache=True,
+            enable_cleanup_closed=True,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=[self._trace_config()],
+        )
+        logger.info("HTTP pool '%s' opened (limit=%s, per_host=%s)", self.name, HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        total = stats["connections_created"] + stats["connections_reused"]
+        stats["reuse_ratio"] = round(stats["connections_reused"] / total, 3) if total else 0.0
+        return stats
+
+
+class HttpClients:
+    """App-wide registry of pooled upstream clients, opened on startup and shared by all sessions."""
+
+    def __init__(self):
+        # The retrieval call sets tighter per-attempt deadlines on top (see services/nifi_service.py)
+        self.nifi = UpstreamClient("nifi", _env_timeout("NIFI", connect=2, read=30, total=None))
+        self.llm = UpstreamClient("llm", _env_timeout("LLM", connect=5, read=30, total=None))
+
+    def _clients(self):
+        return (self.nifi, self.llm)
+
+    async def start(self):
+        for client in self._clients():
+            client.open()
+
+    async def close(self):
+        for client in self._clients():
+            await client.close()
+
+    def get_stats(self) -> dict:
+        return {client.name: client.get_stats() for client in self._clients()}
+
+
+http_clients = HttpClients()
+registry.register_collector("http_pool", http_clients.get_stats, label="upstream")
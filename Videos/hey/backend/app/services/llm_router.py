@@ -0,0 +1,112 @@
+import os
+import time
+import logging
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# Extra deployments to route across, comma-separated. Each entry is `deployment`, served by
+# AZURE_OPENAI_ENDPOINT, or `deployment@https://other.openai.azure.com#KEY_ENV_VAR` for another
+# resource whose API key is read from KEY_ENV_VAR (default AZURE_OPENAI_API_KEY).
+AZURE_OPENAI_DEPLOYMENTS = os.getenv("AZURE_OPENAI_DEPLOYMENTS", "")
+# Send a second request to the next-best deployment when no first token arrived in time
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+# Hedge delay is the primary's rolling TTFT quantile, clamped to [LLM_HEDGE_MIN_MS, LLM_HEDGE_MAX_MS]
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "300"))
+LLM_HEDGE_MAX_MS = float(os.getenv("LLM_HEDGE_MAX_MS", "3000"))
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", "1500")) # Until the primary has enough samples
+# How long a deployment is skipped after a 429 without Retry-After
+LLM_THROTTLE_COOLDOWN = float(os.getenv("LLM_THROTTLE_COOLDOWN", "10"))
+
+EWMA_ALPHA = 0.2
+MIN_QUANTILE_SAMPLES = 20
+ERROR_PENALTY = 4.0 # An error rate of 25% doubles the effective TTFT used for ranking
+
+logger = logging.getLogger(__name__)
+
+ttft_histogram = registry.histogram("llm_ttft_ms", "Time to first LLM token per Azure OpenAI deployment.", label="deployment")
+
+
+class LLMDeployment:
+    """One chat-completions target plus the rolling latency/error figures the router ranks by."""
+
+    def __init__(self, name: str, endpoint: str, api_key: str, api_version: str, label: str | None = None):
+        self.name = name
+        self.endpoint = endpoint.rstrip("/")
+        self.api_url = f"{self.endpoint}/openai/deployments/{name}/chat/completions?api-version={api_version}"
+        self.headers = {"api-key": api_key, "Content-Type": "application/json"}
+        self.label = label or name
+        self.ttft_ewma_ms: float | None = None
+        self.error_ewma = 0.0
+        self.cooldown_until = 0.0
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "hedges": 0, "hedge_wins": 0, "served": 0}
+
+    def record_first_token(self, ttft_ms: float):
+        ttft_histogram.observe(ttft_ms, self.label)
+        self.ttft_ewma_ms = ttft_ms if self.ttft_ewma_ms is None else self.ttft_ewma_ms + EWMA_ALPHA * (ttft_ms - self.ttft_ewma_ms)
+        self.error_ewma -= EWMA_ALPHA * self.error_ewma
+
+    def record_slow(self, elapsed_ms: float):
+        """Censored sample from a request cancelled before its first token; only raises the estimate."""
+        if self.ttft_ewma_ms is None or elapsed_ms > self.ttft_ewma_ms:
+            self.ttft_ewma_ms = elapsed_ms if self.ttft_ewma_ms is None else self.ttft_ewma_ms + EWMA_ALPHA * (elapsed_ms - self.ttft_ewma_ms)
+
+    def record_error(self, status: int | None = None, retry_after: float | None = None):
+        self.stats["errors"] += 1
+        self.error_ewma += EWMA_ALPHA * (1 - self.error_ewma)
+        if status == 429:
+            self.stats["throttled"] += 1
+            self.cooldown_until = time.monotonic() + (retry_after if retry_after is not None else LLM_THROTTLE_COOLDOWN)
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def score(self) -> float:
+        # Deployments without samples rank first so they get measured
+        return (self.ttft_ewma_ms or 0.0) * (1 + ERROR_PENALTY * self.error_ewma)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for this deployment's first token before hedging."""
+        delay_ms = LLM_HEDGE_DEFAULT_MS
+        if ttft_histogram.count(self.label) >= MIN_QUANTILE_SAMPLES:
+            delay_ms = ttft_histogram.quantile(LLM_HEDGE_QUANTILE, self.label)
+        return min(max(delay_ms, LLM_HEDGE_MIN_MS), LLM_HEDGE_MAX_MS) / 1000
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["ttft_ewma_ms"] = round(self.ttft_ewma_ms, 1) if self.ttft_ewma_ms is not None else None
+        stats["error_rate"] = round(self.error_ewma, 3)
+        stats["hedge_win_rate"] = round(self.stats["hedge_wins"] / self.stats["hedges"], 3) if self.stats["hedges"] else 0.0
+        stats["cooling_down"] = self.cooling_down
+        return stats
+
+
+def parse_deployments(endpoint: str, api_key: str, api_version: str, primary: str, extra: str = AZURE_OPENAI_DEPLOYMENTS) -> list[LLMDeployment]:
+    deployments = [LLMDeployment(primary, endpoint, api_key, api_version)]
+    for entry in filter(None, (part.strip() for part in extra.split(","))):
+        name, _, target = entry.partition("@")
+        target, _, key_env = target.partition("#")
+        key = os.getenv(key_env) if key_env else api_key
+        if not key:
+            raise ValueError(f"Missing API key for LLM deployment '{entry}' (environment variable {key_env}).")
+        label = f"{name}@{urlparse(target).netloc}" if target else name
+        deployments.append(LLMDeployment(name, target or endpoint, key, api_version, label))
+    return deployments
+
+
+class DeploymentRouter:
+    """Orders deployments by rolling TTFT and error rate; throttled deployments go last."""
+
+    def __init__(self, deployments: list[LLMDeployment], hedge_enabled: bool = LLM_HEDGE_ENABLED):
+        self.deployments = deployments
+        self.hedge_enabled = hedge_enabled and len(deployments) > 1
+
+    def ranked(self) -> list[LLMDeployment]:
+        return sorted(self.deployments, key=lambda d: (d.cooling_down, d.score()))
+
+    def get_stats(self) -> dict:
+        return {d.label: d.get_stats() for d in self.deployments}
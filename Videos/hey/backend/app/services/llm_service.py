@@ -1,8 +1,15 @@
 import os
+import time
 import asyncio
+import logging
 import aiohttp
 from dotenv import load_dotenv
-import json
+from .admission import llm_limiter
+from .warmup import probe_http
+from .http_client import http_clients
+from .metrics import registry
+from .sse import SSEParser, loads
+from .llm_router import LLMDeployment, DeploymentRouter, parse_deployments
  
 load_dotenv()
  
@@ -10,49 +17,262 @@ AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")  
 AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
- 
+# Ask for a trailing usage chunk (stream_options.include_usage; needs api-version 2024-09-01-preview or newer)
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "false").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+llm_stream_stats = {"streams": 0, "tokens": 0, "prompt_tokens": 0, "completion_tokens": 0, "parse_errors": 0, "hedges_shed": 0}
+finish_reasons: dict[str, int] = {}
+registry.register_collector("llm_stream", lambda: llm_stream_stats)
+registry.register_collector("llm_finish_reason", lambda: {reason: {"total": count} for reason, count in finish_reasons.items()}, label="reason")
+
+_END = object() # Queued by an attempt after its last token
+
+
+class LLMHTTPError(Exception):
+    def __init__(self, status: int, text: str, retry_after: float | None = None):
+        super().__init__(f"Azure OpenAI API call failed: {status}, {text}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _retry_after(headers) -> float | None:
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    try:
+        return float(headers["Retry-After"]) if headers.get("Retry-After") else None
+    except ValueError:
+        return None # HTTP-date form; fall back to the default cooldown
+
+
+class _Attempt:
+    """
+    One streaming request to one deployment. Tokens are buffered until the race picks a winner.
+
+    The caller has already taken an llm_limiter slot for it; the slot is released when the
+    upstream stream ends, so LLM_MAX_CONCURRENCY caps in-flight Azure streams, hedges included.
+    """
+
+    def __init__(self, service: "LLMService", session: aiohttp.ClientSession, deployment: LLMDeployment, payload: dict, hedge: bool = False):
+        self.deployment = deployment
+        self.hedge = hedge
+        self.metadata = {}
+        self.tokens: asyncio.Queue = asyncio.Queue()
+        self.error: Exception | None = None
+        self.lost = False
+        # Resolved on the first token, at the end of an empty stream, or on failure
+        self.first = asyncio.get_running_loop().create_future()
+        deployment.stats["requests"] += 1
+        if hedge:
+            deployment.stats["hedges"] += 1
+        self.task = asyncio.create_task(self._run(service, session, payload))
+        # A done callback rather than a finally in _run: a task cancelled before it ever ran skips its finally
+        self.task.add_done_callback(lambda _: llm_limiter.release())
+
+    async def _run(self, service: "LLMService", session: aiohttp.ClientSession, payload: dict):
+        started = time.perf_counter()
+        try:
+            async for token in service._stream(session, self.deployment, payload, self.metadata):
+                if not self.first.done():
+                    self.deployment.record_first_token((time.perf_counter() - started) * 1000)
+                    self.first.set_result(None)
+                self.tokens.put_nowait(token)
+        except asyncio.CancelledError:
+            if self.lost and not self.first.done():
+                # Lost the hedge race: its TTFT is at least this long, which is all the router needs to know
+                self.deployment.record_slow((time.perf_counter() - started) * 1000)
+            raise
+        except Exception as e:
+            self.error = e
+            self.deployment.record_error(getattr(e, "status", None), getattr(e, "retry_after", None))
+        finally:
+            self.tokens.put_nowait(_END)
+            if not self.first.done():
+                self.first.set_result(None)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.first.done() and self.error is None
+
+    def cancel(self, lost: bool = False):
+        if not self.task.done():
+            self.lost = lost
+            self.task.cancel()
+
+
 class LLMService:
-    def __init__(self):
+    def __init__(self, session: aiohttp.ClientSession | None = None):
         if not AZURE_OPENAI_API_KEY or not AZURE_OPENAI_ENDPOINT or not AZURE_OPENAI_DEPLOYMENT:
             raise ValueError("Missing Azure OpenAI configuration in environment variables.")
  
         self.api_key = AZURE_OPENAI_API_KEY
         self.endpoint = AZURE_OPENAI_ENDPOINT.rstrip("/")
         self.deployment = AZURE_OPENAI_DEPLOYMENT
-        self.api_url = f"{self.endpoint}/openai/deployments/{self.deployment}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
- 
-    async def get_response_stream(self, messages: list[dict[str, str]]):
-        headers = {
-            "api-key": self.api_key,
-            "Content-Type": "application/json"
-        }
+        # AZURE_OPENAI_DEPLOYMENT first, then any AZURE_OPENAI_DEPLOYMENTS (see services/llm_router.py)
+        self.router = DeploymentRouter(parse_deployments(self.endpoint, self.api_key, AZURE_OPENAI_API_VERSION, self.deployment))
+        # Shared pooled session (see services/http_client.py); falls back to a one-off session when unset.
+        self.session = session
  
+    async def get_response_stream(self, messages: list[dict[str, str]], metadata: dict | None = None):
+        """
+        Yield content deltas. When `metadata` is given it is filled in with `finish_reason`,
+        `model`, `deployment` and (with LLM_STREAM_USAGE) `usage` once the stream ends.
+
+        The request goes to the best-ranked deployment. If it fails before its first token the
+        next one is tried; if it is merely slow, a hedged request goes to the next one after the
+        primary's rolling TTFT quantile and whichever streams first wins, the other is cancelled.
+        """
         payload = {
             "messages": messages,
             "temperature": 0.7,
             "stream": True
         }
+        if LLM_STREAM_USAGE:
+            payload["stream_options"] = {"include_usage": True}
+        if metadata is None:
+            metadata = {}
  
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.api_url, headers=headers, json=payload) as resp:
-                if resp.status != 200:
-                    error_text = await resp.text()
-                    raise Exception(f"Azure OpenAI API call failed: {resp.status}, {error_text}")
- 
-                async for line in resp.content:
-                    if line:
-                        decoded = line.decode("utf-8").strip()
-                        if decoded.startswith("data: "):
-                            content = decoded[6:].strip()
-                            if content == "[DONE]":
-                                break
-                            try:
-                                data = json.loads(content)
-                                delta = data["choices"][0]["delta"]
-                                if "content" in delta:
-                                    yield delta["content"]
-                            except Exception as e:
-                                print(f"Streaming parse error: {e}")
+        llm_stream_stats["streams"] += 1
+        own_session = aiohttp.ClientSession() if self.session is None else None
+        attempts: list[_Attempt] = []
+        winner: _Attempt | None = None
+        try:
+            winner = await self._race(self.session or own_session, payload, attempts)
+            while (token := await winner.tokens.get()) is not _END:
+                llm_stream_stats["tokens"] += 1
+                yield token
+            if winner.error is not None:
+                raise winner.error # Failed mid-stream; too late to fail over
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+            if own_session is not None:
+                await own_session.close()
+            if winner is not None:
+                metadata.update(winner.metadata)
+                metadata["deployment"] = winner.deployment.label
+            reason = metadata.get("finish_reason")
+            if reason:
+                finish_reasons[reason] = finish_reasons.get(reason, 0) + 1
+            usage = metadata.get("usage")
+            if usage:
+                llm_stream_stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                llm_stream_stats["completion_tokens"] += usage.get("completion_tokens") or 0
+
+    async def _race(self, session: aiohttp.ClientSession, payload: dict, attempts: list[_Attempt]) -> _Attempt:
+        candidates = self.router.ranked()
+        primary = candidates.pop(0)
+        # Queues for a slot; raises OverloadedError when the LLM is saturated
+        await llm_limiter.acquire()
+        attempts.append(_Attempt(self, session, primary, payload))
+        hedge_at = time.perf_counter() + primary.hedge_delay() if self.router.hedge_enabled else None
+        while True:
+            winner = next((attempt for attempt in attempts if attempt.succeeded), None)
+            if winner is not None:
+                for attempt in attempts:
+                    if attempt is not winner:
+                        attempt.cancel(lost=True)
+                winner.deployment.stats["served"] += 1
+                if winner.hedge:
+                    winner.deployment.stats["hedge_wins"] += 1
+                return winner
+            live = [attempt for attempt in attempts if not attempt.first.done()]
+            if not live:
+                # Everything started so far failed before a first token: fail over to the next deployment
+                if not candidates:
+                    raise attempts[-1].error
+                logger.warning("LLM deployment %s failed (%s); failing over to %s", attempts[-1].deployment.label, attempts[-1].error, candidates[0].label)
+                await llm_limiter.acquire()
+                attempts.append(_Attempt(self, session, candidates.pop(0), payload))
+                continue
+            timeout = None
+            if hedge_at is not None and candidates:
+                timeout = hedge_at - time.perf_counter()
+                if timeout <= 0:
+                    hedge_at = None # At most one hedge per request
+                    if not await llm_limiter.try_acquire():
+                        # Saturated: shed the hedge, not the turn; the primary keeps streaming
+                        llm_stream_stats["hedges_shed"] += 1
+                        continue
+                    logger.info("No first token from %s after %.0fms; hedging to %s", primary.label, primary.hedge_delay() * 1000, candidates[0].label)
+                    attempts.append(_Attempt(self, session, candidates.pop(0), payload, hedge=True))
+                    continue
+            await asyncio.wait([attempt.first for attempt in live], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+    async def _stream(self, session: aiohttp.ClientSession, deployment: LLMDeployment, payload: dict, metadata: dict):
+        async with session.post(deployment.api_url, headers=deployment.headers, json=payload) as resp:
+            if resp.status != 200:
+                error_text = await resp.text()
+                raise LLMHTTPError(resp.status, error_text, _retry_after(resp.headers))
+
+            # Frames are parsed from raw network chunks; a data: event can span several chunks
+            parser = SSEParser()
+            async for chunk in resp.content.iter_any():
+                for data in parser.feed(chunk):
+                    if data == "[DONE]":
+                        return
+                    try:
+                        event = loads(data)
+                    except ValueError as e: # json and orjson decode errors are both ValueErrors
+                        llm_stream_stats["parse_errors"] += 1
+                        logger.warning("Unparseable LLM stream event (%s): %.200s", e, data)
+                        continue
+                    if "model" in event and event["model"]:
+                        metadata["model"] = event["model"]
+                    if event.get("usage"):
+                        metadata["usage"] = event["usage"]
+                    choices = event.get("choices")
+                    if not choices:
+                        continue # Azure's prompt_filter_results preamble and the usage-only chunk
+                    choice = choices[0]
+                    if choice.get("finish_reason"):
+                        metadata["finish_reason"] = choice["finish_reason"]
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        yield content
+
+    async def warm_up(self) -> str:
+        # Lists models instead of running a completion: opens the TLS connection without spending tokens
+        endpoints = {d.endpoint: d.headers["api-key"] for d in self.router.deployments}
+        results = await asyncio.gather(*(
+            probe_http(self.session, f"{endpoint}/openai/models?api-version={AZURE_OPENAI_API_VERSION}", headers={"api-key": key})
+            for endpoint, key in endpoints.items()
+        ))
+        return ", ".join(results)
+
+
+_shared_service: LLMService | None = None
+
+
+def get_llm_deployment_stats() -> dict:
+    return _shared_service.router.get_stats() if _shared_service is not None else {}
+
+
+registry.register_collector("llm_deployment", get_llm_deployment_stats, label="deployment")
+
+
+class UnavailableLLMService:
+    """Stands in for LLMService when its configuration is invalid, so each turn fails instead of the session."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    async def get_response_stream(self, messages: list[dict[str, str]], metadata: dict | None = None):
+        raise self.error
+        yield # Makes this an async generator, like LLMService.get_response_stream
+
+    async def warm_up(self) -> str:
+        raise self.error
+
+
+def get_llm_service() -> LLMService:
+    """The app-wide client, bound to the pooled LLM session once http_clients has started."""
+    global _shared_service
+    if _shared_service is None or _shared_service.session is not http_clients.llm.session:
+        _shared_service = LLMService(session=http_clients.llm.session)
+    return _shared_service
+
  
 async def main():
     llm_service = LLMService()
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# Log records are queued on the event loop thread and formatted/written by a background listener thread
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text") # text | json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "true").lower() == "true"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Per-category limits for high-volume lines, e.g. "nifi_payload=1,turn=20" (max lines per second)
+# and "transcript=0.1" (fraction of lines kept). Lines log a category with extra={"category": ...}.
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "nifi_payload=1")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+TEXT_FORMAT = '%(asctime)s.%(msecs)03d - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+log_stats = {"queued": 0, "dropped": 0, "rate_limited": 0, "sampled_out": 0}
+registry.register_collector("logging", lambda: log_stats)
+
+
+def _parse_limits(raw: str) -> dict[str, float]:
+    limits = {}
+    for part in raw.split(","):
+        if "=" in part:
+            category, value = part.split("=", 1)
+            limits[category.strip()] = float(value)
+    return limits
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `category` and `response_id` extras are kept as fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, DATE_FORMAT) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("category", "response_id"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class CategoryLimitFilter(logging.Filter):
+    """
+    Sampling and per-second rate limits for categorised log lines.
+
+    Runs on the calling thread before the record is queued, so suppressed lines cost a dict
+    lookup and nothing else. Warnings and errors are never suppressed.
+    """
+
+    def __init__(self, rate_limits: dict[str, float], sample_rates: dict[str, float], clock=time.monotonic):
+        super().__init__()
+        self.rate_limits = rate_limits
+        self.sample_rates = sample_rates
+        self._clock = clock
+        self._windows: dict[str, list] = {} # category -> [window_start, lines_in_window]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(category)
+        if rate is not None and random.random() >= rate:
+            log_stats["sampled_out"] += 1
+            return False
+        limit = self.rate_limits.get(category)
+        if limit is not None:
+            now = self._clock()
+            window = self._windows.get(category)
+            if window is None or now - window[0] >= 1.0:
+                window = self._windows[category] = [now, 0]
+            if window[1] >= limit:
+                log_stats["rate_limited"] += 1
+                return False
+            window[1] += 1
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener without formatting them.
+
+    The stock QueueHandler formats the message on the calling thread; here msg % args is left
+    to the listener. A full queue drops the record instead of blocking the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            log_stats["queued"] += 1
+        except queue.Full:
+            log_stats["dropped"] += 1
+
+
+def configure_logging(log_file: str) -> QueueListener:
+    """Route the root logger through a bounded queue; the returned listener owns the file/console I/O."""
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+    handlers = []
+    file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(formatter)
+    handlers.append(file_handler)
+    if LOG_CONSOLE:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(CategoryLimitFilter(_parse_limits(LOG_RATE_LIMITS), _parse_limits(LOG_SAMPLE_RATES)))
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL)
+    # Clear existing handlers if any from previous basicConfig calls (e.g., in testing)
+    if root_logger.hasHandlers():
+        root_logger.handlers.clear()
+    root_logger.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
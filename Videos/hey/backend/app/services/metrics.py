@@ -0,0 +1,133 @@
+import math
+import bisect
+
+# Latency buckets in milliseconds, tuned for voice turns (tens of ms up to several seconds)
+DEFAULT_BUCKETS_MS = (10, 25, 50, 75, 100, 150, 200, 300, 400, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """Cumulative-bucket histogram with an optional single label (e.g. stage), rendered in Prometheus format."""
+
+    def __init__(self, name: str, help_text: str, label: str | None = None, buckets=DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[str, _HistogramSeries] = {}
+
+    def observe(self, value: float, label_value: str = ""):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = _HistogramSeries(len(self.buckets))
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series.counts[index] += 1
+        series.sum += value
+        series.count += 1
+
+    def count(self, label_value: str = "") -> int:
+        series = self._series.get(label_value)
+        return series.count if series is not None else 0
+
+    def quantile(self, q: float, label_value: str = "") -> float | None:
+        """Bucket-interpolated quantile estimate, handy for logs and routing decisions."""
+        series = self._series.get(label_value)
+        if series is None or series.count == 0:
+            return None
+        rank = q * series.count
+        seen = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, series.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                return lower + (bound - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = bound
+        return float(self.buckets[-1])
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, series in sorted(self._series.items()):
+            base = {self.label: label_value} if self.label else {}
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series.counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels({**base, 'le': _format_value(float(bound))})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels({**base, 'le': '+Inf'})} {series.count}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(series.sum)}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-local metrics. Histograms are owned here; existing stats dicts are pulled in
+    through collectors at scrape time and exported as gauges.
+    """
+
+    def __init__(self, namespace: str = "voicebot"):
+        self.namespace = namespace
+        self._histograms: dict[str, Histogram] = {}
+        self._collectors: list[tuple[str, object, str | None]] = []
+
+    def histogram(self, name: str, help_text: str, label: str | None = None, buckets=DEFAULT_BUCKETS_MS) -> Histogram:
+        full_name = f"{self.namespace}_{name}"
+        if full_name not in self._histograms:
+            self._histograms[full_name] = Histogram(full_name, help_text, label, buckets)
+        return self._histograms[full_name]
+
+    def register_collector(self, prefix: str, collect, label: str | None = None):
+        """
+        `collect()` returns {metric: number}, or {label_value: {metric: number}} when `label` is given.
+        Non-numeric values are skipped.
+        """
+        self._collectors.append((prefix, collect, label))
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self._histograms.values():
+            lines.extend(histogram.render())
+        for prefix, collect, label in self._collectors:
+            stats = collect()
+            rows = stats.items() if label else [(None, stats)]
+            samples: dict[str, list[str]] = {}
+            for label_value, values in rows:
+                labels = {label: label_value} if label else {}
+                for key, value in values.items():
+                    if not isinstance(value, (int, float)):
+                        continue
+                    metric = f"{self.namespace}_{prefix}_{key}"
+                    samples.setdefault(metric, []).append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+            for metric, metric_lines in samples.items():
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(metric_lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,155 @@
+import time
+import asyncio
+import logging
+import aiohttp
+from .fastjson import dumps, loads
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+batch_size = registry.histogram(
+    "nifi_batch_size",
+    "Retrieval requests carried by one bulk NiFi call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+batch_queue_delay = registry.histogram(
+    "nifi_batch_queue_delay_ms",
+    "Time a retrieval request waited for its batch to be sent.",
+    buckets=(0.5, 1, 2, 5, 10, 20, 50, 100),
+)
+# Totals across all sessions in this worker
+batch_stats = {"batches": 0, "requests": 0, "deduplicated": 0, "cancelled": 0, "item_errors": 0, "batch_errors": 0, "pending": 0}
+registry.register_collector("nifi_batch", lambda: batch_stats)
+
+
+class NiFiBatcher:
+    """
+    Collects retrieval requests from every session for up to `window` seconds (or until
+    max_size are waiting) and sends them as one POST to a batch-capable NiFi endpoint:
+
+        request:  {"requests": [{"id": "0", "chatInput": "..."}, ...]}
+        response: {"responses": [{"id": "0", "messages": [...]}, {"id": "1", "error": "...", "status": 503}, ...]}
+
+    Identical transcripts in a batch are sent once. A failed bulk call fails every request in
+    it with the same exception; a per-item error with a status raises ClientResponseError for
+    that request only, so NiFiService's retry and breaker rules apply either way. Requests
+    cancelled before their batch goes out are dropped from it.
+    """
+
+    def __init__(self, url: str, timeout: aiohttp.ClientTimeout, window: float, max_size: int):
+        self.url = url
+        self.timeout = timeout
+        self.window = window
+        self.max_size = max_size
+        # transcript -> futures waiting on it, in arrival order; rebuilt for every batch
+        self._pending: dict[str, list[tuple[asyncio.Future, float]]] = {}
+        self._count = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._session: aiohttp.ClientSession | None = None
+        self._sends: set[asyncio.Task] = set() # In-flight bulk calls, held so they are not garbage-collected
+
+    async def submit(self, session: aiohttp.ClientSession | None, transcript: str) -> dict:
+        """The parsed `{"messages": [...]}` for `transcript`, once its batch has come back."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(transcript, []).append((future, time.perf_counter()))
+        self._count += 1
+        batch_stats["pending"] += 1
+        self._session = session
+        if self._count >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        batch_stats["pending"] -= self._count
+        self._count = 0
+        now = time.perf_counter()
+        batch = {}
+        for transcript, waiters in pending.items():
+            live = []
+            for future, submitted_at in waiters:
+                if future.cancelled(): # Barge-in or attempt deadline before the batch went out
+                    batch_stats["cancelled"] += 1
+                    continue
+                batch_queue_delay.observe((now - submitted_at) * 1000)
+                live.append(future)
+            if live:
+                batch[transcript] = live
+                batch_stats["deduplicated"] += len(live) - 1
+        if batch:
+            task = asyncio.create_task(self._send(self._session, batch))
+            self._sends.add(task)
+            task.add_done_callback(self._send_done)
+
+    def _send_done(self, task: asyncio.Task):
+        self._sends.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("NiFi batch send failed: %s", task.exception(), exc_info=task.exception())
+
+    async def _send(self, session: aiohttp.ClientSession | None, batch: dict[str, list[asyncio.Future]]):
+        try:
+            await self._deliver(session, batch)
+        finally:
+            # Whatever went wrong, no caller is left to wait out its attempt deadline
+            self._fail_all(batch, RuntimeError("NiFi batch ended without a result for this request"))
+
+    async def _deliver(self, session: aiohttp.ClientSession | None, batch: dict[str, list[asyncio.Future]]):
+        transcripts = list(batch)
+        batch_size.observe(len(transcripts))
+        batch_stats["batches"] += 1
+        batch_stats["requests"] += len(transcripts)
+        body = dumps({"requests": [{"id": str(i), "chatInput": transcript} for i, transcript in enumerate(transcripts)]})
+        try:
+            if session is not None:
+                request_info, history, items = await self._post(session, body)
+            else:
+                async with aiohttp.ClientSession() as own_session:
+                    request_info, history, items = await self._post(own_session, body)
+        except Exception as e:
+            batch_stats["batch_errors"] += 1
+            logger.warning("NiFi batch of %d failed: %s: %s", len(transcripts), type(e).__name__, e)
+            self._fail_all(batch, e)
+            return
+        for i, transcript in enumerate(transcripts):
+            result, error = self._parse_item(items.get(str(i)), i, request_info, history)
+            for future in batch[transcript]:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    @staticmethod
+    def _parse_item(item, i: int, request_info, history) -> tuple[dict | None, Exception | None]:
+        if not isinstance(item, dict):
+            return None, ValueError(f"NiFi batch response has no result for request {i}")
+        if "error" in item:
+            batch_stats["item_errors"] += 1
+            try:
+                status = int(item.get("status", 500))
+            except (TypeError, ValueError):
+                status = 500
+            return None, aiohttp.ClientResponseError(request_info, history, status=status, message=str(item["error"]))
+        if not isinstance(item.get("messages"), list):
+            batch_stats["item_errors"] += 1
+            return None, ValueError(f"NiFi batch result {i} has no 'messages' list")
+        return {"messages": item["messages"]}, None
+
+    @staticmethod
+    def _fail_all(batch: dict[str, list[asyncio.Future]], error: Exception):
+        for futures in batch.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _post(self, session: aiohttp.ClientSession, body: str):
+        async with session.post(self.url, headers={"Content-Type": "application/json"}, data=body, timeout=self.timeout) as response:
+            response.raise_for_status()
+            payload = loads(await response.read())
+        return response.request_info, response.history, {str(item.get("id")): item for item in payload["responses"] if isinstance(item, dict)}
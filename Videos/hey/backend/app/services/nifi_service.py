@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+from dotenv import load_dotenv
+from .admission import nifi_limiter
+from .warmup import probe_http
+from .metrics import registry
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .nifi_batcher import NiFiBatcher
+
+load_dotenv()
+
+NIFI_URL = os.getenv("NIFI_URL")
+# Per-attempt deadlines (seconds); these override the pool-wide NiFi timeouts for the retrieval call
+NIFI_CONNECT_TIMEOUT = float(os.getenv("NIFI_CONNECT_TIMEOUT", "2"))
+NIFI_FIRST_BYTE_TIMEOUT = float(os.getenv("NIFI_FIRST_BYTE_TIMEOUT", "4"))
+NIFI_ATTEMPT_TIMEOUT = float(os.getenv("NIFI_ATTEMPT_TIMEOUT", "5"))
+# Budget for the whole call including retries and backoff
+NIFI_DEADLINE = float(os.getenv("NIFI_DEADLINE", "8"))
+NIFI_MAX_RETRIES = int(os.getenv("NIFI_MAX_RETRIES", "1"))
+NIFI_RETRY_BACKOFF_MS = float(os.getenv("NIFI_RETRY_BACKOFF_MS", "200")) # Full jitter: sleep uniform(0, backoff * 2^attempt)
+NIFI_BREAKER_FAILURES = int(os.getenv("NIFI_BREAKER_FAILURES", "5"))
+NIFI_BREAKER_RESET_SECONDS = float(os.getenv("NIFI_BREAKER_RESET_SECONDS", "15"))
+# While NiFi is unreachable, answer from the LLM alone instead of failing the turn
+NIFI_FALLBACK_ENABLED = os.getenv("NIFI_FALLBACK_ENABLED", "false").lower() == "true"
+NIFI_FALLBACK_SYSTEM_PROMPT = os.getenv(
+    "NIFI_FALLBACK_SYSTEM_PROMPT",
+    "You are a helpful voice assistant. Our knowledge base is unavailable right now, so answer briefly "
+    "from general knowledge and say so if you are not sure.",
+)
+
+# Cross-session micro-batching: requests arriving within the window go out as one POST to a batch endpoint
+NIFI_BATCH_ENABLED = os.getenv("NIFI_BATCH_ENABLED", "false").lower() == "true"
+NIFI_BATCH_URL = os.getenv("NIFI_BATCH_URL", f"{NIFI_URL.rstrip('/')}/batch" if NIFI_URL else "")
+NIFI_BATCH_WINDOW_MS = float(os.getenv("NIFI_BATCH_WINDOW_MS", "5"))
+NIFI_BATCH_MAX_SIZE = int(os.getenv("NIFI_BATCH_MAX_SIZE", "32"))
+
+# Statuses a load balancer returns for a node that is down or overloaded; safe to retry a read-only lookup
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+
+logger = logging.getLogger(__name__)
+
+nifi_stats = {"requests": 0, "attempts": 0, "retries": 0, "connect_timeouts": 0, "first_byte_timeouts": 0, "deadline_timeouts": 0,
+              "errors": 0, "fallbacks": 0}
+nifi_breaker = CircuitBreaker("nifi", NIFI_BREAKER_FAILURES, NIFI_BREAKER_RESET_SECONDS)
+nifi_batcher = NiFiBatcher(
+    NIFI_BATCH_URL,
+    aiohttp.ClientTimeout(total=NIFI_ATTEMPT_TIMEOUT, sock_connect=NIFI_CONNECT_TIMEOUT, sock_read=NIFI_FIRST_BYTE_TIMEOUT),
+    window=NIFI_BATCH_WINDOW_MS / 1000,
+    max_size=NIFI_BATCH_MAX_SIZE,
+)
+
+
+def get_nifi_stats() -> dict:
+    return {**nifi_stats, **{f"breaker_{key}": value for key, value in nifi_breaker.get_stats().items()}}
+
+
+registry.register_collector("nifi", get_nifi_stats)
+
+
+class RetryableNiFiError(Exception):
+    """A failure that says nothing about the request itself: the next attempt may well succeed."""
+
+
+def fallback_messages(transcript: str) -> dict:
+    # "fallback" keeps these prompts out of the response cache
+    return {"messages": [{"role": "system", "content": NIFI_FALLBACK_SYSTEM_PROMPT}, {"role": "user", "content": transcript}],
+            "fallback": True}
+
+
+class NiFiService:
+    """Retrieval call to the NiFi flow. Returns the parsed `{"messages": [...]}` payload for the LLM."""
+
+    def __init__(self, session: aiohttp.ClientSession | None = None):
+        self.url = NIFI_URL
+        # Shared pooled session (see services/http_client.py); falls back to a one-off session when unset.
+        self.session = session
+
+    async def fetch_messages(self, transcript: str) -> dict:
+        """
+        POST the transcript with per-attempt deadlines and up to NIFI_MAX_RETRIES retries for
+        connection errors, timeouts and 429/502/503/504, all within NIFI_DEADLINE. Fails fast with
+        CircuitOpenError while the breaker is open, or returns fallback_messages() instead when
+        NIFI_FALLBACK_ENABLED is set. With NIFI_BATCH_ENABLED each attempt rides in a shared bulk
+        call (see services/nifi_batcher.py).
+        """
+        nifi_stats["requests"] += 1
+        body = json.dumps({"chatInput": transcript})
+        deadline = time.monotonic() + NIFI_DEADLINE
+        attempt = 0
+        while True:
+            try:
+                nifi_breaker.check()
+            except CircuitOpenError:
+                if NIFI_FALLBACK_ENABLED:
+                    return self._fallback(transcript, "circuit open")
+                raise
+            try:
+                return await self._attempt(transcript, body, deadline)
+            except RetryableNiFiError as e:
+                backoff = random.uniform(0, NIFI_RETRY_BACKOFF_MS * 2 ** attempt) / 1000
+                if attempt >= NIFI_MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                    if NIFI_FALLBACK_ENABLED:
+                        return self._fallback(transcript, str(e))
+                    raise e.__cause__ or e
+                attempt += 1
+                nifi_stats["retries"] += 1
+                logger.warning("NiFi attempt failed (%s); retry %d/%d in %.0fms", e, attempt, NIFI_MAX_RETRIES, backoff * 1000)
+                await asyncio.sleep(backoff)
+
+    def _fallback(self, transcript: str, reason: str) -> dict:
+        nifi_stats["fallbacks"] += 1
+        logger.warning("NiFi unavailable (%s); answering without retrieval", reason)
+        return fallback_messages(transcript)
+
+    async def _attempt(self, transcript: str, body: str, deadline: float) -> dict:
+        nifi_stats["attempts"] += 1
+        remaining = deadline - time.monotonic()
+        timeout = aiohttp.ClientTimeout(total=min(NIFI_ATTEMPT_TIMEOUT, remaining), sock_connect=NIFI_CONNECT_TIMEOUT,
+                                        sock_read=NIFI_FIRST_BYTE_TIMEOUT)
+        try:
+            async with nifi_limiter.slot(): # Raises OverloadedError when NiFi is saturated
+                if NIFI_BATCH_ENABLED:
+                    # The bulk call has its own timeouts; this request still gives up at its own deadline
+                    result = await asyncio.wait_for(nifi_batcher.submit(self.session, transcript), timeout.total)
+                elif self.session is not None:
+                    result = await self._post(self.session, body, timeout)
+                else:
+                    async with aiohttp.ClientSession() as session:
+                        result = await self._post(session, body, timeout)
+        except aiohttp.ConnectionTimeoutError as e:
+            raise self._failed("connect_timeouts", f"connect timeout after {NIFI_CONNECT_TIMEOUT}s") from e
+        except aiohttp.SocketTimeoutError as e:
+            raise self._failed("first_byte_timeouts", f"no response within {NIFI_FIRST_BYTE_TIMEOUT}s") from e
+        except asyncio.TimeoutError as e:
+            raise self._failed("deadline_timeouts", f"attempt deadline of {timeout.total:.1f}s exceeded") from e
+        except aiohttp.ClientResponseError as e:
+            if e.status in RETRYABLE_STATUSES:
+                raise self._failed("errors", f"HTTP {e.status}") from e
+            nifi_stats["errors"] += 1
+            if e.status >= 500:
+                nifi_breaker.record_failure()
+            else:
+                nifi_breaker.abandon() # NiFi is up; the request itself was rejected
+            raise
+        except aiohttp.ClientConnectionError as e:
+            raise self._failed("errors", f"connection error: {e}") from e
+        except BaseException:
+            nifi_breaker.abandon() # Cancelled, overloaded or an unparseable payload: says nothing about NiFi's health
+            raise
+        nifi_breaker.record_success()
+        return result
+
+    @staticmethod
+    def _failed(stat: str, reason: str) -> RetryableNiFiError:
+        nifi_stats[stat] += 1
+        nifi_breaker.record_failure()
+        return RetryableNiFiError(reason)
+
+    async def warm_up(self) -> str:
+        return await probe_http(self.session, self.url)
+
+    async def _post(self, session: aiohttp.ClientSession, body: str, timeout: aiohttp.ClientTimeout) -> dict:
+        async with session.post(self.url,
+            headers={"Content-Type": "application/json"},
+            data=body,
+            timeout=timeout,
+        ) as response:
+            response.raise_for_status()  # Raise an exception for bad status codes
+            raw_response_text = await response.text() # Read as plain text
+            # Optional: Log the received content type and raw text for debugging
+            logger.info("NIFI Raw Response (Content-Type: %s): %.500s...", response.headers.get('Content-Type', 'N/A'), raw_response_text, extra={"category": "nifi_payload"}) # Log first 500 chars
+
+        try:
+            # Attempt to parse the raw text as JSON
+            return json.loads(raw_response_text)
+        except json.JSONDecodeError as json_e:
+            logger.error("Failed to parse NIFI response as JSON: %s. Raw text: %.500s", json_e, raw_response_text, exc_info=True)
+            raise
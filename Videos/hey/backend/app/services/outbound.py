@@ -0,0 +1,229 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from dotenv import load_dotenv
+from .fastjson import dumps
+from .metrics import registry
+
+load_dotenv()
+
+# Per-session buffer between the turn logic and the browser socket
+OUTBOUND_QUEUE_MAX = int(os.getenv("OUTBOUND_QUEUE_MAX", "256"))
+# Window in which consecutive llm_response chunks of one answer are merged into a single frame; 0 disables
+OUTBOUND_COALESCE_MS = float(os.getenv("OUTBOUND_COALESCE_MS", "0"))
+# A single frame write taking longer than this marks the client as a slow consumer
+OUTBOUND_SEND_TIMEOUT = float(os.getenv("OUTBOUND_SEND_TIMEOUT", "5"))
+OUTBOUND_SLOW_POLICY = os.getenv("OUTBOUND_SLOW_POLICY", "disconnect") # disconnect | degrade
+
+DISCONNECT = "disconnect"
+DEGRADE = "degrade"
+
+# Informational frames a degraded session can live without; answers, halts and errors are never shed
+DROPPABLE_TYPES = frozenset({"transcript", "info", "warning", "stt_status"})
+
+logger = logging.getLogger(__name__)
+
+send_latency = registry.histogram(
+    "ws_send_latency_ms",
+    "Time from queueing a message for the browser until its frame was written.",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+# Totals across all sessions in this worker
+outbound_totals = {"messages_in": 0, "frames_sent": 0, "messages_coalesced": 0, "dropped_messages": 0, "queued_messages": 0,
+                   "slow_consumers": 0, "slow_disconnects": 0, "send_errors": 0}
+registry.register_collector("outbound", lambda: outbound_totals)
+
+
+class OutboundWriter:
+    """
+    Bounded per-session queue of JSON messages drained by one writer task.
+
+    send() never awaits, so token streaming, transcripts and halts never block on the client
+    socket, and frames leave in the order they were queued. A client that stops reading is a
+    slow consumer once the queue overflows or a single write stalls past send_timeout:
+    `disconnect` closes the socket (1008), `degrade` sheds informational frames, queued ones
+    included, to make room. Answer, halt and error frames are never shed: when nothing
+    droppable is left to make room for one, the client is disconnected even under `degrade`. With coalesce_ms > 0 the writer holds an
+    llm_response for that long and merges the chunks of the same answer that arrive meanwhile.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        max_messages: int = OUTBOUND_QUEUE_MAX,
+        coalesce_ms: float = OUTBOUND_COALESCE_MS,
+        send_timeout: float = OUTBOUND_SEND_TIMEOUT,
+        slow_policy: str = OUTBOUND_SLOW_POLICY,
+    ):
+        if slow_policy not in (DISCONNECT, DEGRADE):
+            raise ValueError(f"Unknown outbound slow-consumer policy '{slow_policy}'. Use '{DISCONNECT}' or '{DEGRADE}'.")
+        self.websocket = websocket
+        self.max_messages = max_messages
+        self.coalesce_ms = coalesce_ms
+        self.send_timeout = send_timeout
+        self.slow_policy = slow_policy
+        self._messages: deque[tuple[dict, float]] = deque()
+        self._not_empty = asyncio.Event()
+        self._closed = False
+        self.slow = False
+        self._task: asyncio.Task | None = None
+        self.stats = {"messages_in": 0, "frames_sent": 0, "messages_coalesced": 0, "dropped_messages": 0, "max_depth": 0, "max_send_ms": 0.0}
+
+    @property
+    def depth(self) -> int:
+        return len(self._messages)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def send(self, message: dict) -> bool:
+        """Queue a message for the browser. Returns False if it was dropped."""
+        if self._closed:
+            return False
+        droppable = message.get("type") in DROPPABLE_TYPES
+        if self.slow and droppable:
+            self._drop(1)
+            return False
+        if len(self._messages) >= self.max_messages:
+            self._on_slow_consumer(f"outbound queue full ({self.max_messages} messages)")
+            if self._closed or droppable:
+                self._drop(1)
+                return False
+            if not self._shed_droppable():
+                # Only answers, halts and errors are queued; dropping one would leave the client out of sync
+                self._disconnect()
+                self._drop(1)
+                return False
+        self._messages.append((message, time.perf_counter()))
+        self.stats["messages_in"] += 1
+        outbound_totals["messages_in"] += 1
+        outbound_totals["queued_messages"] += 1
+        if len(self._messages) > self.stats["max_depth"]:
+            self.stats["max_depth"] = len(self._messages)
+        self._not_empty.set()
+        return True
+
+    def _drop(self, count: int):
+        self.stats["dropped_messages"] += count
+        outbound_totals["dropped_messages"] += count
+
+    def _shed_droppable(self) -> bool:
+        """Remove queued informational messages; True if that freed any space."""
+        kept = deque(item for item in self._messages if item[0].get("type") not in DROPPABLE_TYPES)
+        removed = len(self._messages) - len(kept)
+        if removed:
+            self._messages = kept
+            self._drop(removed)
+            outbound_totals["queued_messages"] -= removed
+        return removed > 0
+
+    def _on_slow_consumer(self, reason: str):
+        if not self.slow:
+            self.slow = True
+            outbound_totals["slow_consumers"] += 1
+            logger.warning("Slow websocket consumer: %s; policy=%s", reason, self.slow_policy)
+        if self.slow_policy == DISCONNECT and not self._closed:
+            self._disconnect()
+
+    def _disconnect(self):
+        outbound_totals["slow_disconnects"] += 1
+        self._abort()
+        asyncio.create_task(self._close_socket(1008, "slow consumer"))
+
+    def _abort(self):
+        """Stop sending: whatever is still queued is dropped."""
+        self._closed = True
+        self._not_empty.set()
+        outbound_totals["queued_messages"] -= len(self._messages)
+        self._drop(len(self._messages))
+        self._messages.clear()
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), 1.0)
+        except Exception:
+            pass # The receive loop notices the disconnect either way
+
+    async def _coalesce(self, message: dict) -> dict:
+        if not self.coalesce_ms:
+            return message
+        await asyncio.sleep(self.coalesce_ms / 1000)
+        parts = [message["text"]]
+        while self._messages:
+            following = self._messages[0][0]
+            if following.get("type") != "llm_response" or following.get("response_id") != message.get("response_id"):
+                break
+            self._messages.popleft()
+            outbound_totals["queued_messages"] -= 1
+            parts.append(following["text"])
+        if len(parts) == 1:
+            return message
+        merged = len(parts) - 1
+        self.stats["messages_coalesced"] += merged
+        outbound_totals["messages_coalesced"] += merged
+        # Chunks are sentence/phrase segments without their joining whitespace
+        return {**message, "text": " ".join(part.strip() for part in parts if part)}
+
+    async def _run(self):
+        while True:
+            if not self._messages:
+                if self._closed:
+                    return
+                self._not_empty.clear()
+                await self._not_empty.wait()
+                continue
+            message, queued_at = self._messages.popleft()
+            outbound_totals["queued_messages"] -= 1
+            if message.get("type") == "llm_response":
+                message = await self._coalesce(message)
+            try:
+                frame = dumps(message)
+                started = time.perf_counter()
+                send = asyncio.ensure_future(self.websocket.send_text(frame))
+                done, _ = await asyncio.wait((send,), timeout=self.send_timeout)
+                if not done:
+                    self._on_slow_consumer(f"frame write stalled for more than {self.send_timeout}s")
+                    if self.slow_policy == DISCONNECT:
+                        send.cancel()
+                        return
+                await send
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Usually the browser went away; the receive loop tears the session down
+                outbound_totals["send_errors"] += 1
+                logger.debug("Error sending to client websocket: %s", e)
+                self._abort()
+                return
+            now = time.perf_counter()
+            send_latency.observe((now - queued_at) * 1000)
+            self.stats["max_send_ms"] = max(self.stats["max_send_ms"], (now - started) * 1000)
+            self.stats["frames_sent"] += 1
+            outbound_totals["frames_sent"] += 1
+
+    async def close(self, drain_timeout: float = 1.0):
+        """Stop accepting messages, give the writer a moment to flush, then stop it."""
+        self._closed = True
+        self._not_empty.set()
+        try:
+            if self._task is not None:
+                await asyncio.wait_for(self._task, drain_timeout)
+        except asyncio.TimeoutError:
+            pass # wait_for cancelled the writer; what it did not send is dropped below
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise # The caller is being cancelled (e.g. shutdown), not just the writer task
+        finally:
+            self._task = None
+            outbound_totals["queued_messages"] -= len(self._messages)
+            self._drop(len(self._messages))
+            self._messages.clear()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["depth"] = len(self._messages)
+        stats["slow"] = self.slow
+        return stats
@@ -0,0 +1,223 @@
+import os
+import time
+import uuid
+import random
+import struct
+import asyncio
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from .fastjson import dumps, loads
+from .metrics import registry
+
+load_dotenv()
+
+# Opt-in capture of whole sessions for replay (see loadtest/replay.py). Recordings hold the caller's
+# audio and transcripts: enable only where that is allowed, and sample rather than record everything.
+SESSION_RECORDING_ENABLED = os.getenv("SESSION_RECORDING_ENABLED", "false").lower() == "true"
+SESSION_RECORDING_SAMPLE_RATE = float(os.getenv("SESSION_RECORDING_SAMPLE_RATE", "1.0")) # Fraction of sessions recorded
+SESSION_RECORDING_DIR = os.getenv("SESSION_RECORDING_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "recordings"))
+SESSION_RECORDING_MAX_BYTES = int(os.getenv("SESSION_RECORDING_MAX_BYTES", str(64 * 1024 * 1024))) # ~4h of 32 kbit/s Opus
+SESSION_RECORDING_FLUSH_BYTES = int(os.getenv("SESSION_RECORDING_FLUSH_BYTES", "65536"))
+
+# File layout: MAGIC, then records of RECORD_HEADER (kind, ns since the session started, payload
+# length) followed by the payload. AUDIO is the raw client frame, LLM_TOKEN is a uint32 call id
+# and the UTF-8 text, every other kind is one JSON object.
+MAGIC = b"VBREC1\n"
+RECORD_HEADER = struct.Struct("<BQI")
+CALL_ID = struct.Struct("<I")
+
+META = 0
+AUDIO = 1          # binary frame from the browser
+CONTROL = 2        # text frame from the browser
+STT = 3            # Deepgram callback: {"event": "transcript" | "utterance_end" | "speech_started", ...}
+NIFI_START = 4     # {"call", "transcript"}
+NIFI_END = 5       # {"call", "result"} or {"call", "error"} / {"call", "cancelled"}
+LLM_START = 6      # {"call", "key"}
+LLM_TOKEN = 7
+LLM_END = 8        # {"call", "metadata"} or {"call", "error"} / {"call", "cancelled"}
+TRUNCATED = 9      # SESSION_RECORDING_MAX_BYTES reached; nothing follows
+
+KIND_NAMES = {META: "meta", AUDIO: "audio", CONTROL: "control", STT: "stt", NIFI_START: "nifi_start", NIFI_END: "nifi_end",
+              LLM_START: "llm_start", LLM_TOKEN: "llm_token", LLM_END: "llm_end", TRUNCATED: "truncated"}
+
+logger = logging.getLogger(__name__)
+
+recording_stats = {"sessions": 0, "bytes": 0, "truncated": 0, "write_errors": 0}
+registry.register_collector("recording", lambda: recording_stats)
+
+# One thread writes every recording in submission order, so file I/O never runs on the event loop
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-recorder")
+
+
+def llm_key(messages: list[dict]) -> str:
+    """What a replayed LLM call is matched on: the last user message of the prompt."""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content", ""))
+    return ""
+
+
+class SessionRecorder:
+    """
+    Append-only capture of one session: client audio and control frames, Deepgram callbacks,
+    NiFi results and LLM token streams, each stamped with time.monotonic_ns() since start.
+
+    record() only appends to an in-memory buffer; the buffer is handed to the writer thread every
+    SESSION_RECORDING_FLUSH_BYTES and on close(), so a crash loses at most that much.
+    """
+
+    def __init__(self, path: str, max_bytes: int = SESSION_RECORDING_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bytes = len(MAGIC)
+        self.truncated = False
+        self._started = time.monotonic_ns()
+        self._buffer = bytearray(MAGIC)
+        self._file = None # Only touched on the writer thread
+        self._next_call = 0
+        self._closed = False
+        recording_stats["sessions"] += 1
+        self.record_json(META, {"version": 1, "started_at": datetime.now(timezone.utc).isoformat(), "pid": os.getpid()})
+
+    def next_call(self) -> int:
+        """Id tying an upstream call's START, tokens and END records together."""
+        self._next_call += 1
+        return self._next_call
+
+    def record(self, kind: int, payload: bytes):
+        if self._closed or self.truncated:
+            return
+        size = RECORD_HEADER.size + len(payload)
+        if self.bytes + size > self.max_bytes:
+            self.truncated = True
+            recording_stats["truncated"] += 1
+            payload, size = b"", RECORD_HEADER.size
+            kind = TRUNCATED
+            logger.warning("Session recording %s reached %d bytes; stopped recording", self.path, self.max_bytes)
+        self._buffer += RECORD_HEADER.pack(kind, time.monotonic_ns() - self._started, len(payload))
+        self._buffer += payload
+        self.bytes += size
+        recording_stats["bytes"] += size
+        if len(self._buffer) >= SESSION_RECORDING_FLUSH_BYTES:
+            self._flush()
+
+    def record_json(self, kind: int, obj: dict):
+        self.record(kind, dumps(obj).encode())
+
+    def record_token(self, call: int, text: str):
+        self.record(LLM_TOKEN, CALL_ID.pack(call) + text.encode())
+
+    def _flush(self):
+        if self._buffer:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            _writer.submit(self._write, data)
+
+    def _write(self, data: bytes):
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "ab")
+            self._file.write(data)
+        except OSError as e:
+            recording_stats["write_errors"] += 1
+            logger.error("Could not write session recording %s: %s", self.path, e)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._flush()
+        await asyncio.wrap_future(_writer.submit(self._close_file))
+        logger.info("Session recording written to %s (%d bytes)", self.path, self.bytes)
+
+
+def open_recorder() -> SessionRecorder | None:
+    """A recorder for a new session, or None when recording is off or this session is not sampled."""
+    if not SESSION_RECORDING_ENABLED or random.random() >= SESSION_RECORDING_SAMPLE_RATE:
+        return None
+    name = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}.rec"
+    recorder = SessionRecorder(os.path.join(SESSION_RECORDING_DIR, name))
+    logger.info("Recording session to %s", recorder.path)
+    return recorder
+
+
+def read_recording(path: str):
+    """Yield (kind, t_ns, payload) for every record; JSON kinds are decoded, LLM_TOKEN as (call, text)."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        while header := f.read(RECORD_HEADER.size):
+            if len(header) < RECORD_HEADER.size:
+                return # Cut short by a crash mid-flush
+            kind, t_ns, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            if kind == AUDIO:
+                yield kind, t_ns, payload
+            elif kind == CONTROL:
+                yield kind, t_ns, payload.decode()
+            elif kind == LLM_TOKEN:
+                yield kind, t_ns, (CALL_ID.unpack_from(payload)[0], payload[CALL_ID.size:].decode())
+            else:
+                yield kind, t_ns, loads(payload) if payload else {}
+
+
+class RecordingNiFi:
+    """Wraps a session's NiFiService and records every fetch_messages() call and its outcome."""
+
+    def __init__(self, nifi_service, recorder: SessionRecorder):
+        self._nifi = nifi_service
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._nifi, name)
+
+    async def fetch_messages(self, transcript: str) -> dict:
+        call = self._recorder.next_call()
+        self._recorder.record_json(NIFI_START, {"call": call, "transcript": transcript})
+        try:
+            result = await self._nifi.fetch_messages(transcript)
+        except asyncio.CancelledError:
+            self._recorder.record_json(NIFI_END, {"call": call, "cancelled": True})
+            raise
+        except Exception as e:
+            self._recorder.record_json(NIFI_END, {"call": call, "error": f"{type(e).__name__}: {e}"})
+            raise
+        self._recorder.record_json(NIFI_END, {"call": call, "result": result})
+        return result
+
+
+class RecordingLLM:
+    """Wraps the LLM service for one session and records each stream's tokens as they arrive."""
+
+    def __init__(self, llm_service, recorder: SessionRecorder):
+        self._llm = llm_service
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    async def get_response_stream(self, messages: list[dict], metadata: dict | None = None):
+        call = self._recorder.next_call()
+        if metadata is None:
+            metadata = {}
+        self._recorder.record_json(LLM_START, {"call": call, "key": llm_key(messages)})
+        try:
+            async for token in self._llm.get_response_stream(messages, metadata=metadata):
+                self._recorder.record_token(call, token)
+                yield token
+        except (asyncio.CancelledError, GeneratorExit):
+            self._recorder.record_json(LLM_END, {"call": call, "cancelled": True})
+            raise
+        except Exception as e:
+            self._recorder.record_json(LLM_END, {"call": call, "error": f"{type(e).__name__}: {e}"})
+            raise
+        self._recorder.record_json(LLM_END, {"call": call, "metadata": metadata})
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .metrics import registry
+from .speculation import normalize_transcript
+
+load_dotenv()
+
+# Cache of NiFi payloads and finished LLM answers for repeated questions (FAQs, greetings)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "900"))
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    __slots__ = ("messages", "chunks", "size", "expires_at")
+
+    def __init__(self, messages: dict, expires_at: float):
+        self.messages = messages
+        self.chunks: list[str] | None = None  # set once a history-free answer finished streaming uninterrupted
+        self.size = len(json.dumps(messages).encode("utf-8"))
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache keyed by the normalized transcript, bounded by entry count and bytes held.
+
+    `generation` changes on every invalidate(); writers pass the generation they read
+    with so answers computed against an old knowledge base are never stored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.bytes = 0
+        self.generation = 0
+        self.stats = {"hits": 0, "answer_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, transcript: str) -> CacheEntry | None:
+        key = normalize_transcript(transcript)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry.expires_at <= self._clock():
+            self._remove(key)
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        if entry.chunks is not None:
+            self.stats["answer_hits"] += 1
+        return entry
+
+    def put_messages(self, transcript: str, messages: dict, generation: int):
+        if generation != self.generation:
+            return
+        key = normalize_transcript(transcript)
+        if not key:
+            return
+        entry = CacheEntry(messages, self._clock() + self.ttl_seconds)
+        if entry.size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        self._evict()
+
+    def put_chunks(self, transcript: str, chunks: list[str], generation: int):
+        if generation != self.generation:
+            return
+        key = normalize_transcript(transcript)
+        entry = self._entries.get(key)
+        if entry is None or entry.chunks is not None:
+            return
+        added = sum(len(chunk.encode("utf-8")) for chunk in chunks)
+        entry.chunks = list(chunks)
+        entry.size += added
+        self.bytes += added
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def invalidate(self) -> int:
+        """Drop everything, e.g. after the NiFi knowledge base was updated."""
+        removed = len(self._entries)
+        self._entries.clear()
+        self.bytes = 0
+        self.generation += 1
+        self.stats["invalidations"] += 1
+        logger.info(f"Response cache invalidated; dropped {removed} entries (generation {self.generation}).")
+        return removed
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.size
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["entries"] = len(self._entries)
+        stats["bytes"] = self.bytes
+        stats["generation"] = self.generation
+        return stats
+
+
+response_cache = ResponseCache()
+registry.register_collector("response_cache", response_cache.get_stats)
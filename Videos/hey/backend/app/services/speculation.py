@@ -0,0 +1,123 @@
+import os
+import re
+import asyncio
+import logging
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# Speculative prefetch: start NiFi (and optionally the LLM stream) once an interim
+# transcript has stopped changing for SPECULATION_STABLE_MS, before Deepgram's is_final.
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "false").lower() == "true"
+SPECULATION_STABLE_MS = float(os.getenv("SPECULATION_STABLE_MS", "300"))
+SPECULATION_PREFETCH_LLM = os.getenv("SPECULATION_PREFETCH_LLM", "false").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters, reported on /stats and /metrics
+speculation_stats = {
+    "started": 0,
+    "hits": 0,
+    "misses": 0,
+    "cancelled": 0,
+    "wasted_tokens": 0,
+}
+
+_NON_WORD = re.compile(r"[^\w\s']+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_transcript(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so interim and final transcripts compare equal."""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text.lower())).strip()
+
+
+class Speculation:
+    """
+    Upstream work started from a stable interim transcript.
+
+    NiFi messages (and LLM tokens, when prefetching the LLM) are buffered here and
+    never sent to the client until the session commits the speculation on a matching
+    final transcript.
+    """
+
+    def __init__(self, transcript: str, nifi_service, llm_service=None, prepare_messages=None):
+        self.transcript = transcript
+        self.key = normalize_transcript(transcript)
+        self.tokens: list[str] = []
+        self._new_token = asyncio.Event()
+        self._llm_done = False
+        self._nifi_task = asyncio.create_task(nifi_service.fetch_messages(transcript))
+        self._llm_task = asyncio.create_task(self._prefetch_llm(llm_service, prepare_messages)) if llm_service else None
+        for task in (self._nifi_task, self._llm_task):
+            # Mark failures as retrieved so abandoned speculative tasks don't log "never retrieved"
+            if task is not None:
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        speculation_stats["started"] += 1
+
+    def matches(self, transcript: str) -> bool:
+        return self.key == normalize_transcript(transcript)
+
+    @property
+    def has_llm_stream(self) -> bool:
+        return self._llm_task is not None
+
+    async def nifi_result(self) -> dict:
+        return await self._nifi_task
+
+    async def _prefetch_llm(self, llm_service, prepare_messages=None):
+        try:
+            message = await self._nifi_task
+            messages = prepare_messages(message["messages"]) if prepare_messages else message["messages"]
+            async for token in llm_service.get_response_stream(messages):
+                self.tokens.append(token)
+                self._new_token.set()
+        finally:
+            self._llm_done = True
+            self._new_token.set()
+
+    async def token_stream(self):
+        """Replay buffered tokens, then follow the still-running LLM stream."""
+        index = 0
+        try:
+            while True:
+                while index < len(self.tokens):
+                    yield self.tokens[index]
+                    index += 1
+                if self._llm_done:
+                    # Surface upstream errors to the caller the same way a direct stream would
+                    await self._llm_task
+                    return
+                self._new_token.clear()
+                await self._new_token.wait()
+        finally:
+            self._cancel_tasks()
+
+    def close(self):
+        """Cancel whatever upstream work is still running; a no-op once the stream was drained."""
+        self._cancel_tasks()
+
+    def _cancel_tasks(self):
+        for task in (self._nifi_task, self._llm_task):
+            if task is not None and not task.done():
+                task.cancel()
+
+    def commit(self):
+        speculation_stats["hits"] += 1
+
+    def cancel(self, miss: bool = True):
+        """Abandon the speculative work; tokens already generated are counted as wasted."""
+        self._cancel_tasks()
+        speculation_stats["misses" if miss else "cancelled"] += 1
+        speculation_stats["wasted_tokens"] += len(self.tokens)
+
+
+def get_speculation_stats() -> dict:
+    stats = dict(speculation_stats)
+    decided = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / decided, 3) if decided else 0.0
+    return stats
+
+
+registry.register_collector("speculation", get_speculation_stats)
@@ -0,0 +1,164 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+from dotenv import load_dotenv
+from starlette.responses import Response
+from .metrics import registry
+
+try:
+    import brotli # Optional: ~15-20% smaller than gzip for JS/CSS
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+# Files below this size are not worth compressing
+STATIC_COMPRESS_MIN_BYTES = int(os.getenv("STATIC_COMPRESS_MIN_BYTES", "1024"))
+# Vite puts a content hash in every emitted asset name, so those can be cached forever
+STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", "31536000"))
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/wasm", "application/xml")
+HASHED_NAME = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+ENCODING_SUFFIX = {"br": "-br", "gzip": "-gz", "identity": ""}
+
+logger = logging.getLogger(__name__)
+
+static_stats = {"files": 0, "bytes_identity": 0, "bytes_gzip": 0, "bytes_br": 0, "requests": 0, "not_modified": 0,
+                "not_found": 0, "served_br": 0, "served_gzip": 0, "served_identity": 0, "bytes_sent": 0}
+registry.register_collector("static", lambda: static_stats)
+
+
+def _accepted_encodings(header: str) -> dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+class StaticAsset:
+    __slots__ = ("content_type", "etag", "cache_control", "bodies")
+
+    def __init__(self, content_type: str, etag: str, cache_control: str, bodies: dict[str, bytes]):
+        self.content_type = content_type
+        self.etag = etag # Strong validator of the identity body, without quotes
+        self.cache_control = cache_control
+        self.bodies = bodies # encoding -> body; always has "identity"
+
+
+class StaticBundle:
+    """
+    The built frontend held in memory with gzip/brotli variants computed once at load().
+
+    Every response carries a strong ETag per encoding and answers If-None-Match with 304.
+    Content-hashed assets are cached for a year as immutable; everything else (index.html,
+    public/ files) is revalidated on each use.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self._assets: dict[str, StaticAsset] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._assets)
+
+    def load(self):
+        """Read and compress the whole bundle. CPU-bound; run it off the event loop."""
+        assets = {}
+        if not os.path.isdir(self.directory):
+            logger.warning(f"Frontend build not found at {self.directory}; run `npm run build` in Heygen-Video-Generator")
+            self._assets = assets
+            return
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    assets[path] = self._build(path, f.read())
+        self._assets = assets
+        static_stats["files"] = len(assets)
+        for encoding in ("identity", "gzip", "br"):
+            static_stats[f"bytes_{encoding}"] = sum(len(a.bodies[encoding]) for a in assets.values() if encoding in a.bodies)
+        logger.info(f"Loaded {len(assets)} frontend files ({static_stats['bytes_identity']} bytes) from {self.directory}")
+
+    @staticmethod
+    def _build(path: str, body: bytes) -> StaticAsset:
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "image/svg+xml"):
+            content_type += "; charset=utf-8"
+        bodies = {"identity": body}
+        if len(body) >= STATIC_COMPRESS_MIN_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+            # mtime=0 keeps the gzip bytes (and so the ETag) identical across restarts and workers
+            gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gzipped) < len(body):
+                bodies["gzip"] = gzipped
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    bodies["br"] = compressed
+        if path.startswith("assets/") and HASHED_NAME.search(path):
+            cache_control = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            cache_control = "no-cache"
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        return StaticAsset(content_type, etag, cache_control, bodies)
+
+    def response(self, path: str, headers, head: bool = False) -> Response | None:
+        """The response for `path`, or None if the bundle has no such file."""
+        asset = self._assets.get(path.lstrip("/"))
+        static_stats["requests"] += 1
+        if asset is None:
+            static_stats["not_found"] += 1
+            return None
+        encoding = self._choose_encoding(asset, headers.get("accept-encoding", ""))
+        etag = f'"{asset.etag}{ENCODING_SUFFIX[encoding]}"'
+        response_headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+        if self._not_modified(asset, headers.get("if-none-match")):
+            static_stats["not_modified"] += 1
+            return Response(status_code=304, headers=response_headers)
+        body = asset.bodies[encoding]
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        static_stats[f"served_{encoding}"] += 1
+        if head:
+            response_headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=response_headers, media_type=asset.content_type)
+        static_stats["bytes_sent"] += len(body)
+        return Response(content=body, headers=response_headers, media_type=asset.content_type)
+
+    @staticmethod
+    def _choose_encoding(asset: StaticAsset, accept_encoding: str) -> str:
+        if len(asset.bodies) == 1:
+            return "identity"
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in asset.bodies and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return "identity"
+
+    @staticmethod
+    def _not_modified(asset: StaticAsset, if_none_match: str | None) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/").strip('"')
+            # Any encoding of the same content is a match; the suffix only keeps caches from mixing bodies
+            for suffix in ENCODING_SUFFIX.values():
+                if tag == asset.etag + suffix:
+                    return True
+        return False
@@ -0,0 +1,87 @@
+import time
+import logging
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Marks recorded during a turn, in the order they normally happen
+MARKS = (
+    "turn_start",         # first interim transcript moved the session to LISTENING
+    "stt_first_interim",  # first non-empty transcript for this turn
+    "stt_final",          # final transcript that ended the user's turn
+    "nifi_start",
+    "nifi_end",
+    "llm_first_token",
+    "first_chunk_sent",   # first llm_response frame handed to the client socket
+    "turn_end",
+)
+_MARK_INDEX = {name: index for index, name in enumerate(MARKS)}
+
+# Histogram spans: stage label -> (start mark, end mark)
+SPANS = {
+    "stt_utterance": ("stt_first_interim", "stt_final"),
+    "final_to_nifi": ("stt_final", "nifi_start"),
+    "nifi": ("nifi_start", "nifi_end"),
+    "llm_first_token": ("nifi_end", "llm_first_token"),
+    "first_chunk": ("llm_first_token", "first_chunk_sent"),
+    "final_to_first_chunk": ("stt_final", "first_chunk_sent"),
+    "turn": ("turn_start", "turn_end"),
+}
+
+stage_latency = registry.histogram(
+    "stage_latency_ms",
+    "Per-turn latency between pipeline marks, by stage.",
+    label="stage",
+)
+turns_total = {"completed": 0, "interrupted": 0, "aborted": 0}
+registry.register_collector("turns", lambda: turns_total)
+
+
+class TurnTrace:
+    """
+    Monotonic timestamps for one user turn (one response_id). Feeds stage_latency when finished.
+
+    Marks live in a fixed list indexed by their position in MARKS (None = not reached yet), which
+    is about a third of the size of a string-keyed dict and never grows.
+    """
+
+    __slots__ = ("response_id", "marks", "finished", "llm_tokens")
+
+    def __init__(self, response_id: str):
+        self.response_id = response_id
+        self.marks: list[float | None] = [None] * len(MARKS)
+        self.marks[0] = time.perf_counter() # turn_start
+        self.finished = False
+        self.llm_tokens = 0 # LLM deltas received for this turn
+
+    def mark(self, name: str, once: bool = True, at: float | None = None) -> float:
+        """Record `name` now (or at perf_counter() value `at`). With once=True the first occurrence wins."""
+        now = time.perf_counter() if at is None else at
+        index = _MARK_INDEX[name]
+        if not once or self.marks[index] is None:
+            self.marks[index] = now
+        return now
+
+    def has(self, name: str) -> bool:
+        return self.marks[_MARK_INDEX[name]] is not None
+
+    def elapsed_ms(self, start: str, end: str) -> float | None:
+        started, ended = self.marks[_MARK_INDEX[start]], self.marks[_MARK_INDEX[end]]
+        if started is not None and ended is not None:
+            return (ended - started) * 1000
+        return None
+
+    def finish(self, outcome: str = "completed"):
+        """Close the trace once; observes every span whose two marks were recorded."""
+        if self.finished:
+            return
+        self.finished = True
+        self.mark("turn_end")
+        turns_total[outcome] = turns_total.get(outcome, 0) + 1
+        spans = {}
+        for stage, (start, end) in SPANS.items():
+            elapsed = self.elapsed_ms(start, end)
+            if elapsed is not None:
+                stage_latency.observe(elapsed, stage)
+                spans[stage] = round(elapsed, 2)
+        logger.info("Turn %s %s. Stage latency (ms): %s", self.response_id, outcome, spans, extra={"category": "turn"})
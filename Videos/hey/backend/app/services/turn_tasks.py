@@ -0,0 +1,110 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# How long a barge-in waits for cancelled NiFi/LLM work to unwind before moving on
+TURN_CANCEL_TIMEOUT = float(os.getenv("TURN_CANCEL_TIMEOUT", "0.5"))
+# Recently halted response ids remembered per session
+HALTED_IDS_RING = int(os.getenv("HALTED_IDS_RING", "32"))
+
+logger = logging.getLogger(__name__)
+
+# What barge-in cancellation saved. tokens_saved_estimate assumes an aborted answer would have
+# been as long as the average completed one.
+barge_in_stats = {
+    "cancelled_turns": 0,
+    "nifi_aborted": 0,
+    "llm_streams_aborted": 0,
+    "tokens_streamed_before_cancel": 0,
+    "tokens_saved_estimate": 0,
+}
+_completed_tokens = {"turns": 0, "tokens": 0}
+registry.register_collector("barge_in", lambda: barge_in_stats)
+
+
+class HaltedIds:
+    """
+    Bounded ring of a session's recently halted response ids.
+
+    The client keeps its own set, so halt frames only carry the ids it has not been sent yet
+    (take_unsent) instead of the whole history. The backend stops sending a turn's frames as
+    soon as it is halted, so ids older than the ring are never needed again.
+    """
+
+    __slots__ = ("_recent", "_unsent")
+
+    def __init__(self, size: int = HALTED_IDS_RING):
+        self._recent: deque[str] = deque(maxlen=size)
+        self._unsent: list[str] = []
+
+    def add(self, response_id: str):
+        self._recent.append(response_id)
+        self._unsent.append(response_id)
+
+    def take_unsent(self) -> list[str]:
+        unsent, self._unsent = self._unsent, []
+        return unsent
+
+    def __contains__(self, response_id: str) -> bool:
+        return response_id in self._recent
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+
+class TurnTaskGroup:
+    """The tasks doing upstream work for one session's current turn, cancelled together on barge-in."""
+
+    def __init__(self):
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def active(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def cancel(self, timeout: float = TURN_CANCEL_TIMEOUT):
+        """Cancel every running task and wait (bounded) for their finally blocks to close upstream sockets."""
+        tasks = [task for task in self._tasks if not task.done()]
+        self._tasks.clear()
+        if not tasks:
+            return
+        for task in tasks:
+            task.cancel()
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning("%d turn task(s) still unwinding %ss after cancellation", len(pending), timeout)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Turn task failed while being cancelled: %s", task.exception())
+
+
+def record_cancelled_turn(trace):
+    """Account for a turn that was cut off by a barge-in, using the marks on its TurnTrace."""
+    barge_in_stats["cancelled_turns"] += 1
+    if trace is None:
+        return
+    if trace.has("nifi_start") and not trace.has("nifi_end"):
+        barge_in_stats["nifi_aborted"] += 1
+    elif trace.has("nifi_end"):
+        barge_in_stats["llm_streams_aborted"] += 1
+        barge_in_stats["tokens_streamed_before_cancel"] += trace.llm_tokens
+        if _completed_tokens["turns"]:
+            average = _completed_tokens["tokens"] / _completed_tokens["turns"]
+            barge_in_stats["tokens_saved_estimate"] += max(0, round(average - trace.llm_tokens))
+
+
+def record_completed_turn(trace):
+    if trace is not None and trace.llm_tokens:
+        _completed_tokens["turns"] += 1
+        _completed_tokens["tokens"] += trace.llm_tokens
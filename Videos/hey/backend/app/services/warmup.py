@@ -0,0 +1,103 @@
+import os
+import time
+import asyncio
+import logging
+import aiohttp
+from dotenv import load_dotenv
+from .metrics import registry
+
+load_dotenv()
+
+# Upstream warm-up after boot. Probes retry every WARMUP_RETRY_INTERVAL seconds until they pass.
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+
+PENDING = "pending"
+OK = "ok"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+async def probe_http(session: aiohttp.ClientSession, url: str, headers: dict | None = None) -> str:
+    """
+    Cheap request that leaves a TLS connection to the upstream in the keep-alive pool.
+
+    Any answer proves the host is reachable (NiFi typically replies 405 to GET); only server
+    errors and auth failures count as failed.
+    """
+    async with session.get(url, headers=headers) as resp:
+        await resp.read()
+        if resp.status >= 500 or resp.status in (401, 403):
+            raise RuntimeError(f"HTTP {resp.status}")
+        return f"HTTP {resp.status}"
+
+
+class UpstreamWarmup:
+    """Runs the registered probes in the background after startup; the worker is ready once all pass."""
+
+    def __init__(self, timeout: float = WARMUP_TIMEOUT, retry_interval: float = WARMUP_RETRY_INTERVAL):
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._probes = {} # name -> async () -> str
+        self.checks: dict[str, dict] = {}
+        self._task: asyncio.Task | None = None
+        self.started_at: float | None = None
+        self.ready_after_ms: float | None = None
+
+    def add(self, name: str, probe):
+        self._probes[name] = probe
+        self.checks[name] = {"state": PENDING, "detail": None, "latency_ms": None, "attempts": 0}
+
+    def start(self):
+        if self._task is None:
+            self.started_at = time.perf_counter()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def ready(self) -> bool:
+        return all(check["state"] == OK for check in self.checks.values())
+
+    async def _check(self, name: str):
+        check = self.checks[name]
+        check["attempts"] += 1
+        started = time.perf_counter()
+        try:
+            check["detail"] = await asyncio.wait_for(self._probes[name](), self.timeout)
+            check["state"] = OK
+        except asyncio.TimeoutError:
+            check["state"] = FAILED
+            check["detail"] = f"timed out after {self.timeout}s"
+        except Exception as e:
+            check["state"] = FAILED
+            check["detail"] = str(e) or type(e).__name__
+        check["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if check["state"] == FAILED:
+            logger.warning(f"Warm-up of {name} failed (attempt {check['attempts']}): {check['detail']}")
+
+    async def _run(self):
+        while True:
+            pending = [name for name, check in self.checks.items() if check["state"] != OK]
+            if not pending:
+                break
+            await asyncio.gather(*(self._check(name) for name in pending))
+            if not self.ready:
+                await asyncio.sleep(self.retry_interval)
+        self.ready_after_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+        logger.info(f"Upstream warm-up complete in {self.ready_after_ms}ms: {', '.join(self.checks)}")
+
+    def get_status(self) -> dict:
+        return {"ready": self.ready, "ready_after_ms": self.ready_after_ms, "checks": self.checks}
+
+
+warmup = UpstreamWarmup()
+registry.register_collector("upstream_ready", lambda: {name: int(check["state"] == OK) for name, check in warmup.checks.items()})
@@ -1,20 +1,116 @@
+import time
+import asyncio
+import logging
 from enum import Enum
+from .types import EventType
+from .services.metrics import registry
 
 class VoiceBotState(Enum):
     IDLE = "Idle"
     LISTENING = "Listening"
     RESPONDING = "Responding"
 
-# Based on your image/description:
 # Events:
 # 1. Deepgram powered -> transcript not null + is_final = False (interruption_started)
-# 2. Deepgram powered -> transcript not null + is_final = True (interruption_completed)
+# 2. Deepgram powered -> end of the user's turn (interruption_ended)
 # 3. Response completed (LLM + TTS cycle finished)
+#
+# (state, event) -> (new state, action, guard). Action and guard name methods of the session;
+# a missing guard always passes, a missing action only changes state. Pairs not listed are rejected.
+TRANSITIONS = {
+    (VoiceBotState.IDLE, EventType.INTERRUPTION_STARTED): (VoiceBotState.LISTENING, "on_turn_started", None),
+    (VoiceBotState.RESPONDING, EventType.INTERRUPTION_STARTED): (VoiceBotState.LISTENING, "on_turn_started", None), # Barge-in
+    (VoiceBotState.LISTENING, EventType.INTERRUPTION_STARTED): (VoiceBotState.LISTENING, None, None), # More interim results
+    (VoiceBotState.LISTENING, EventType.INTERRUPTION_ENDED): (VoiceBotState.RESPONDING, "on_turn_ended", None),
+    (VoiceBotState.RESPONDING, EventType.RESPONSE_COMPLETED): (VoiceBotState.IDLE, "on_response_completed", "is_current_response"),
+}
 
-# Transitions:
-# Given State | Event                 | New State
-#----------------------------------------------------
-# Idle        | interruption_started  | Listening
-# Listening   | interruption_started  | Listening  (Interim results)
-# Listening   | interruption_completed| Responding (Process final transcript)
-# Responding  | response_completed    | Idle
+logger = logging.getLogger(__name__)
+
+event_queue_lag = registry.histogram(
+    "event_queue_lag_ms",
+    "Time a session event waited in the actor queue before its transition ran.",
+    label="event",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+# Totals across all sessions in this worker
+transition_stats = {"events": 0, "transitions": 0, "rejected": 0, "handler_errors": 0, "queued": 0, "max_queue_depth": 0}
+rejected_transitions: dict[str, int] = {} # "state:event" -> count
+registry.register_collector("state_events", lambda: transition_stats)
+registry.register_collector("state_rejected", lambda: {key: {"total": count} for key, count in rejected_transitions.items()}, label="transition")
+
+
+class StateMachineActor:
+    """
+    One session's event queue and the single consumer task that applies TRANSITIONS in order.
+
+    post() never blocks, so STT callbacks and turn tasks only enqueue. Each event is looked up
+    in a table bound to the session at construction (one dict lookup per event), the new state
+    is set, then the action is awaited before the next event is taken: a barge-in finishes
+    cancelling the previous turn before the following INTERRUPTION_ENDED can start a new one.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._table = {
+            key: (target, getattr(session, action) if action else None, getattr(session, guard) if guard else None)
+            for key, (target, action, guard) in TRANSITIONS.items()
+        }
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._queued_types: dict[str, int] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def post(self, event):
+        self._queue.put_nowait((event, time.perf_counter()))
+        self._queued_types[event.type] = self._queued_types.get(event.type, 0) + 1
+        transition_stats["queued"] += 1
+        if self._queue.qsize() > transition_stats["max_queue_depth"]:
+            transition_stats["max_queue_depth"] = self._queue.qsize()
+
+    async def _run(self):
+        while True:
+            event, posted_at = await self._queue.get()
+            self._queued_types[event.type] -= 1
+            transition_stats["queued"] -= 1
+            transition_stats["events"] += 1
+            event_queue_lag.observe((time.perf_counter() - posted_at) * 1000, event.type)
+            await self.dispatch(event)
+
+    def queued(self, event_type: str) -> int:
+        """Events of this type posted but not yet taken off the queue."""
+        return self._queued_types.get(event_type, 0)
+
+    async def dispatch(self, event):
+        state = self.session.current_state
+        entry = self._table.get((state, event.type))
+        if entry is None or (entry[2] is not None and not entry[2](event)):
+            transition_stats["rejected"] += 1
+            key = f"{state.name.lower()}:{event.type}"
+            rejected_transitions[key] = rejected_transitions.get(key, 0) + 1
+            return
+        target, action, _ = entry
+        transition_stats["transitions"] += 1
+        self.session.current_state = target
+        if action is not None:
+            try:
+                await action(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                transition_stats["handler_errors"] += 1
+                logger.exception("Error handling %s in state %s: %s", event.type, state.name, e)
+
+    async def close(self):
+        """Stop consuming; events still queued are dropped."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        transition_stats["queued"] -= self._queue.qsize()
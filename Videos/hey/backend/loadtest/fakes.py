@@ -0,0 +1,246 @@
+"""
+Local stand-ins for Deepgram live STT, the NiFi flow and Azure OpenAI chat completions.
+
+Run from backend/:
+    python -m loadtest.fakes --port 9100
+
+and point the app at it:
+    DEEPGRAM_URL=http://127.0.0.1:9100  DEEPGRAM_API_KEY=fake
+    NIFI_URL=http://127.0.0.1:9100/nifi   (NIFI_BATCH_ENABLED=true uses /nifi/batch)
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:9100  AZURE_OPENAI_API_KEY=fake
+    AZURE_OPENAI_DEPLOYMENT=fake  AZURE_OPENAI_API_VERSION=2024-02-01
+
+The Deepgram socket ignores the audio content. Once the first audio frame arrives it plays a
+script: for each utterance, one interim per word, a final with speech_final, an UtteranceEnd,
+then a pause while the bot answers. Everything is paced by FakeConfig. With
+--deepgram-drop-after-ms each Deepgram socket is closed with 1011 that long after its first
+audio frame, to exercise the app's reconnect and audio replay.
+"""
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass, field
+from aiohttp import web, WSMsgType
+
+DEFAULT_UTTERANCES = [
+    "what are your opening hours",
+    "do you deliver on weekends",
+    "how can i reset my password",
+    "tell me about the premium plan",
+]
+DEFAULT_ANSWER = (
+    "Thanks for asking. Our support team is available every day from nine to six. "
+    "You can also reach us by email at any time, and we usually reply within a few hours. "
+    "Is there anything else I can help you with today?"
+)
+
+
+@dataclass
+class FakeConfig:
+    utterances: list[str] = field(default_factory=lambda: list(DEFAULT_UTTERANCES))
+    interim_ms: float = 120 # Delay between interim transcripts (one per word)
+    final_ms: float = 300 # Delay between the last interim and the final
+    pause_ms: float = 4000 # Silence after each utterance while the bot answers
+    nifi_ms: float = 150 # NiFi response time
+    llm_first_token_ms: float = 300 # Time to first token
+    deployment_first_token_ms: dict[str, float] = field(default_factory=dict) # Per-deployment override, e.g. a slow region
+    tokens_per_second: float = 50
+    deepgram_drop_after_ms: float = 0 # Close each Deepgram socket abnormally this long after its first audio (0 = never)
+    answer: str = DEFAULT_ANSWER
+
+
+stats = {"dg_connections": 0, "dg_audio_frames": 0, "dg_audio_bytes": 0, "dg_webm_starts": 0, "dg_drops": 0, "nifi_requests": 0, "nifi_batches": 0, "llm_requests": 0}
+WEBM_MAGIC = bytes.fromhex("1a45dfa3")
+
+
+def _metadata(request_id: str) -> dict:
+    return {"request_id": request_id, "model_info": {"name": "fake", "version": "0", "arch": "fake"}, "model_uuid": "fake"}
+
+
+def _results(request_id: str, transcript: str, start: float, duration: float, is_final: bool, speech_final: bool) -> str:
+    return json.dumps({
+        "type": "Results",
+        "channel_index": [0, 1],
+        "duration": duration,
+        "start": start,
+        "is_final": is_final,
+        "speech_final": speech_final,
+        "from_finalize": False,
+        "channel": {"alternatives": [{"transcript": transcript, "confidence": 0.99, "words": []}]},
+        "metadata": _metadata(request_id),
+    })
+
+
+async def _play_script(ws: web.WebSocketResponse, config: FakeConfig, request_id: str):
+    stream_time = 0.0
+    while not ws.closed:
+        for utterance in config.utterances:
+            words = utterance.split()
+            await ws.send_str(json.dumps({"type": "SpeechStarted", "channel": [0, 1], "timestamp": stream_time}))
+            for i in range(1, len(words) + 1):
+                await asyncio.sleep(config.interim_ms / 1000)
+                await ws.send_str(_results(request_id, " ".join(words[:i]), stream_time, i * 0.3, False, False))
+            await asyncio.sleep(config.final_ms / 1000)
+            duration = len(words) * 0.3
+            await ws.send_str(_results(request_id, utterance, stream_time, duration, True, True))
+            stream_time += duration
+            await ws.send_str(json.dumps({"type": "UtteranceEnd", "channel": [0, 1], "last_word_end": stream_time}))
+            await asyncio.sleep(config.pause_ms / 1000)
+
+
+async def deepgram_listen(request: web.Request) -> web.WebSocketResponse:
+    config: FakeConfig = request.app["config"]
+    ws = web.WebSocketResponse(heartbeat=None)
+    await ws.prepare(request)
+    stats["dg_connections"] += 1
+    request_id = str(uuid.uuid4())
+    script: asyncio.Task | None = None
+    drop: asyncio.TimerHandle | None = None
+    try:
+        async for msg in ws:
+            if msg.type == WSMsgType.BINARY:
+                stats["dg_audio_frames"] += 1
+                stats["dg_audio_bytes"] += len(msg.data)
+                if script is None:
+                    # A decoder can only start on the container header, so count streams that begin with one
+                    stats["dg_webm_starts"] += msg.data.startswith(WEBM_MAGIC)
+                    script = asyncio.create_task(_play_script(ws, config, request_id))
+                    if config.deepgram_drop_after_ms:
+                        drop = asyncio.get_running_loop().call_later(config.deepgram_drop_after_ms / 1000, _drop, ws)
+            elif msg.type == WSMsgType.TEXT:
+                control = json.loads(msg.data)
+                if control.get("type") == "CloseStream":
+                    await ws.send_str(json.dumps({"type": "Metadata", "transaction_key": "fake", "request_id": request_id,
+                                                  "sha256": "", "created": "", "duration": 0.0, "channels": 1,
+                                                  "models": [], "model_info": {}}))
+                    break
+                # KeepAlive needs no reply
+    finally:
+        if script is not None:
+            script.cancel()
+        if drop is not None:
+            drop.cancel()
+        await ws.close()
+    return ws
+
+
+def _drop(ws: web.WebSocketResponse):
+    stats["dg_drops"] += 1
+    asyncio.create_task(ws.close(code=1011, message=b"fake network error"))
+
+
+def _nifi_messages(transcript: str) -> list[dict]:
+    return [
+        {"role": "system", "content": "You are a helpful voice assistant. Answer in two or three sentences."},
+        {"role": "user", "content": transcript},
+    ]
+
+
+async def nifi(request: web.Request) -> web.Response:
+    config: FakeConfig = request.app["config"]
+    stats["nifi_requests"] += 1
+    body = await request.json()
+    await asyncio.sleep(config.nifi_ms / 1000)
+    return web.json_response({"messages": _nifi_messages(body.get("chatInput", ""))})
+
+
+async def nifi_batch(request: web.Request) -> web.Response:
+    # Same lookup for every item; one round trip for the whole batch
+    config: FakeConfig = request.app["config"]
+    stats["nifi_batches"] += 1
+    body = await request.json()
+    stats["nifi_requests"] += len(body["requests"])
+    await asyncio.sleep(config.nifi_ms / 1000)
+    return web.json_response({"responses": [{"id": item["id"], "messages": _nifi_messages(item.get("chatInput", ""))}
+                                            for item in body["requests"]]})
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    config: FakeConfig = request.app["config"]
+    stats["llm_requests"] += 1
+    body = await request.json()
+    if not body.get("stream"):
+        # The app always streams; answer plain completions too so ad-hoc curl checks against the fake work
+        return web.json_response({"id": "fake", "object": "chat.completion", "created": int(time.time()),
+                                  "choices": [{"index": 0, "message": {"role": "assistant", "content": "pong"}, "finish_reason": "stop"}]})
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    first_token_ms = config.deployment_first_token_ms.get(request.match_info["deployment"], config.llm_first_token_ms)
+    await asyncio.sleep(first_token_ms / 1000)
+    interval = 1 / config.tokens_per_second
+    words = config.answer.split(" ")
+    try:
+        for i, word in enumerate(words):
+            token = word if i == 0 else " " + word
+            chunk = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            await asyncio.sleep(interval)
+        final = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        await response.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+    except ConnectionResetError:
+        pass # The app cancelled the stream (barge-in or a lost hedge)
+    return response
+
+
+async def get_stats(request: web.Request) -> web.Response:
+    return web.json_response(stats)
+
+
+def create_app(config: FakeConfig | None = None) -> web.Application:
+    app = web.Application()
+    app["config"] = config or FakeConfig()
+    app.router.add_get("/v1/listen", deepgram_listen)
+    app.router.add_post("/nifi", nifi)
+    app.router.add_post("/nifi/batch", nifi_batch)
+    app.router.add_post("/openai/deployments/{deployment}/chat/completions", chat_completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+async def start_fakes(host: str, port: int, config: FakeConfig | None = None) -> web.AppRunner:
+    runner = web.AppRunner(create_app(config), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    defaults = FakeConfig()
+    parser.add_argument("--interim-ms", type=float, default=defaults.interim_ms)
+    parser.add_argument("--final-ms", type=float, default=defaults.final_ms)
+    parser.add_argument("--pause-ms", type=float, default=defaults.pause_ms)
+    parser.add_argument("--nifi-ms", type=float, default=defaults.nifi_ms)
+    parser.add_argument("--llm-first-token-ms", type=float, default=defaults.llm_first_token_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--deepgram-drop-after-ms", type=float, default=defaults.deepgram_drop_after_ms)
+    parser.add_argument("--deployment-first-token-ms", action="append", default=[], metavar="DEPLOYMENT=MS",
+                        help="Override the time to first token for one deployment (repeatable)")
+
+
+def config_from_args(args: argparse.Namespace) -> FakeConfig:
+    return FakeConfig(
+        interim_ms=args.interim_ms,
+        final_ms=args.final_ms,
+        pause_ms=args.pause_ms,
+        nifi_ms=args.nifi_ms,
+        llm_first_token_ms=args.llm_first_token_ms,
+        tokens_per_second=args.tokens_per_second,
+        deepgram_drop_after_ms=args.deepgram_drop_after_ms,
+        deployment_first_token_ms={name: float(ms) for name, _, ms in (item.partition("=") for item in args.deployment_first_token_ms)},
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Deepgram / NiFi / Azure OpenAI servers for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(config_from_args(args)), host=args.host, port=args.port, access_log=None)
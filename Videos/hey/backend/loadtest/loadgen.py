@@ -0,0 +1,326 @@
+"""
+Drives N concurrent browser-like clients against /ws/voice and reports latency, throughput and
+server CPU/memory per session.
+
+Against an already running app (started with the env from loadtest/fakes.py):
+    python -m loadtest.loadgen --url ws://127.0.0.1:8000/ws/voice --clients 50 --duration 60
+
+Or let it start the fakes and `uvicorn app.main:app --workers W` itself (run from backend/):
+    python -m loadtest.loadgen --spawn --workers 2 --clients 200 --duration 120
+
+Each client sends a recorded WebM/Opus file (--audio) in MediaRecorder-sized slices every
+--frame-ms, like the frontend's mediaRecorder.start(100), or synthetic frames when no file is
+given; the fake Deepgram does not decode audio. Client-side latencies are measured from the
+final transcript message to the first/last llm_response of the same response_id. Server stage
+percentiles come from /metrics, which is per worker process, so they are exact only with --workers 1.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+import aiohttp
+from .fakes import start_fakes, stats as fake_stats, add_config_arguments, config_from_args
+
+WEBM_HEADER = bytes.fromhex("1a45dfa3") # EBML magic; the first MediaRecorder chunk carries the container header
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: list[float]) -> dict:
+    stats = {"count": len(values)}
+    for name, q in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0)):
+        value = percentile(values, q)
+        stats[name] = round(value, 1) if value is not None else None
+    return stats
+
+
+def load_frames(path: str | None, frame_bytes: int) -> list[bytes]:
+    """Slice a recording into frontend-sized chunks; the first slice keeps the WebM header."""
+    if path:
+        with open(path, "rb") as f:
+            data = f.read()
+    else:
+        data = WEBM_HEADER + os.urandom(frame_bytes * 50 - len(WEBM_HEADER))
+    return [data[i:i + frame_bytes] for i in range(0, len(data), frame_bytes)]
+
+
+class ClientResult:
+    def __init__(self):
+        self.connected = False
+        self.connect_ms: float | None = None
+        self.stt_ready_ms: float | None = None
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.messages = defaultdict(int)
+        self.final_to_first_chunk: list[float] = []
+        self.final_to_last_chunk: list[float] = []
+        self.error: str | None = None
+
+
+async def run_client(http: aiohttp.ClientSession, url: str, frames: list[bytes], frame_ms: float, stop_at: float) -> ClientResult:
+    result = ClientResult()
+    started = time.perf_counter()
+    try:
+        ws = await http.ws_connect(url, heartbeat=None, max_msg_size=0)
+    except Exception as e:
+        result.error = f"connect: {e}"
+        return result
+    result.connected = True
+    result.connect_ms = (time.perf_counter() - started) * 1000
+    finals: dict[str, float] = {} # response_id -> perf_counter() of its final transcript
+    last_chunk: dict[str, float] = {}
+
+    async def send_audio():
+        # Loop the recording, re-sending the header slice first like a fresh MediaRecorder
+        index = 0
+        next_send = time.perf_counter()
+        while time.perf_counter() < stop_at and not ws.closed:
+            frame = frames[index % len(frames)]
+            await ws.send_bytes(frame)
+            result.frames_sent += 1
+            result.bytes_sent += len(frame)
+            index += 1
+            next_send += frame_ms / 1000
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    sender = asyncio.create_task(send_audio())
+    try:
+        while True:
+            timeout = stop_at - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                msg = await ws.receive(timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            now = time.perf_counter()
+            message = json.loads(msg.data)
+            kind = message.get("type")
+            result.messages[kind] += 1
+            response_id = message.get("response_id")
+            if kind == "info" and result.stt_ready_ms is None:
+                result.stt_ready_ms = (now - started) * 1000
+            elif kind == "transcript" and message.get("is_final") and response_id:
+                finals[response_id] = now
+            elif kind == "llm_response" and response_id in finals:
+                if response_id not in last_chunk:
+                    result.final_to_first_chunk.append((now - finals[response_id]) * 1000)
+                last_chunk[response_id] = now
+    except Exception as e:
+        result.error = f"receive: {e}"
+    finally:
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        await ws.close()
+    for response_id, at in last_chunk.items():
+        result.final_to_last_chunk.append((at - finals[response_id]) * 1000)
+    return result
+
+
+class ProcessSampler:
+    """CPU seconds and RSS of a process tree, read from /proc (Linux only)."""
+
+    def __init__(self, root_pid: int):
+        self.root_pid = root_pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.peak_rss = 0
+
+    def _tree(self) -> list[int]:
+        children = defaultdict(list)
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as f:
+                        ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+                children[ppid].append(int(entry))
+        pids, stack = [], [self.root_pid]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            stack.extend(children.get(pid, []))
+        return pids
+
+    def sample(self) -> tuple[float, int]:
+        cpu, rss = 0.0, 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / self.ticks # utime + stime
+                with open(f"/proc/{pid}/statm") as f:
+                    rss += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            except (OSError, IndexError, ValueError):
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+        return cpu, rss
+
+
+def parse_stage_histograms(text: str) -> dict:
+    """p50/p95 upper bounds per stage from voicebot_stage_latency_ms_bucket lines."""
+    buckets = defaultdict(list)
+    for line in text.splitlines():
+        if not line.startswith("voicebot_stage_latency_ms_bucket{"):
+            continue
+        labels, value = line.rsplit(" ", 1)
+        parts = dict(item.split("=", 1) for item in labels[labels.index("{") + 1:-1].split(","))
+        buckets[parts["stage"].strip('"')].append((float(parts["le"].strip('"')), float(value)))
+    stages = {}
+    for stage, points in buckets.items():
+        points.sort()
+        total = points[-1][1]
+        if not total:
+            continue
+        stages[stage] = {"count": int(total)}
+        for name, q in (("p50", 0.5), ("p95", 0.95)):
+            stages[stage][name] = next(le for le, count in points if count >= q * total)
+    return stages
+
+
+async def wait_for_http(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(url) as resp:
+                    if resp.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn_app(args) -> subprocess.Popen:
+    fake = f"http://127.0.0.1:{args.fakes_port}"
+    env = dict(os.environ)
+    env.update({
+        "DEEPGRAM_URL": fake,
+        "DEEPGRAM_API_KEY": "fake",
+        "NIFI_URL": f"{fake}/nifi",
+        "AZURE_OPENAI_ENDPOINT": fake,
+        "AZURE_OPENAI_API_KEY": "fake",
+        "AZURE_OPENAI_DEPLOYMENT": "fake",
+        "AZURE_OPENAI_API_VERSION": "2024-02-01",
+        "LOG_CONSOLE": "false",
+    })
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=backend_dir, env=env,
+        stdout=subprocess.DEVNULL, # Console logging is off (LOG_CONSOLE); this keeps stray library output out of the report
+    )
+
+
+async def main(args):
+    fakes_runner = None
+    server = None
+    if args.spawn:
+        fakes_runner = await start_fakes("127.0.0.1", args.fakes_port, config_from_args(args))
+        server = spawn_app(args)
+        args.url = f"ws://127.0.0.1:{args.port}/ws/voice"
+    http_base = args.url.replace("ws://", "http://").replace("wss://", "https://").rsplit("/ws/", 1)[0]
+    try:
+        await wait_for_http(f"{http_base}/metrics")
+        sampler = ProcessSampler(server.pid) if server is not None else None
+        baseline = sampler.sample() if sampler else None
+
+        frames = load_frames(args.audio, args.frame_bytes)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as http:
+            started = time.perf_counter()
+            stop_at = started + args.ramp + args.duration
+            tasks = []
+            for i in range(args.clients):
+                tasks.append(asyncio.create_task(run_client(http, args.url, frames, args.frame_ms, stop_at)))
+                if args.ramp:
+                    await asyncio.sleep(args.ramp / args.clients)
+            mid_sample = None
+            while not all(task.done() for task in tasks):
+                await asyncio.sleep(1)
+                if sampler:
+                    mid_sample = sampler.sample()
+            results = [task.result() for task in tasks]
+            elapsed = time.perf_counter() - started
+            final_sample = sampler.sample() if sampler else None
+            async with http.get(f"{http_base}/metrics") as resp:
+                metrics_text = await resp.text()
+    finally:
+        if server is not None:
+            server.terminate()
+            # Wait off the loop: the fakes run on it and must answer the app's close handshakes
+            try:
+                await asyncio.to_thread(server.wait, 15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if fakes_runner is not None:
+            await fakes_runner.cleanup()
+
+    connected = [r for r in results if r.connected]
+    messages = defaultdict(int)
+    for r in results:
+        for kind, count in r.messages.items():
+            messages[kind] += count
+    turns = sum(len(r.final_to_first_chunk) for r in results)
+    report = {
+        "clients": args.clients,
+        "workers": args.workers if args.spawn else None,
+        "connected": len(connected),
+        "errors": [r.error for r in results if r.error][:10],
+        "elapsed_s": round(elapsed, 2),
+        "connect_ms": summarize([r.connect_ms for r in connected]),
+        "stt_ready_ms": summarize([r.stt_ready_ms for r in connected if r.stt_ready_ms is not None]),
+        "final_to_first_chunk_ms": summarize([v for r in results for v in r.final_to_first_chunk]),
+        "final_to_last_chunk_ms": summarize([v for r in results for v in r.final_to_last_chunk]),
+        "throughput": {
+            "turns_per_s": round(turns / elapsed, 2),
+            "audio_frames_per_s": round(sum(r.frames_sent for r in results) / elapsed, 1),
+            "audio_kbps": round(sum(r.bytes_sent for r in results) * 8 / 1000 / elapsed, 1),
+        },
+        "messages": dict(messages),
+        "server_stages_ms": parse_stage_histograms(metrics_text),
+    }
+    if fakes_runner is not None:
+        report["fakes"] = dict(fake_stats)
+    if sampler and final_sample and connected:
+        cpu_seconds = final_sample[0] - baseline[0]
+        loaded_rss = (mid_sample or final_sample)[1]
+        report["server_resources"] = {
+            "cpu_percent_total": round(cpu_seconds / elapsed * 100, 1),
+            "cpu_ms_per_session_second": round(cpu_seconds * 1000 / (len(connected) * args.duration), 3),
+            "rss_baseline_mb": round(baseline[1] / 2**20, 1),
+            "rss_peak_mb": round(sampler.peak_rss / 2**20, 1),
+            "rss_per_session_kb": round((loaded_rss - baseline[1]) / 1024 / len(connected), 1),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for /ws/voice")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/voice")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds every client stays connected after ramp-up")
+    parser.add_argument("--ramp", type=float, default=5, help="Seconds over which clients connect")
+    parser.add_argument("--audio", help="Recorded WebM/Opus file to stream (defaults to synthetic frames)")
+    parser.add_argument("--frame-ms", type=float, default=100)
+    parser.add_argument("--frame-bytes", type=int, default=400, help="~32 kbit/s Opus at 100 ms slices")
+    parser.add_argument("--spawn", action="store_true", help="Start the fakes and the app locally")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--fakes-port", type=int, default=9100)
+    add_config_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,277 @@
+"""
+Replays a session recorded with SESSION_RECORDING_ENABLED=true through SessionManager, with
+Deepgram, NiFi and the LLM stubbed from the recording, and reports per-stage latency.
+
+Audio and control frames are fed in at their recorded offsets and go through the usual audio
+queue to a null STT connection; the recorded Deepgram callbacks drive DeepgramService, so
+endpointing, speculation and the state machine run exactly as in this build. NiFi results and
+LLM tokens come back after the delays they took live, matched to each call by transcript and
+by the prompt's last user message. Run from backend/:
+    python -m loadtest.replay app/recordings/20250101T120000Z-1a2b3c4d.rec --output new.json
+    python -m loadtest.replay app/recordings/20250101T120000Z-1a2b3c4d.rec --baseline new.json
+
+--speed divides every recorded delay. Timers inside the app (endpointing grace, speculation
+stability, segmenter flush) are not scaled, so compare builds at --speed 1 and use faster
+replays as a quick check that a recording still plays through.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+from collections import defaultdict, deque
+import aiohttp
+
+# Module-level config is read on import, so the environment has to be in place first.
+# Upstreams are stubbed; these only satisfy the services' config checks
+os.environ.update({
+    "AZURE_OPENAI_ENDPOINT": "http://replay.invalid",
+    "AZURE_OPENAI_API_KEY": "replay",
+    "AZURE_OPENAI_DEPLOYMENT": "replay",
+    "AZURE_OPENAI_API_VERSION": "2024-02-01",
+    "DEEPGRAM_API_KEY": "replay",
+    "DEEPGRAM_POOL_ENABLED": "false",
+    "SESSION_RECORDING_ENABLED": "false",
+    "LOG_CONSOLE": "false",
+})
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# A cache hit would skip the recorded upstream calls; keep every turn on the path it took live
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+
+from .loadgen import summarize # noqa: E402
+
+
+class ReplayWebSocket:
+    """Stands in for the browser: keeps every frame with the time it was handed to the socket."""
+
+    def __init__(self):
+        self.frames: list[tuple[float, dict]] = []
+
+    async def send_text(self, data: str):
+        self.frames.append((time.perf_counter(), json.loads(data)))
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        pass
+
+
+class NullSTTConnection:
+    """Accepts the audio a live Deepgram connection would get; transcripts come from the recording."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    async def send(self, data: bytes):
+        self.bytes += len(data)
+
+    async def finish(self):
+        pass
+
+
+class RecordedCalls:
+    """Upstream calls of one kind from a recording, handed out by key in the order they were made."""
+
+    def __init__(self):
+        self.by_call: dict[int, dict] = {}
+        self._by_key: dict[str, deque] = defaultdict(deque)
+        self.matched = 0
+        self.unmatched = 0
+
+    def start(self, call: int, key: str, t_ns: int):
+        entry = self.by_call[call] = {"key": key, "start": t_ns, "end": None, "tokens": [], "outcome": {"cancelled": True}}
+        self._by_key[key].append(entry)
+
+    def take(self, key: str) -> dict | None:
+        queue = self._by_key.get(key)
+        if not queue:
+            self.unmatched += 1
+            return None
+        self.matched += 1
+        return queue.popleft()
+
+
+class ReplayNiFi:
+    def __init__(self, calls: RecordedCalls, speed: float):
+        self.calls = calls
+        self.speed = speed
+
+    async def fetch_messages(self, transcript: str) -> dict:
+        entry = self.calls.take(transcript)
+        if entry is None:
+            raise aiohttp.ClientError(f"No recorded NiFi call for {transcript!r}")
+        end = entry["end"] if entry["end"] is not None else entry["start"]
+        await asyncio.sleep((end - entry["start"]) / 1e9 / self.speed)
+        if "result" not in entry["outcome"]:
+            raise aiohttp.ClientError(f"Recorded NiFi call did not return: {entry['outcome']}")
+        return entry["outcome"]["result"]
+
+
+class ReplayLLM:
+    def __init__(self, calls: RecordedCalls, speed: float):
+        self.calls = calls
+        self.speed = speed
+
+    async def get_response_stream(self, messages: list[dict], metadata: dict | None = None):
+        from app.services.recording import llm_key
+        entry = self.calls.take(llm_key(messages))
+        if entry is None:
+            raise aiohttp.ClientError("No recorded LLM call for this prompt")
+        started = time.perf_counter()
+        for t_ns, text in entry["tokens"]:
+            delay = started + (t_ns - entry["start"]) / 1e9 / self.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield text
+        if "metadata" in entry["outcome"]:
+            if metadata is not None:
+                metadata.update(entry["outcome"]["metadata"])
+        elif "error" in entry["outcome"]:
+            raise aiohttp.ClientError(f"Recorded LLM call failed: {entry['outcome']['error']}")
+
+
+def load(path: str):
+    """Split a recording into the client/STT timeline and the recorded upstream calls."""
+    from app.services import recording as rec
+    timeline = []
+    nifi, llm = RecordedCalls(), RecordedCalls()
+    counts: dict[str, int] = defaultdict(int)
+    for kind, t_ns, payload in rec.read_recording(path):
+        counts[rec.KIND_NAMES.get(kind, str(kind))] += 1
+        if kind in (rec.AUDIO, rec.CONTROL, rec.STT):
+            timeline.append((kind, t_ns, payload))
+        elif kind == rec.NIFI_START:
+            nifi.start(payload["call"], payload["transcript"], t_ns)
+        elif kind == rec.LLM_START:
+            llm.start(payload["call"], payload["key"], t_ns)
+        elif kind == rec.LLM_TOKEN:
+            call, text = payload
+            if call in llm.by_call:
+                llm.by_call[call]["tokens"].append((t_ns, text))
+        elif kind in (rec.NIFI_END, rec.LLM_END):
+            calls = nifi if kind == rec.NIFI_END else llm
+            entry = calls.by_call.get(payload.pop("call", None))
+            if entry is not None:
+                entry["end"] = t_ns
+                entry["outcome"] = payload
+    return timeline, nifi, llm, dict(counts)
+
+
+def transcript_result(payload: dict):
+    # Just enough of a LiveTranscriptionResponse for DeepgramService._on_message
+    alternative = SimpleNamespace(transcript=payload["transcript"])
+    return SimpleNamespace(channel=SimpleNamespace(alternatives=[alternative]), is_final=payload["is_final"],
+                           speech_final=payload["speech_final"])
+
+
+async def replay(args) -> dict:
+    from app.main import SessionManager
+    from app.state_machine import VoiceBotState
+    from app.services import recording as rec
+    from app.services.deepgram_service import DeepgramService
+    from app.services.audio_queue import AudioSendQueue
+    from app.services.tracing import stage_latency, turns_total, SPANS
+
+    timeline, nifi_calls, llm_calls, counts = load(args.recording)
+
+    # Keep every span, not just the bucket counts, so percentiles are exact
+    spans: dict[str, list[float]] = defaultdict(list)
+    observe = stage_latency.observe
+
+    def keep_span(value: float, label_value: str = ""):
+        spans[label_value].append(value)
+        observe(value, label_value)
+
+    stage_latency.observe = keep_span
+
+    websocket = ReplayWebSocket()
+    session = SessionManager(client_websocket=websocket)
+    session.nifi_service = ReplayNiFi(nifi_calls, args.speed)
+    session.llm_service = ReplayLLM(llm_calls, args.speed)
+    session.deepgram_service = stt = DeepgramService(session_manager=session)
+    stt.set_state_setter(session.set_state)
+    stt.dg_connection = null_connection = NullSTTConnection()
+    session.audio_queue = AudioSendQueue(stt.send_audio)
+    session.audio_queue.start()
+    session.outbound.start()
+    session.events.start()
+    started = time.perf_counter()
+    try:
+        for kind, t_ns, payload in timeline:
+            delay = started + t_ns / 1e9 / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if kind == rec.AUDIO:
+                await session.audio_queue.put(payload)
+            elif kind == rec.CONTROL:
+                if payload == "REQUEST_IDLE_STATE":
+                    await session.set_state(VoiceBotState.IDLE)
+            elif payload["event"] == "transcript":
+                await stt._on_message(None, transcript_result(payload))
+            elif payload["event"] == "utterance_end":
+                await stt._on_utterance_end(None)
+            elif payload["event"] == "speech_started":
+                await stt._on_speech_started(None)
+        # Let the last answer finish streaming
+        settle_by = time.perf_counter() + args.settle
+        while (session.curr_response_id is not None or session.events.queued("interruption_ended")) and time.perf_counter() < settle_by:
+            await asyncio.sleep(0.01)
+    finally:
+        await session.audio_queue.close()
+        await session.events.close()
+        session.cancel_speculation()
+        await session.turn_tasks.cancel()
+        await stt.close_connection()
+        await session.outbound.close()
+        if session.trace is not None:
+            session.trace.finish("aborted")
+        stage_latency.observe = observe
+
+    return {
+        "recording": args.recording,
+        "speed": args.speed,
+        "elapsed_s": round(time.perf_counter() - started, 2),
+        "records": counts,
+        "turns": dict(turns_total),
+        "frames_sent": len(websocket.frames),
+        "audio_bytes": null_connection.bytes,
+        "nifi_calls": {"matched": nifi_calls.matched, "unmatched": nifi_calls.unmatched},
+        "llm_calls": {"matched": llm_calls.matched, "unmatched": llm_calls.unmatched},
+        "stage_latency_ms": {stage: summarize(spans[stage]) for stage in SPANS if spans.get(stage)},
+    }
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """p50/p90 change per stage, in ms, against an earlier report of the same recording."""
+    deltas = {}
+    for stage, current in report["stage_latency_ms"].items():
+        previous = baseline.get("stage_latency_ms", {}).get(stage)
+        if previous is None:
+            continue
+        deltas[stage] = {q: round(current[q] - previous[q], 1) for q in ("p50", "p90")
+                         if current.get(q) is not None and previous.get(q) is not None}
+    return deltas
+
+
+def main(args):
+    report = asyncio.run(replay(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("speed") != report["speed"]:
+            print(f"warning: baseline was replayed at --speed {baseline.get('speed')}", file=sys.stderr)
+        report["delta_vs_baseline_ms"] = compare(report, baseline)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded session and report per-stage latency")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay this many times faster than real time")
+    parser.add_argument("--settle", type=float, default=10.0, help="Seconds to wait for the last answer after the final record")
+    parser.add_argument("--output", help="Also write the report to this file")
+    parser.add_argument("--baseline", help="Report from an earlier build to compare p50/p90 against")
+    main(parser.parse_args())
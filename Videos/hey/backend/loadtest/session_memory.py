@@ -0,0 +1,108 @@
+"""
+Memory held by one SessionManager over a long call.
+
+Drives a single session through --turns simulated turns against the in-process fakes (every
+--barge-in-every'th turn is interrupted mid-answer) and reports the bytes retained after
+10, 100, ... turns, measured with tracemalloc after a full GC. A flat curve means no per-turn
+state leaks. Run from backend/:
+    python -m loadtest.session_memory --turns 1000
+"""
+import os
+import gc
+import json
+import asyncio
+import argparse
+import tracemalloc
+
+FAKES_PORT = 9190
+
+# Module-level config is read on import, so the environment has to be in place first
+os.environ.update({
+    "NIFI_URL": f"http://127.0.0.1:{FAKES_PORT}/nifi",
+    "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{FAKES_PORT}",
+    "AZURE_OPENAI_API_KEY": "fake",
+    "AZURE_OPENAI_DEPLOYMENT": "fake",
+    "AZURE_OPENAI_API_VERSION": "2024-02-01",
+    "DEEPGRAM_API_KEY": "fake",
+    "DEEPGRAM_POOL_ENABLED": "false",
+    "RESPONSE_CACHE_ENABLED": "false", # Process-wide, not per session; keep every turn on the full path
+    "LOG_CONSOLE": "false",
+    "LOG_LEVEL": "WARNING",
+})
+
+from .fakes import FakeConfig, start_fakes # noqa: E402
+
+
+class NullWebSocket:
+    """Accepts and discards every frame, counting what it was sent."""
+
+    def __init__(self):
+        self.frames = 0
+
+    async def send_text(self, data: str):
+        self.frames += 1
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        pass
+
+
+async def run_turn(session, Event, EventType, index: int, barge_in: bool):
+    session.handle_event(Event(type=EventType.INTERRUPTION_STARTED, data={}))
+    session.handle_event(Event(type=EventType.INTERRUPTION_ENDED,
+                               data={"transcript": f"question number {index % 50}", "is_final": True}))
+    while session.events.queued(EventType.INTERRUPTION_ENDED):
+        await asyncio.sleep(0.001)
+    if barge_in:
+        while session.trace is not None and not session.trace.has("first_chunk_sent"):
+            await asyncio.sleep(0.001)
+        return # The next turn's INTERRUPTION_STARTED halts this one
+    while session.curr_response_id is not None:
+        await asyncio.sleep(0.001)
+
+
+def retained_bytes() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def main(args):
+    fakes = await start_fakes("127.0.0.1", FAKES_PORT, FakeConfig(nifi_ms=0, llm_first_token_ms=0, tokens_per_second=5000))
+    from app.main import SessionManager
+    from app.types import Event, EventType
+    from app.services.http_client import http_clients
+
+    await http_clients.start()
+    session = None
+    try:
+        tracemalloc.start()
+        baseline = retained_bytes()
+        websocket = NullWebSocket()
+        session = SessionManager(client_websocket=websocket)
+        session.outbound.start()
+        session.events.start()
+        report = {"turns": args.turns, "barge_in_every": args.barge_in_every, "bytes_per_session": {}}
+        checkpoints = {n for n in (1, 10, 100, 1000, 10000) if n <= args.turns} | {args.turns}
+        for index in range(1, args.turns + 1):
+            await run_turn(session, Event, EventType, index, barge_in=args.barge_in_every and index % args.barge_in_every == 0)
+            if index in checkpoints:
+                await asyncio.sleep(0.05) # Let the outbound writer drain
+                report["bytes_per_session"][index] = retained_bytes() - baseline
+        report["frames_sent"] = websocket.frames
+        report["halted_ids_kept"] = len(session.halted_ids)
+        report["history_exchanges_kept"] = len(session.memory) if session.memory is not None else None
+        tracemalloc.stop()
+        print(json.dumps(report, indent=2))
+    finally:
+        if session is not None:
+            await session.events.close()
+            await session.turn_tasks.cancel()
+            await session.outbound.close()
+        await http_clients.close()
+        await fakes.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bytes retained by one session after many simulated turns")
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--barge-in-every", type=int, default=3, help="Interrupt every Nth answer (0 = never)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("nifi", failure_threshold=3, reset_timeout=10, clock=clock)
+
+
+def fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        breaker.check()
+        breaker.record_failure()
+
+
+def test_stays_closed_below_the_threshold(breaker):
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+    breaker.check()
+
+
+def test_success_resets_the_consecutive_failure_count(breaker):
+    fail(breaker, 2)
+    breaker.record_success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+    assert breaker.get_stats()["consecutive_failures"] == 2
+
+
+def test_opens_at_the_threshold_and_fails_fast(breaker, clock):
+    fail(breaker, 3)
+    assert breaker.state == OPEN
+    clock.now += 4
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.check()
+    assert excinfo.value.retry_in == pytest.approx(6)
+    assert breaker.get_stats() == {"opened": 1, "short_circuited": 1, "state": 2, "consecutive_failures": 3}
+
+
+def test_half_open_after_reset_timeout_lets_one_probe_through(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10
+    assert breaker.state == HALF_OPEN
+    breaker.check() # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.check() # Everyone else waits for the probe's outcome
+
+
+def test_successful_probe_closes_the_circuit(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.check()
+    breaker.check()
+
+
+def test_failed_probe_reopens_for_another_reset_timeout(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.get_stats()["opened"] == 2
+    clock.now += 9.9
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    clock.now += 0.1
+    assert breaker.state == HALF_OPEN
+
+
+def test_abandoned_probe_lets_the_next_call_probe(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10
+    breaker.check()
+    breaker.abandon() # e.g. cancelled by a barge-in
+    assert breaker.state == HALF_OPEN
+    breaker.check()
@@ -0,0 +1,77 @@
+from app.services.conversation import ConversationMemory, estimate_tokens, message_tokens, MESSAGE_OVERHEAD_TOKENS
+
+SYSTEM = {"role": "system", "content": "You answer questions about the clinic."}
+CONTEXT = {"role": "system", "content": "Opening hours: 9 to 5."}
+QUESTION = {"role": "user", "content": "When are you open?"}
+
+
+def exchange_tokens(user_text: str, assistant_text: str) -> int:
+    return estimate_tokens(user_text) + estimate_tokens(assistant_text) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def test_history_goes_between_leading_system_messages_and_the_question():
+    memory = ConversationMemory(token_budget=10_000)
+    memory.add_exchange("Hi", "Hello!")
+    nifi = [SYSTEM, CONTEXT, QUESTION]
+    assert memory.build_messages(nifi) == [
+        SYSTEM, CONTEXT,
+        {"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"},
+        QUESTION,
+    ]
+
+
+def test_without_history_the_prompt_is_nifis_messages():
+    assert ConversationMemory().build_messages([SYSTEM, QUESTION]) == [SYSTEM, QUESTION]
+
+
+def test_interrupted_answer_is_marked_and_empty_exchanges_are_ignored():
+    memory = ConversationMemory(token_budget=10_000)
+    memory.add_exchange("Tell me a story", "Once upon a time", interrupted=True)
+    memory.add_exchange("", "ignored")
+    memory.add_exchange("ignored", "")
+    assert len(memory) == 1
+    assert memory.build_messages([QUESTION])[1] == {"role": "assistant", "content": "Once upon a time ..."}
+
+
+def test_history_within_budget_is_kept_whole():
+    memory = ConversationMemory(token_budget=10_000)
+    for i in range(5):
+        memory.add_exchange(f"question {i}", f"answer {i}")
+    assert len(memory.build_messages([SYSTEM, QUESTION])) == 2 + 5 * 2
+    assert len(memory) == 5
+
+
+def test_over_budget_history_is_trimmed_oldest_first_down_to_the_target():
+    nifi = [SYSTEM, QUESTION]
+    nifi_tokens = sum(message_tokens(m) for m in nifi)
+    questions = [f"question {i:02d} " + "q" * 28 for i in range(11)] # 40 characters each
+    per_exchange = exchange_tokens(questions[0], "a" * 40)
+    memory = ConversationMemory(token_budget=nifi_tokens + 10 * per_exchange, trim_target=0.5)
+    for question in questions:
+        memory.add_exchange(question, "a" * 40)
+
+    messages = memory.build_messages(nifi)
+
+    # 11 exchanges overflow a 10-exchange allowance; trimming goes down to half of it, not just under it
+    assert len(memory) == 5
+    assert memory.history_tokens == 5 * per_exchange
+    assert [m["content"] for m in messages if m["role"] == "user"][:-1] == questions[6:]
+    assert messages[0] == SYSTEM and messages[-1] == QUESTION
+    assert nifi_tokens + memory.history_tokens <= memory.token_budget
+
+
+def test_prompt_prefix_is_stable_between_trims():
+    memory = ConversationMemory(token_budget=1_000, trim_target=0.5)
+    memory.add_exchange("first", "one")
+    before = memory.build_messages([SYSTEM, QUESTION])
+    memory.add_exchange("second", "two")
+    after = memory.build_messages([SYSTEM, QUESTION])
+    assert after[:len(before) - 1] == before[:-1]
+
+
+def test_nifi_messages_alone_over_budget_drop_all_history():
+    memory = ConversationMemory(token_budget=10)
+    memory.add_exchange("Hi", "Hello!")
+    big = {"role": "user", "content": "x" * 400}
+    assert memory.build_messages([SYSTEM, big]) == [SYSTEM, big]
+    assert len(memory) == 0 and memory.history_tokens == 0
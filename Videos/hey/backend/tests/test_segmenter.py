@@ -0,0 +1,123 @@
+import re
+
+import pytest
+
+from app.services.segmenter import Segmenter, SentenceSegmenter, PunctuationSegmenter, create_segmenter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def tokens(text: str) -> list[str]:
+    # Roughly how the LLM streams: each token is a word with its leading space
+    return re.findall(r"\s*\S+", text)
+
+
+def segment(segmenter, pieces) -> list[str]:
+    chunks = []
+    for piece in pieces:
+        chunks.extend(segmenter.feed(piece))
+    tail = segmenter.flush()
+    return chunks + ([tail] if tail else [])
+
+
+def eager(**kwargs) -> SentenceSegmenter:
+    """Cuts at every sentence end, so boundaries can be asserted one by one."""
+    options = {"first_min_chars": 0, "min_chars": 0, "timeout_ms": 0}
+    options.update(kwargs)
+    return SentenceSegmenter(**options)
+
+
+def test_sentences_are_split_at_terminators_followed_by_space():
+    assert segment(eager(first_min_chars=100), tokens("See you then. Bye now! Are you sure?")) == [
+        "See you then.", "Bye now!", "Are you sure?",
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    "Dr. Smith will call you back today.",
+    "Bring documents, e.g. a passport or a licence.",
+    "Bring documents, i.e. your passport.",
+    "We open at 9 a.m. every weekday.",
+    "J. Smith handles the booking.",
+])
+def test_abbreviations_and_initials_do_not_end_a_sentence(text):
+    assert segment(eager(first_min_chars=100), tokens(text)) == [text]
+
+
+@pytest.mark.parametrize("pieces", [
+    tokens("The fee is 3.5 dollars. Thanks."),
+    list("The fee is 3.5 dollars. Thanks."), # One character per token
+    ["The fee is 3", ".", "5 dollars", ". Thanks", "."],
+])
+def test_decimals_do_not_end_a_sentence_however_the_stream_is_split(pieces):
+    assert segment(eager(first_min_chars=100), pieces) == ["The fee is 3.5 dollars.", "Thanks."]
+
+
+def test_closing_quote_stays_with_its_sentence():
+    assert segment(eager(first_min_chars=100), tokens('He said "stop." Then he left.')) == ['He said "stop."', "Then he left."]
+
+
+def test_first_chunk_is_cut_early_at_a_clause_boundary():
+    chunks = segment(eager(first_min_chars=10), tokens("Sure thing, our hours are nine to five, on weekdays only."))
+    assert chunks == ["Sure thing,", "our hours are nine to five, on weekdays only."]
+
+
+def test_first_clause_shorter_than_first_min_chars_is_not_cut():
+    chunks = segment(eager(first_min_chars=20), tokens("Sure, our hours are nine to five. Thanks."))
+    assert chunks == ["Sure, our hours are nine to five.", "Thanks."]
+
+
+def test_later_sentences_are_grouped_up_to_min_chars():
+    chunks = segment(eager(first_min_chars=100, min_chars=10), tokens("One. Two. Three is here. Four."))
+    assert chunks == ["One.", "Two. Three is here.", "Four."]
+
+
+def test_long_text_without_punctuation_is_cut_on_word_boundaries():
+    chunks = segment(eager(first_max_chars=20, max_chars=40), tokens("word " * 30))
+    assert chunks[0] == "word word word word"
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert " ".join(chunks).split() == ["word"] * 30
+
+
+def test_poll_flushes_text_that_waited_past_the_timeout():
+    clock = FakeClock()
+    segmenter = SentenceSegmenter(first_min_chars=100, min_chars=100, timeout_ms=500, clock=clock)
+    assert segmenter.feed("Let me check that for you") == []
+    assert segmenter.time_until_flush() == pytest.approx(0.5)
+    clock.now = 0.4
+    assert segmenter.poll() is None
+    clock.now = 0.5
+    assert segmenter.poll() == "Let me check that for"
+    assert segmenter.flush() == "you"
+    assert segmenter.time_until_flush() is None
+
+
+def test_flush_returns_none_when_nothing_is_left():
+    segmenter = eager()
+    assert segmenter.feed("Done. ") == ["Done."]
+    assert segmenter.flush() is None
+
+
+def test_punctuation_segmenter_flushes_the_whole_buffer():
+    assert segment(PunctuationSegmenter(), tokens("Dr. Smith is in. Bye")) == ["Dr.", " Smith is in.", " Bye"]
+
+
+def test_create_segmenter_rejects_unknown_names():
+    assert isinstance(create_segmenter("sentence"), SentenceSegmenter)
+    with pytest.raises(ValueError):
+        create_segmenter("nope")
+
+
+def test_segmenter_missing_a_method_fails_at_construction():
+    class FeedOnly(Segmenter):
+        def feed(self, token: str) -> list[str]:
+            return [token]
+
+    with pytest.raises(TypeError):
+        FeedOnly()
@@ -0,0 +1,75 @@
+import os
+import asyncio
+
+os.environ.setdefault("LOG_CONSOLE", "false")
+
+import app.main as main # noqa: E402
+from app.main import SessionManager # noqa: E402
+from app.state_machine import VoiceBotState # noqa: E402
+from app.services.tracing import TurnTrace # noqa: E402
+
+
+class NullWebSocket:
+    async def send_text(self, data: str):
+        pass
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        pass
+
+
+class BargeInNiFi:
+    """Answers once `release` is set, cancelling `turn` in the same loop iteration (a barge-in racing the result)."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.turn: asyncio.Task | None = None
+
+    async def fetch_messages(self, transcript: str) -> dict:
+        self.started.set()
+        await self.release.wait()
+        asyncio.get_running_loop().call_soon(self.turn.cancel)
+        return {"messages": [{"role": "user", "content": transcript}]}
+
+
+class EndlessLLM:
+    async def get_response_stream(self, messages, metadata=None):
+        while True:
+            await asyncio.sleep(0.01)
+            yield "token "
+
+
+def test_turn_cancelled_mid_nifi_leaves_no_speculative_task_running(monkeypatch):
+    monkeypatch.setattr(main, "SPECULATION_PREFETCH_LLM", True)
+    monkeypatch.setattr(main, "RESPONSE_CACHE_ENABLED", False)
+
+    async def scenario():
+        session = SessionManager(client_websocket=NullWebSocket())
+        session.nifi_service = nifi = BargeInNiFi()
+        session.llm_service = EndlessLLM()
+        session.current_state = VoiceBotState.LISTENING
+        session.start_speculation("what are your opening hours")
+        speculation = session.speculation
+        assert speculation is not None and speculation.has_llm_stream
+
+        session.current_state = VoiceBotState.RESPONDING
+        session.curr_response_id = "turn-1"
+        session.trace = TurnTrace("turn-1")
+        turn = asyncio.create_task(session.respond({"transcript": "What are your opening hours?"}))
+        nifi.turn = turn
+        await asyncio.wait_for(nifi.started.wait(), 1)
+        await asyncio.sleep(0) # The turn is now awaiting the speculation's NiFi result
+        assert session.speculation is None # Committed to the turn
+
+        nifi.release.set()
+        await asyncio.gather(turn, return_exceptions=True)
+        assert turn.cancelled()
+        await asyncio.sleep(0.05) # Long enough for an orphaned prefetch to stream tokens
+
+        assert speculation._nifi_task.done()
+        assert speculation._llm_task.done()
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        assert pending == []
+        await session.outbound.close()
+
+    asyncio.run(scenario())
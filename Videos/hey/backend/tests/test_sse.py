@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from app.services.sse import SSEParser
+
+
+def event(content: str) -> bytes:
+    delta = {"choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+    return f"data: {json.dumps(delta, ensure_ascii=False)}\n\n".encode()
+
+
+def feed_all(parser: SSEParser, chunks) -> list[str]:
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events + parser.flush()
+
+
+def deltas(events: list[str]) -> list[str]:
+    return [json.loads(data)["choices"][0]["delta"]["content"] for data in events if data != "[DONE]"]
+
+
+BODY = event("Hello") + event(" wörld") + event(" ✓ ok") + b"data: [DONE]\n\n"
+
+
+def test_whole_body_in_one_chunk():
+    events = feed_all(SSEParser(), [BODY])
+    assert deltas(events) == ["Hello", " wörld", " ✓ ok"]
+    assert events[-1] == "[DONE]"
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64])
+def test_chunks_split_anywhere_give_the_same_events(size):
+    # Splits land inside "data:", inside JSON and inside multi-byte UTF-8 sequences
+    chunks = [BODY[i:i + size] for i in range(0, len(BODY), size)]
+    assert feed_all(SSEParser(), chunks) == feed_all(SSEParser(), [BODY])
+
+
+def test_utf8_sequence_split_across_chunks():
+    body = event("ü")
+    split = body.index("ü".encode()) + 1 # Between the two bytes of ü
+    parser = SSEParser()
+    assert parser.feed(body[:split]) == []
+    assert deltas(parser.feed(body[split:])) == ["ü"]
+
+
+def test_data_prefix_split_across_chunks():
+    parser = SSEParser()
+    assert parser.feed(b"da") == []
+    assert parser.feed(b"ta: [DO") == []
+    assert parser.feed(b"NE]\n") == []
+    assert parser.feed(b"\n") == ["[DONE]"]
+
+
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n", b"\r"])
+def test_line_endings(newline):
+    body = b"data: one" + newline + newline + b"data: two" + newline + newline
+    assert feed_all(SSEParser(), [body]) == ["one", "two"]
+
+
+def test_crlf_split_between_cr_and_lf():
+    parser = SSEParser()
+    assert parser.feed(b"data: one\r") == []
+    assert parser.feed(b"\n\r") == []
+    assert parser.feed(b"\n") == ["one"]
+
+
+def test_multi_line_data_is_joined_with_newlines():
+    assert feed_all(SSEParser(), [b"data: first\ndata:second\ndata:  third\n\n"]) == ["first\nsecond\n third"]
+
+
+def test_comments_and_other_fields_are_skipped():
+    body = b": keep-alive\n\nevent: message\nid: 7\nretry: 1000\ndata: x\n\n"
+    assert feed_all(SSEParser(), [body]) == ["x"]
+
+
+def test_blank_lines_without_data_dispatch_nothing():
+    assert feed_all(SSEParser(), [b"\n\n\n"]) == []
+
+
+def test_flush_dispatches_an_event_left_open_at_end_of_stream():
+    parser = SSEParser()
+    assert parser.feed(b"data: [DONE]") == []
+    assert parser.flush() == ["[DONE]"]
+    assert parser.flush() == []